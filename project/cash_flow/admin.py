@@ -1,9 +1,6 @@
 from django.contrib import admin
 from django import forms
-from .models import PropertyCashFlow, RentPayment, UserCashFlow, TenantBilling,PropertyPayments, PropertyBilling
-from django.utils.translation import gettext_lazy as _
-from django.utils import timezone
-from roomie_property.models import Property
+from .models import RentPayment, UserCashFlow, TenantBilling,PropertyPayments, PropertyBilling
 
 class RentPaymentForm(forms.ModelForm):
     class Meta:
@@ -77,42 +74,9 @@ class RentPaymentAdmin(admin.ModelAdmin):
         if not obj.amount:
             obj.amount = obj.property.rent_amount  # Use rent_amount from the property if not provided
 
-        # Call the save method to create the RentPayment and split the rent
+        # Call the save method to create the RentPayment and split the rent among the current tenants
         super().save_model(request, obj, form, change)
 
-        # Fetch all current tenants for this property (those with no end_date)
-        current_tenants = obj.property.tenant_history.filter(end_date__isnull=True)
-
-        if current_tenants:
-            split_amount = obj.amount / current_tenants.count()  # Split the rent equally among tenants
-            description = f"Rent payment for property {obj.property.id}"
-
-            # Create UserCashFlow entries for each tenant and corresponding TenantBilling entries
-            for tenant_record in current_tenants:
-                user = tenant_record.tenant  # Access the tenant (User instance)
-                if user:
-                    # Check if TenantBilling already exists for this RentPayment and tenant
-                    if not TenantBilling.objects.filter(rent_payment=obj, tenant=user).exists():
-                        # Create a UserCashFlow entry
-                        UserCashFlow.objects.create(
-                            user=user,
-                            amount=split_amount,
-                            date=obj.date,
-                            description=description,
-                            category='rent',
-                            status='pending',
-                            deadline=obj.deadline or timezone.now().date() + timezone.timedelta(days=30),
-                        )
-
-                        # Create a TenantBilling entry for each tenant if it doesn't exist
-                        TenantBilling.objects.create(
-                            rent_payment=obj,
-                            tenant=user,
-                            amount=split_amount,
-                            status='pending',
-                            deadline=obj.deadline or timezone.now().date() + timezone.timedelta(days=30),
-                        )
-
         # After saving the RentPayment, update the status based on TenantBilling
         obj.update_status_if_paid()
           
@@ -123,30 +87,9 @@ class UserCashFlowAdmin(admin.ModelAdmin):
 
 
     def save_model(self, request, obj, form, change):
-        """Custom save logic for admin to handle RentPayment and TenantBilling updates."""
-        # Call the save method on the UserCashFlow instance
+        """Custom save logic for admin; UserCashFlow.save() settles RentPayment and TenantBilling updates."""
         super().save_model(request, obj, form, change)
 
-        # If the status has been updated to 'paid' and the category is 'rent', update RentPayment and TenantBilling status
-        if obj.status == 'paid' and obj.category == 'rent':
-            # Update RentPayment and TenantBilling statuses as done in the model's save method
-            rent_payments = RentPayment.objects.filter(
-                property__tenant_history__tenant=obj.user,
-                status='pending'
-            )
-            for rent_payment in rent_payments:
-                # Check if all tenants have paid for this rent payment
-                all_paid = True
-                for tenant_billing in rent_payment.tenant_billings.all():
-                    if tenant_billing.status != 'paid':
-                        all_paid = False
-                        break
-
-                # If all tenants have paid, update the RentPayment status to 'paid'
-                if all_paid:
-                    rent_payment.status = 'paid'
-                    rent_payment.save()
-
 # Inline for PropertyBilling
 class PropertyBillingInline(admin.TabularInline):  # Or admin.StackedInline for a different layout
     model = PropertyBilling
@@ -0,0 +1,280 @@
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal, ROUND_DOWN
+
+from django.db import transaction
+from django.utils import timezone
+
+from roomie_property.models import Property, PropertyTenantRecords
+from .models import RentPayment, TenantBilling, UserCashFlow, PropertyPayments, PropertyBilling
+from .ledger import record_new_cash_flows
+from .sync import next_versions
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+CENT = Decimal('0.01')
+
+
+def parse_period(period):
+    """Return the first day of a 'YYYY-MM' period (a date is accepted as well)."""
+    if isinstance(period, date):
+        return period.replace(day=1)
+    try:
+        return datetime.strptime(period, "%Y-%m").date()
+    except (TypeError, ValueError):
+        raise ValueError("Invalid period. Use YYYY-MM.")
+
+
+def default_deadline():
+    return timezone.now().date() + timezone.timedelta(days=30)
+
+
+def split_amount(amount, count):
+    """
+    Split an amount into `count` equal shares rounded to the cent.
+
+    The leftover cents go to the first shares so the shares always add up to the amount.
+    """
+    amount = Decimal(amount)
+    share = (amount / count).quantize(CENT, rounding=ROUND_DOWN)
+    remainder = int((amount - share * count) / CENT)
+    return [share + CENT if i < remainder else share for i in range(count)]
+
+
+def current_tenants_by_property(property_ids):
+    """Map each property id to the ids of its current tenants, in one query."""
+    tenants = defaultdict(list)
+    records = PropertyTenantRecords.objects.filter(
+        property_id__in=property_ids, end_date__isnull=True
+    ).order_by('property_id', 'start_date', 'pk').values_list('property_id', 'tenant_id')
+    for property_id, tenant_id in records:
+        if tenant_id not in tenants[property_id]:
+            tenants[property_id].append(tenant_id)
+    return tenants
+
+
+def bill_rent_payments(rent_payments, tenants=None, check_existing=True):
+    """
+    Split saved RentPayment rows among the current tenants of their properties.
+
+    Creates the missing TenantBilling rows and their linked UserCashFlow rows with
+    bulk_create and adds them to the tenant balances; tenants that already have a billing for a payment are skipped.
+    Callers that just created the payments can pass the tenants they already loaded
+    and turn off the existing-billing check. Returns the created TenantBilling objects.
+    """
+    rent_payments = [payment for payment in rent_payments if payment.amount]
+    if not rent_payments:
+        return []
+
+    if tenants is None:
+        tenants = current_tenants_by_property({payment.property_id for payment in rent_payments})
+    already_billed = set()
+    if check_existing:
+        already_billed = set(
+            TenantBilling.objects.filter(rent_payment__in=rent_payments).values_list('rent_payment_id', 'tenant_id')
+        )
+
+    tenant_billings = []
+    for payment in rent_payments:
+        tenant_ids = tenants.get(payment.property_id)
+        if not tenant_ids:
+            continue
+        deadline = payment.deadline or default_deadline()
+        for tenant_id, share in zip(tenant_ids, split_amount(payment.amount, len(tenant_ids))):
+            if (payment.pk, tenant_id) in already_billed:
+                continue
+            tenant_billings.append(TenantBilling(
+                rent_payment=payment,
+                tenant_id=tenant_id,
+                amount=share,
+                status='pending',
+                deadline=deadline,
+                category='rent',
+            ))
+
+    if not tenant_billings:
+        return tenant_billings
+
+    # No savepoint: the model save() and the bulk runs already hold the transaction
+    with transaction.atomic(savepoint=False):
+        # bulk_create skips save(), so the rows get their tenant's sync version here
+        versions = next_versions(billing.tenant_id for billing in tenant_billings)
+        for billing in tenant_billings:
+            billing.version = versions[billing.tenant_id]
+        TenantBilling.objects.bulk_create(tenant_billings, batch_size=BATCH_SIZE)
+        cash_flows = UserCashFlow.objects.bulk_create([
+            UserCashFlow(
+                user_id=billing.tenant_id,
+                amount=billing.amount,
+                date=billing.rent_payment.date,
+                description=f"Rent payment for property {billing.rent_payment.property_id}",
+                category='rent',
+                status='pending',
+                deadline=billing.deadline,
+                tenant_billing=billing,
+                version=billing.version,
+            )
+            for billing in tenant_billings
+        ], batch_size=BATCH_SIZE)
+        record_new_cash_flows(cash_flows)
+
+    return tenant_billings
+
+
+def run_monthly_rent(owner, period, deadline=None):
+    """
+    Generate the rent of one period for every occupied property of an owner.
+
+    One RentPayment is created per property that has current tenants and no rent
+    payment dated in that period yet; the rent is split among the tenants in memory
+    and written with bulk_create. The owner's properties stay locked while the run
+    checks and bills them, so two runs of the same period can not both bill.
+    Returns a summary of what was generated.
+    """
+    period_start = parse_period(period)
+    deadline = deadline or default_deadline()
+
+    with transaction.atomic():
+        properties = list(
+            Property.objects.select_for_update().filter(owner=owner, rent_amount__isnull=False)
+            .only('id', 'rent_amount').order_by('pk')
+        )
+        # Read under the locks: a concurrent run of the period has committed its payments by now
+        already_run = set(
+            RentPayment.objects.filter(
+                property__owner=owner, date__year=period_start.year, date__month=period_start.month
+            ).values_list('property_id', flat=True)
+        )
+        tenants = current_tenants_by_property([property_obj.pk for property_obj in properties])
+
+        to_bill = [
+            property_obj for property_obj in properties
+            if property_obj.pk not in already_run and tenants.get(property_obj.pk)
+        ]
+        rent_payments = RentPayment.objects.bulk_create([
+            RentPayment(
+                property=property_obj,
+                amount=property_obj.rent_amount,
+                date=period_start,
+                description=f"Rent payment {period_start:%Y-%m}",
+                status='pending',
+                deadline=deadline,
+            )
+            for property_obj in to_bill
+        ], batch_size=BATCH_SIZE)
+        tenant_billings = bill_rent_payments(rent_payments, tenants=tenants, check_existing=False)
+
+    summary = {
+        'period': f"{period_start:%Y-%m}",
+        'rent_payments': len(rent_payments),
+        'tenant_billings': len(tenant_billings),
+        'user_cash_flows': len(tenant_billings),
+        'total_amount': sum((payment.amount for payment in rent_payments), Decimal('0.00')),
+        'skipped_existing': sum(1 for property_obj in properties if property_obj.pk in already_run),
+        'skipped_vacant': sum(
+            1 for property_obj in properties
+            if property_obj.pk not in already_run and not tenants.get(property_obj.pk)
+        ),
+    }
+    logger.info(f"Monthly rent run for owner {owner.pk}: {summary}")
+    return summary
+
+
+def split_property_payments(property_payments, tenants=None):
+    """
+    Split saved PropertyPayments (utility bills) among the current tenants of their properties.
+
+    Every payment gets one PropertyBilling per tenant and a linked UserCashFlow, all
+    written with bulk_create in one transaction along with the tenant balances. Returns the created PropertyBilling objects.
+    """
+    property_payments = [payment for payment in property_payments if payment.amount]
+    if not property_payments:
+        return []
+
+    if tenants is None:
+        tenants = current_tenants_by_property({payment.property_id for payment in property_payments})
+
+    property_billings = []
+    for payment in property_payments:
+        tenant_ids = tenants.get(payment.property_id)
+        if not tenant_ids:
+            continue
+        deadline = payment.deadline or default_deadline()
+        for tenant_id, share in zip(tenant_ids, split_amount(payment.amount, len(tenant_ids))):
+            property_billings.append(PropertyBilling(
+                property_payment=payment,
+                tenant_id=tenant_id,
+                amount=share,
+                status='pending',
+                deadline=deadline,
+                category=payment.category,
+            ))
+
+    if not property_billings:
+        return property_billings
+
+    with transaction.atomic(savepoint=False):
+        versions = next_versions(billing.tenant_id for billing in property_billings)
+        for billing in property_billings:
+            billing.version = versions[billing.tenant_id]
+        PropertyBilling.objects.bulk_create(property_billings, batch_size=BATCH_SIZE)
+        cash_flows = UserCashFlow.objects.bulk_create([
+            UserCashFlow(
+                user_id=billing.tenant_id,
+                amount=billing.amount,
+                date=billing.property_payment.date,
+                description=f"{billing.category.capitalize()} payment for property {billing.property_payment.property_id}",
+                category=billing.category,
+                status='pending',
+                deadline=billing.deadline,
+                property_billing=billing,
+                version=billing.version,
+            )
+            for billing in property_billings
+        ], batch_size=BATCH_SIZE)
+        record_new_cash_flows(cash_flows)
+
+    return property_billings
+
+
+def create_property_payments(owner, bills):
+    """
+    Create and split many utility bills of an owner in one transaction.
+
+    `bills` are validated dicts (see UtilityBillSerializer) with a property id,
+    category and amount, and optionally date, deadline and description. Raises
+    ValueError when a bill points at a property the owner does not own.
+    """
+    property_ids = {bill['property'] for bill in bills}
+    owned = set(Property.objects.filter(owner=owner, pk__in=property_ids).values_list('pk', flat=True))
+    not_owned = property_ids - owned
+    if not_owned:
+        raise ValueError(f"Properties not found for this owner: {sorted(not_owned)}")
+
+    today = timezone.now().date()
+    with transaction.atomic():
+        property_payments = PropertyPayments.objects.bulk_create([
+            PropertyPayments(
+                property_id=bill['property'],
+                category=bill['category'],
+                amount=bill['amount'],
+                date=bill.get('date') or today,
+                description=bill.get('description') or "Property payment",
+                status='pending',
+                deadline=bill.get('deadline') or default_deadline(),
+            )
+            for bill in bills
+        ], batch_size=BATCH_SIZE)
+        property_billings = split_property_payments(property_payments)
+
+    summary = {
+        'property_payments': len(property_payments),
+        'property_billings': len(property_billings),
+        'user_cash_flows': len(property_billings),
+        'total_amount': sum((payment.amount for payment in property_payments), Decimal('0.00')),
+    }
+    logger.info(f"Utility bill batch for owner {owner.pk}: {summary}")
+    return summary
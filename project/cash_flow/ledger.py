@@ -0,0 +1,177 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DateField, DecimalField, Min, Sum, Value, When
+from django.utils import timezone
+
+from .models import UserCashFlow, TenantBalance
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+ZERO = Decimal('0.00')
+
+
+class BalanceChanges:
+    """Collects per (user, category) deltas to apply to TenantBalance in one pass."""
+
+    def __init__(self):
+        self.outstanding = defaultdict(lambda: ZERO)
+        self.paid = defaultdict(lambda: ZERO)
+        self.new_deadlines = {}
+        self.refresh_deadlines = set()
+
+    def add(self, user_id, category, amount, status, deadline=None, sign=1):
+        """Count a cash flow in (sign=1) or out of (sign=-1) the balance."""
+        key = (user_id, category)
+        amount = (amount or ZERO) * sign
+        if status == 'paid':
+            self.paid[key] += amount
+            # Touch the key so the balance row exists even for paid-only categories
+            self.outstanding[key] += ZERO
+        else:
+            self.outstanding[key] += amount
+            if sign > 0 and deadline:
+                current = self.new_deadlines.get(key)
+                self.new_deadlines[key] = min(current, deadline) if current else deadline
+            elif sign < 0:
+                # A pending cash flow left the balance, its deadline may have been the next one
+                self.refresh_deadlines.add(key)
+
+    def keys(self):
+        return set(self.outstanding) | set(self.paid)
+
+
+def apply_changes(changes, create_missing=True):
+    """
+    Apply collected deltas to the TenantBalance rows, creating the missing ones.
+
+    Uses a fixed number of statements however many balances are touched: create the
+    missing rows, lock and read the touched rows, recompute the deadlines that may
+    have moved, then bulk_update. Deletions pass create_missing=False so a cascade
+    that already removed the balance (e.g. the user is being deleted) does not bring it back.
+    """
+    keys = changes.keys()
+    if not keys:
+        return
+
+    user_ids = {user_id for user_id, category in keys}
+    categories = {category for user_id, category in keys}
+
+    with transaction.atomic(savepoint=False):
+        if create_missing:
+            TenantBalance.objects.bulk_create(
+                [TenantBalance(user_id=user_id, category=category) for user_id, category in keys],
+                ignore_conflicts=True,
+                batch_size=BATCH_SIZE,
+            )
+        balances = [
+            balance for balance in TenantBalance.objects.select_for_update().filter(
+                user_id__in=user_ids, category__in=categories
+            )
+            if (balance.user_id, balance.category) in keys
+        ]
+
+        refreshed = {}
+        if changes.refresh_deadlines:
+            refresh_users = {user_id for user_id, category in changes.refresh_deadlines}
+            refreshed = {
+                (row['user_id'], row['category']): row['next_deadline']
+                for row in UserCashFlow.objects.filter(
+                    user_id__in=refresh_users, status='pending'
+                ).values('user_id', 'category').annotate(next_deadline=Min('deadline'))
+            }
+
+        now = timezone.now()
+        for balance in balances:
+            key = (balance.user_id, balance.category)
+            balance.outstanding += changes.outstanding[key]
+            balance.paid += changes.paid[key]
+            if key in changes.refresh_deadlines:
+                balance.next_deadline = refreshed.get(key)
+            new_deadline = changes.new_deadlines.get(key)
+            if new_deadline and (balance.next_deadline is None or new_deadline < balance.next_deadline):
+                balance.next_deadline = new_deadline
+            balance.updated_at = now
+
+        TenantBalance.objects.bulk_update(
+            balances, ['outstanding', 'paid', 'next_deadline', 'updated_at'], batch_size=BATCH_SIZE
+        )
+
+
+def record_new_cash_flows(cash_flows):
+    """Add freshly created UserCashFlow objects (e.g. from bulk_create) to the balances."""
+    changes = BalanceChanges()
+    for cash_flow in cash_flows:
+        changes.add(cash_flow.user_id, cash_flow.category, cash_flow.amount, cash_flow.status, cash_flow.deadline)
+    apply_changes(changes)
+
+
+def record_cash_flow_change(previous, current):
+    """
+    Move one cash flow's contribution from its previous state to its current one.
+
+    `previous` is a dict of the stored user_id/category/amount/status/deadline (None
+    for a new row) and `current` the saved instance (None once it is deleted).
+    """
+    fields = ('user_id', 'category', 'amount', 'status', 'deadline')
+    if previous and current is not None and all(previous[field] == getattr(current, field) for field in fields):
+        return  # Nothing the balance depends on has changed
+
+    changes = BalanceChanges()
+    if previous:
+        changes.add(previous['user_id'], previous['category'], previous['amount'], previous['status'],
+                    previous['deadline'], sign=-1)
+    if current is not None:
+        changes.add(current.user_id, current.category, current.amount, current.status, current.deadline)
+    apply_changes(changes, create_missing=current is not None)
+
+
+def record_settled_cash_flows(rows):
+    """Move settled cash flows, given as (user_id, category, amount) rows, from outstanding to paid."""
+    changes = BalanceChanges()
+    for user_id, category, amount in rows:
+        changes.add(user_id, category, amount, 'pending', sign=-1)
+        changes.add(user_id, category, amount, 'paid')
+    apply_changes(changes)
+
+
+def rebuild_balances(user_ids=None):
+    """
+    Recompute TenantBalance from scratch out of the UserCashFlow history.
+
+    Rebuilds every balance, or only the ones of `user_ids`. Returns the number of balance rows written.
+    """
+    cash_flows = UserCashFlow.objects.all()
+    balances = TenantBalance.objects.all()
+    if user_ids is not None:
+        cash_flows = cash_flows.filter(user_id__in=user_ids)
+        balances = balances.filter(user_id__in=user_ids)
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    totals = cash_flows.values('user_id', 'category').annotate(
+        outstanding_total=Sum(Case(When(status='paid', then=Value(ZERO)), default='amount', output_field=money)),
+        paid_total=Sum(Case(When(status='paid', then='amount'), default=Value(ZERO), output_field=money)),
+        next_deadline=Min(Case(When(status='paid', then=None), default='deadline', output_field=DateField())),
+    ).order_by()
+
+    now = timezone.now()
+    with transaction.atomic():
+        balances.delete()
+        created = TenantBalance.objects.bulk_create([
+            TenantBalance(
+                user_id=row['user_id'],
+                category=row['category'],
+                outstanding=row['outstanding_total'] or ZERO,
+                paid=row['paid_total'] or ZERO,
+                next_deadline=row['next_deadline'],
+                updated_at=now,
+            )
+            for row in totals
+        ], batch_size=BATCH_SIZE)
+
+    logger.info(f"Rebuilt {len(created)} tenant balance(s)")
+    return len(created)
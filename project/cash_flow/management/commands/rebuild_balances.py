@@ -0,0 +1,24 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.ledger import rebuild_balances
+
+
+class Command(BaseCommand):
+    help = "Recompute the TenantBalance table from the UserCashFlow history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users',
+                            help="Only rebuild the balances of this username (can be repeated)")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['users']:
+            users = dict(User.objects.filter(username__in=options['users']).values_list('username', 'pk'))
+            missing = set(options['users']) - set(users)
+            if missing:
+                raise CommandError(f"Users not found: {', '.join(sorted(missing))}")
+            user_ids = list(users.values())
+
+        count = rebuild_balances(user_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} tenant balance(s)."))
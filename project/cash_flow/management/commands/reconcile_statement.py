@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.reconciliation import DATE_WINDOW_DAYS, guess_statement_format, reconcile_statement
+
+
+class Command(BaseCommand):
+    help = "Match a bank statement (CSV or OFX) against an owner's pending billings and settle the matches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('owner', help="Username or id of the property owner")
+        parser.add_argument('statement', help="Path of the bank export")
+        parser.add_argument('--format', choices=['csv', 'ofx'], help="Statement format (guessed from the extension by default)")
+        parser.add_argument('--window-days', type=int, default=DATE_WINDOW_DAYS,
+                            help=f"Max days between payment date and billing deadline (default {DATE_WINDOW_DAYS})")
+
+    def handle(self, *args, **options):
+        owner_ref = options['owner']
+        owner = User.objects.filter(username=owner_ref).first()
+        if owner is None and owner_ref.isdigit():
+            owner = User.objects.filter(pk=owner_ref).first()
+        if owner is None:
+            raise CommandError(f"Owner '{owner_ref}' not found.")
+
+        statement_format = options['format'] or guess_statement_format(options['statement'])
+        try:
+            with open(options['statement'], encoding='utf-8-sig', errors='replace', newline='') as stream:
+                summary = reconcile_statement(owner, stream, statement_format, window_days=options['window_days'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for line in summary.pop('unmatched_lines'):
+            self.stdout.write(f"Unmatched line {line['line']}: {line['date']} {line['amount']} {line['reference']}")
+        for key, value in summary.items():
+            self.stdout.write(f"{key}: {value}")
+        self.stdout.write(self.style.SUCCESS(f"Statement reconciled for {owner.username}."))
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.billing import run_monthly_rent
+
+
+class Command(BaseCommand):
+    help = "Generate the rent payments of one period for every occupied property of an owner."
+
+    def add_arguments(self, parser):
+        parser.add_argument('owner', help="Username or id of the property owner")
+        parser.add_argument('period', help="Period to bill, as YYYY-MM")
+        parser.add_argument('--deadline', help="Payment deadline, as YYYY-MM-DD (defaults to 30 days from today)")
+
+    def handle(self, *args, **options):
+        owner_ref = options['owner']
+        owner = User.objects.filter(username=owner_ref).first()
+        if owner is None and owner_ref.isdigit():
+            owner = User.objects.filter(pk=owner_ref).first()
+        if owner is None:
+            raise CommandError(f"Owner '{owner_ref}' not found.")
+
+        try:
+            deadline = options['deadline'] and datetime.strptime(options['deadline'], "%Y-%m-%d").date()
+            summary = run_monthly_rent(owner, options['period'], deadline=deadline)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for key, value in summary.items():
+            self.stdout.write(f"{key}: {value}")
+        self.stdout.write(self.style.SUCCESS(f"Rent run for {owner.username} ({summary['period']}) completed."))
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Replaces 0002_auto_20250128_1050 on databases that have not applied it.
+
+    That migration adds PropertyPayments.deadline, which 0001_initial already creates,
+    so fresh databases (the test database among them) fail on it with "duplicate
+    column name". Databases that applied it keep it and record this one as applied.
+    """
+
+    replaces = [('cash_flow', '0002_auto_20250128_1050')]
+
+    dependencies = [
+        ('cash_flow', '0001_initial'),
+    ]
+
+    operations = []
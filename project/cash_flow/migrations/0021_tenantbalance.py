@@ -0,0 +1,57 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, DateField, DecimalField, Min, Sum, Value, When
+
+
+def build_balances(apps, schema_editor):
+    """Fill TenantBalance from the existing UserCashFlow history."""
+    UserCashFlow = apps.get_model('cash_flow', 'UserCashFlow')
+    TenantBalance = apps.get_model('cash_flow', 'TenantBalance')
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    totals = UserCashFlow.objects.values('user_id', 'category').annotate(
+        outstanding_total=Sum(Case(When(status='paid', then=Value(0)), default='amount', output_field=money)),
+        paid_total=Sum(Case(When(status='paid', then='amount'), default=Value(0), output_field=money)),
+        next_deadline=Min(Case(When(status='paid', then=None), default='deadline', output_field=DateField())),
+    ).order_by()
+    TenantBalance.objects.bulk_create([
+        TenantBalance(
+            user_id=row['user_id'],
+            category=row['category'],
+            outstanding=row['outstanding_total'] or 0,
+            paid=row['paid_total'] or 0,
+            next_deadline=row['next_deadline'],
+        )
+        for row in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0020_alter_rentpayment_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('rent', 'Rent'), ('electricity', 'Electricity'), ('garbage', 'Garbage'), ('internet', 'Internet'), ('heating', 'Heating')], max_length=50)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('next_deadline', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'category'), name='unique_tenant_balance_per_category')],
+            },
+        ),
+        migrations.RunPython(build_balances, migrations.RunPython.noop),
+    ]
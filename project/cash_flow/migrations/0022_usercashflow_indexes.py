@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0021_tenantbalance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usercashflow',
+            index=models.Index(fields=['user', 'status', 'category', 'date', 'id'], name='usercashflow_user_filter_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercashflow',
+            index=models.Index(fields=['user', 'date', 'id'], name='usercashflow_user_date_idx'),
+        ),
+    ]
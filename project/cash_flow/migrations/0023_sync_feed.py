@@ -0,0 +1,90 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:13
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_counter(apps, schema_editor):
+    """Create the single SyncCounter row (cash_flow.sync.COUNTER_ID)."""
+    SyncCounter = apps.get_model('cash_flow', 'SyncCounter')
+    SyncCounter.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0022_usercashflow_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('user_id', models.IntegerField()),
+                ('version', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='propertybilling',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='propertybilling',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tenantbilling',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='tenantbilling',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='usercashflow',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='usercashflow',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='propertybilling',
+            index=models.Index(fields=['tenant', 'version'], name='propbilling_tenant_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenantbilling',
+            index=models.Index(fields=['tenant', 'version'], name='tenantbill_tenant_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercashflow',
+            index=models.Index(fields=['user', 'version'], name='usercashflow_user_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(fields=['user_id', 'version'], name='synctombstone_user_version_idx'),
+        ),
+        migrations.RunPython(create_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0023_sync_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='usercashflow',
+            name='usercashflow_user_filter_idx',
+        ),
+        migrations.AddIndex(
+            model_name='usercashflow',
+            index=models.Index(fields=['user', 'status', 'date', 'id'], name='usercashflow_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercashflow',
+            index=models.Index(fields=['user', 'category', 'date', 'id'], name='usercashflow_user_category_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def split_counter(apps, schema_editor):
+    """
+    Give every user a counter starting at the old global one, so their next versions
+    are above every version and cursor handed out so far.
+    """
+    SyncCounter = apps.get_model('cash_flow', 'SyncCounter')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    legacy = SyncCounter.objects.filter(user_id__isnull=True)
+    start = legacy.aggregate(models.Max('value'))['value__max'] or 0
+    legacy.delete()
+    SyncCounter.objects.bulk_create(
+        [SyncCounter(user_id=user_id, value=start) for user_id in User.objects.values_list('pk', flat=True)],
+        batch_size=1000,
+    )
+
+
+def merge_counters(apps, schema_editor):
+    SyncCounter = apps.get_model('cash_flow', 'SyncCounter')
+    start = SyncCounter.objects.aggregate(models.Max('value'))['value__max'] or 0
+    SyncCounter.objects.all().delete()
+    SyncCounter.objects.create(pk=1, value=start)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0024_usercashflow_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synccounter',
+            name='user_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(split_counter, merge_counters),
+        migrations.AlterField(
+            model_name='synccounter',
+            name='user_id',
+            field=models.IntegerField(unique=True),
+        ),
+    ]
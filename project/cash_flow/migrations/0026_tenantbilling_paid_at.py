@@ -0,0 +1,25 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:51
+
+from django.db import migrations, models
+
+
+def backfill_paid_at(apps, schema_editor):
+    """Billings settled before paid_at existed: their last update is the best guess of the payment time."""
+    TenantBilling = apps.get_model('cash_flow', 'TenantBilling')
+    TenantBilling.objects.filter(status='paid', paid_at__isnull=True).update(paid_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0025_per_user_sync_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenantbilling',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_paid_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+SYNCED_MODELS = [
+    ('UserCashFlow', 'user_id'),
+    ('TenantBilling', 'tenant_id'),
+    ('PropertyBilling', 'tenant_id'),
+]
+
+
+def version_existing_rows(apps, schema_editor):
+    """
+    Rows from before the sync feed (0023) still have version 0. Give each one its own
+    version above its user's counter, so that initial syncs page through them and
+    clients already holding a cursor receive them on their next poll.
+    """
+    SyncCounter = apps.get_model('cash_flow', 'SyncCounter')
+    unversioned = defaultdict(list)  # user id -> [(model, pk)]
+    for model_name, user_field in SYNCED_MODELS:
+        Model = apps.get_model('cash_flow', model_name)
+        for pk, user_id in Model.objects.filter(version=0).order_by('pk').values_list('pk', user_field):
+            unversioned[user_id].append((Model, pk))
+    if not unversioned:
+        return
+
+    counters = dict(SyncCounter.objects.filter(user_id__in=unversioned).values_list('user_id', 'value'))
+    updates = defaultdict(list)
+    for user_id, rows in unversioned.items():
+        start = counters.get(user_id, 0)
+        for offset, (Model, pk) in enumerate(rows, start=1):
+            updates[Model].append(Model(pk=pk, version=start + offset))
+        SyncCounter.objects.update_or_create(user_id=user_id, defaults={'value': start + len(rows)})
+    for Model, rows in updates.items():
+        Model.objects.bulk_update(rows, ['version'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0026_tenantbilling_paid_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(version_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.5 on 2026-10-18 03:02
+
+from django.db import migrations, models
+
+
+def backfill_paid_at(apps, schema_editor):
+    """As in 0026: the last update of a billing settled before paid_at existed is the best guess of the payment time."""
+    PropertyBilling = apps.get_model('cash_flow', 'PropertyBilling')
+    PropertyBilling.objects.filter(status='paid', paid_at__isnull=True).update(paid_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0027_backfill_sync_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='propertybilling',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_paid_at, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -6,7 +6,82 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-class UserCashFlow(models.Model):
+
+class SyncCounter(models.Model):
+    """The last sync version handed out to one user's synced records (see cash_flow.sync)."""
+    user_id = models.IntegerField(unique=True)  # Not a foreign key: tombstones are versioned while the user is deleted
+    value = models.BigIntegerField(default=0)
+
+
+class SyncedModel(models.Model):
+    """
+    Records that clients can pull incrementally from the sync feed.
+
+    Every save stamps the row with the next version of the user it belongs to
+    (`sync_user_field`); bulk writers (cash_flow.billing, cash_flow.settlement) set
+    `version` and `updated_at` themselves.
+    """
+    sync_user_field = 'user_id'
+
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        from .sync import next_version
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+
+        # The user's counter row stays locked until commit, so their versions become visible in order
+        with transaction.atomic(savepoint=False):
+            self.version = next_version(getattr(self, self.sync_user_field))
+            super().save(*args, **kwargs)
+
+
+class SyncTombstone(models.Model):
+    """Marks a deleted synced record so the sync feed can tell clients to drop it."""
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    user_id = models.IntegerField()  # Not a foreign key: the user may be the one being deleted
+    version = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'version'], name='synctombstone_user_version_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.model} {self.object_id} (version {self.version})"
+
+
+class Billing(SyncedModel):
+    """
+    A tenant's share of a payment. `paid_at` is when it was settled; the applicant
+    punctuality score (roomie_property.ranking) compares it to the deadline.
+    """
+    sync_user_field = 'tenant_id'
+
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # cash_flow.settlement sets paid_at in bulk; this covers billings marked paid one by one
+        if self.status == 'paid' and self.paid_at is None:
+            self.paid_at = timezone.now()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'paid_at'}
+        super().save(*args, **kwargs)
+
+
+class UserCashFlow(SyncedModel):
     CATEGORY_CHOICES = [
         ('rent', 'Rent'),
         ('electricity', 'Electricity'),
@@ -30,116 +105,45 @@ class UserCashFlow(models.Model):
     property_billing = models.ForeignKey('PropertyBilling', related_name='user_cash_flows', on_delete=models.CASCADE, null=True, blank=True)
     tenant_billing = models.ForeignKey('TenantBilling', related_name='user_cash_flows', on_delete=models.CASCADE, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Lists filtered by status or by category paged by (date, id); with both
+            # filters the category index is read in order and the status checked per row
+            models.Index(fields=['user', 'status', 'date', 'id'], name='usercashflow_user_status_idx'),
+            models.Index(fields=['user', 'category', 'date', 'id'], name='usercashflow_user_category_idx'),
+            # Unfiltered history of a user paged by (date, id)
+            models.Index(fields=['user', 'date', 'id'], name='usercashflow_user_date_idx'),
+            # Sync feed: rows of a user changed after a version
+            models.Index(fields=['user', 'version'], name='usercashflow_user_version_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.category} - {self.amount} ({self.date})"
 
     def save(self, *args, **kwargs):
-        """Update the status to 'paid' if to_pay_order is True, and update RentPayment and TenantBilling status accordingly."""
-        
-        # Log the initial state before saving
-        logger.info(f"Saving UserCashFlow instance: {self.user.username} - {self.category} - {self.amount} - Status: {self.status} - To Pay Order: {self.to_pay_order}")
-        
+        """Update the status to 'paid' if to_pay_order is True, keep the tenant balance in step and settle the billings this cash flow covers."""
+        from .ledger import record_cash_flow_change
+        from .settlement import settle_cash_flows
+
         if self.to_pay_order and self.status != 'paid':
             self.status = 'paid'
-            logger.info(f"Updated status to 'paid' for UserCashFlow instance: {self.user.username} - {self.category} - {self.amount}")
-        
-        # Save the UserCashFlow instance
-        super().save(*args, **kwargs)
 
-        # Log after saving
-        logger.info(f"Saved UserCashFlow instance: {self.user.username} - {self.category} - {self.amount} - Status: {self.status} - To Pay Order: {self.to_pay_order}")
-
-        # If the category is 'rent' and status is updated to 'paid', update RentPayment status and related TenantBilling entries
-        if self.category == 'rent' and self.status == 'paid':
-            # Fetch the RentPayment entries associated with this user
-            rent_payments = RentPayment.objects.filter(property__tenant_history__tenant=self.user, status='pending')
-
-            # Log rent payment update
-            logger.info(f"Checking RentPayment for User: {self.user.username} - Rent Payments found: {rent_payments.count()}")
-
-            for rent_payment in rent_payments:
-                # Log RentPayment details for debugging
-                logger.info(f"Processing RentPayment ID: {rent_payment.id} for User: {self.user.username}")
-
-                # Check if all tenants have paid for this rent payment
-                all_paid = True
-                for tenant_billing in rent_payment.tenant_billings.filter(tenant=self.user):
-                    logger.info(f"Checking TenantBilling ID: {tenant_billing.id} for User: {self.user.username} - Status: {tenant_billing.status}")
-                    if tenant_billing.status != 'paid':
-                        tenant_billing.status = 'paid'
-                        tenant_billing.save()  # Save the updated TenantBilling
-                        logger.info(f"Updated TenantBilling ID: {tenant_billing.id} status to 'paid' for User: {self.user.username}")
-                        all_paid = False
-                        break
-
-                # If all tenants have paid, update the RentPayment status to 'paid'
-                if all_paid:
-                    rent_payment.status = 'paid'
-                    rent_payment.save()
-
-                    # Log RentPayment status update
-                    logger.info(f"Updated RentPayment status to 'paid' for RentPayment ID: {rent_payment.id}")
-
-                    # Update TenantBilling status for the corresponding rent payment
-                    tenant_billing = rent_payment.tenant_billings.filter(tenant=self.user, status='pending').first()
-                    if tenant_billing:
-                        tenant_billing.status = 'paid'
-                        tenant_billing.save()
-                        
-                        # Log TenantBilling status update
-                        logger.info(f"Updated TenantBilling status to 'paid' for TenantBilling ID: {tenant_billing.id}")
-            
-        if self.status == 'paid':
-                all_property_billings_paid = False
-                property_billings = PropertyBilling.objects.filter(
-                    tenant=self.user,
-                    property_payment__category=self.category,  # Match the category from PropertyPayment
-                    status='pending'
-                )
-                property_billings.update(status='paid')
-                
-                logger.info(f"Updated status to 'paid' for UserCashFlow instance: {self.user.username} - {self.category} - {self.amount}")
-                # Log the count of PropertyBilling entries found
-                property_billing_count = property_billings.count()
-                logger.info(f"Checking PropertyBilling for User: {self.user.username} - Found {property_billing_count} pending Property Billings.")
-
-                if property_billing_count == 0:
-                    logger.warning(f"No pending PropertyBilling entries found for User: {self.user.username} in category: {self.category}.")
-                  
-                    logger.warning(f"BEFORe: {all_property_billings_paid} ")
-                    all_property_billings_paid = True
-                    logger.warning(f"AFTER: {all_property_billings_paid}")
-                    
-
-                all_property_billings = PropertyBilling.objects.filter(
-                    
-                    property_payment__category=self.category,  # Match the category from PropertyPayment
-                    status='pending'
-                )
-                logger.warning(f"all_property_billings {all_property_billings}")
-
-
-                if all_property_billings_paid:
-                    logger.info(f"All PropertyBilling entries for category: {self.category} have been marked as 'paid'.")
-
-                    # Fetch all PropertyPayments that have related PropertyBilling entries
-                    property_payments = PropertyPayments.objects.filter(
-                        property_billings__category=self.category
-                    ).distinct()
-
-                    for property_payment in property_payments:
-                        # Check if all related PropertyBilling entries for this PropertyPayment are paid
-                        all_billings_paid = not property_payment.property_billings.filter(status='pending').exists()
-
-                        if all_billings_paid:
-                            # Update PropertyPayment status to 'paid'
-                            property_payment.status = 'paid'
-                            property_payment.save(update_fields=['status'])
-                            logger.info(f"PropertyPayment ID: {property_payment.id} status updated to 'paid' as all related billings are paid.")
-                        else:
-                            logger.warning(f"Some PropertyBilling entries for PropertyPayment ID: {property_payment.id} remain unpaid.")
-                else:
-                    logger.warning(f"Some PropertyBilling entries for User: {self.user.username} in category: {self.category} remain unpaid.")
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                # Locked until commit: a concurrent save of the same row waits and then diffs against this one's result
+                previous = UserCashFlow.objects.select_for_update().filter(pk=self.pk).values(
+                    'user_id', 'category', 'amount', 'status', 'deadline'
+                ).first()
+
+            super().save(*args, **kwargs)
+            record_cash_flow_change(previous, self)
+
+            # Settle the related TenantBilling/PropertyBilling and their parent payments in one pass
+            if self.status == 'paid':
+                settle_cash_flows([self.pk])
+
+        logger.info(f"Saved UserCashFlow {self.pk} - {self.category} - {self.amount} - Status: {self.status} - To Pay Order: {self.to_pay_order}")
 
     @property
     def first_name(self):
@@ -203,67 +207,29 @@ class RentPayment(models.Model):
     
     def save(self, *args, **kwargs):
         """Automatically calculate rent and split it among tenants, avoiding duplicate billing."""
+        from .billing import bill_rent_payments
+
         if not self.amount:
             self.amount = self.property.rent_amount  # Use the rent amount from the Property model if not provided
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
-        # Fetch all current tenants for this property (those with no end_date)
-        current_tenants = self.property.tenant_history.filter(end_date__isnull=True)
-
-        if current_tenants:
-            split_amount = self.amount / current_tenants.count()  # Split the rent equally among tenants
-            description = f"Rent payment for property {self.property.id}"
-
-            # Create UserCashFlow entries for each tenant and corresponding TenantBilling entries
-            for tenant_record in current_tenants:
-                user = tenant_record.tenant  # Access the tenant (User instance)
-                if user:
-                    # Check if TenantBilling already exists for this RentPayment and tenant
-                    tenant_billing = TenantBilling.objects.filter(rent_payment=self, tenant=user).first()
-
-                    if not tenant_billing:
-                        # Create a TenantBilling entry first
-                        tenant_billing = TenantBilling.objects.create(
-                            rent_payment=self,
-                            tenant=user,
-                            amount=split_amount,
-                            status='pending',
-                            deadline=self.deadline or timezone.now().date() + timezone.timedelta(days=30),
-                            category='rent'
-                        )
-
-                        print(f"Tenant Billing created: {tenant_billing}")  # Debugging output
-
-                        # Create a UserCashFlow entry linked to the created TenantBilling
-                        UserCashFlow.objects.create(
-                            user=user,
-                            amount=split_amount,
-                            date=self.date,
-                            description=description,
-                            category='rent',
-                            status='pending',
-                            deadline=self.deadline or timezone.now().date() + timezone.timedelta(days=30),
-                            tenant_billing=tenant_billing  # ✅ Now linking UserCashFlow to TenantBilling
-                        )
-
-                        
+            # Status-only updates (see update_status_if_paid) do not need to re-split the rent
+            if kwargs.get('update_fields') is None:
+                bill_rent_payments([self])
 
     def update_status_if_paid(self):
         """Update the RentPayment status to 'paid' if all tenants have paid."""
-        all_paid = True
         # Check if all tenants have paid (based on TenantBilling status)
-        for tenant_billing in self.tenant_billings.all():
-            if tenant_billing.status != 'paid':
-                all_paid = False
-                break
+        all_paid = not self.tenant_billings.exclude(status='paid').exists()
 
         # If all tenants have paid, update the RentPayment status to 'paid'
         if all_paid:
             self.status = 'paid'
             self.save(update_fields=['status'])
 
-class TenantBilling(models.Model):
+class TenantBilling(Billing):
     rent_payment = models.ForeignKey('RentPayment', related_name='tenant_billings', on_delete=models.CASCADE)
     tenant = models.ForeignKey('auth.User', on_delete=models.CASCADE)  # Assuming tenant is a User
     amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -271,6 +237,11 @@ class TenantBilling(models.Model):
     deadline = models.DateField()
     category = models.CharField(max_length=50, default='rent')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['tenant', 'version'], name='tenantbill_tenant_version_idx'),
+        ]
+
     def __str__(self):
         return f"Tenant {self.tenant.username} - {self.amount} ({self.status})"
 
@@ -300,85 +271,54 @@ class PropertyPayments(models.Model):
     
     
     def save(self, *args, **kwargs):
-        """Automatically calculate and split payments among tenants, create UserCashFlow, PropertyBilling, and PropertyPayments if needed."""
+        """Automatically split a new pending payment among the current tenants (PropertyBilling and UserCashFlow)."""
+        from .billing import split_property_payments
+
         is_new_instance = self.pk is None
-        super().save(*args, **kwargs)  # Save the PropertyPayments instance first
-
-        if is_new_instance and self.status == 'pending':
-            # Fetch all current tenants for this property (those with no end_date)
-            current_tenants = self.property.tenant_history.filter(end_date__isnull=True)
-
-            if current_tenants.exists():
-                split_amount = self.amount / current_tenants.count()  # Split payment equally among tenants
-                description = f"{self.category.capitalize()} payment for property {self.property.id}"
-
-                # Ensure a PropertyPayments entry exists for the property and category
-                property_payment = PropertyPayments.objects.filter(property=self.property, category=self.category, status='pending').first()
-                if not property_payment:
-                    property_payment = PropertyPayments.objects.create(
-                        property=self.property,
-                        category=self.category,
-                        amount=self.amount,
-                        date=self.date,
-                        description=self.description,
-                        status='pending',
-                        deadline=self.deadline or timezone.now().date() + timezone.timedelta(days=30),
-                        
-                    )
-
-                for tenant_record in current_tenants:
-                    tenant = tenant_record.tenant
-                    if tenant:
-                        property_billing = PropertyBilling.objects.filter(property_payment=property_payment, tenant=tenant).first()
-
-                        # Check if PropertyBilling already exists for this PropertyPayments and tenant
-                        if not property_billing:
-                            # Create a PropertyBilling entry for the tenant with the category
-                            property_billing = PropertyBilling.objects.create(  # ✅ Store the created object in a variable
-                                property_payment=property_payment,
-                                tenant=tenant,
-                                amount=split_amount,
-                                status='pending',
-                                deadline=self.deadline or timezone.now().date() + timezone.timedelta(days=30),
-                                category=self.category  # Set the category from PropertyPayments
-                            )
-
-                            print(f"Property Billing for tenant {tenant}: {property_billing}")  # ✅ Now it won't be None
-
-                            # Create a UserCashFlow entry
-                            UserCashFlow.objects.create(
-                                user=tenant,
-                                amount=split_amount,
-                                date=self.date,
-                                description=description,
-                                category=self.category,
-                                status='pending',
-                                deadline=self.deadline or timezone.now().date() + timezone.timedelta(days=30),
-                                property_billing=property_billing  # ✅ Now it references the correct PropertyBilling instance
-                            )
+        with transaction.atomic():
+            super().save(*args, **kwargs)  # Save the PropertyPayments instance first
 
+            if is_new_instance and self.status == 'pending':
+                split_property_payments([self])
 
     def update_status_if_paid(self):
         """Update the PropertyPayments status to 'paid' if all related PropertyBilling entries are marked as 'paid'."""
-        all_paid = not self.propertybilling_set.exclude(status='paid').exists()
+        all_paid = not self.property_billings.exclude(status='paid').exists()
 
         if all_paid:
             self.status = 'paid'
             self.save(update_fields=['status'])
 
-class PropertyBilling(models.Model):
-    
+class PropertyBilling(Billing):
     property_payment = models.ForeignKey(PropertyPayments, related_name='property_billings', on_delete=models.CASCADE, null=True, blank=True)
     tenant = models.ForeignKey(User, related_name='property_billing', on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=50, choices=[('paid', 'Paid'), ('pending', 'Pending')], default='pending')
     deadline = models.DateField(null=True, blank=True)
     category = models.CharField(max_length=50, choices=PropertyPayments.PROPERTY_PAYMENT_CHOICES, default='electricity')
-    
-    
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tenant', 'version'], name='propbilling_tenant_version_idx'),
+        ]
+
     def __str__(self):
         return f"Billing for {self.tenant.username} - {self.amount} ({self.status}) - Category: {self.category}"
-    
 
 
+class TenantBalance(models.Model):
+    """Running totals of a tenant's UserCashFlow rows per category, kept up to date by cash_flow.ledger."""
+    user = models.ForeignKey(User, related_name='balances', on_delete=models.CASCADE)
+    category = models.CharField(max_length=50, choices=UserCashFlow.CATEGORY_CHOICES)
+    outstanding = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    next_deadline = models.DateField(null=True, blank=True)  # Earliest deadline among the pending cash flows
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'], name='unique_tenant_balance_per_category'),
+        ]
+
+    def __str__(self):
+        return f"Balance of {self.user_id} - {self.category}: {self.outstanding} outstanding, {self.paid} paid"
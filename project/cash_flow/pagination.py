@@ -0,0 +1,95 @@
+from base64 import b64decode, b64encode
+from datetime import date
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class DateCursorPagination(BasePagination):
+    """
+    Keyset pagination on (date, id) for UserCashFlow lists.
+
+    Each page continues strictly after the (date, id) of the last row of the previous
+    page, so the database does an index range scan instead of skipping OFFSET rows.
+    Newest first by default, `?ordering=date` for oldest first.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor_date, cursor_id = b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            return date.fromisoformat(cursor_date), int(cursor_id)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row):
+        return b64encode(f"{row.date.isoformat()}|{row.pk}".encode('ascii')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ascending = request.query_params.get('ordering') == 'date'
+
+        if ascending:
+            queryset = queryset.order_by('date', 'id')
+        else:
+            queryset = queryset.order_by('-date', '-id')
+
+        cursor = self.decode_cursor(request)
+        if cursor:
+            cursor_date, cursor_id = cursor
+            if ascending:
+                queryset = queryset.filter(Q(date__gt=cursor_date) | Q(date=cursor_date, id__gt=cursor_id))
+            else:
+                queryset = queryset.filter(Q(date__lt=cursor_date) | Q(date=cursor_date, id__lt=cursor_id))
+
+        # Fetch one extra row to know whether there is a next page
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OverviewPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,200 @@
+import csv
+import re
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+
+from .models import UserCashFlow
+from .settlement import settle_cash_flows
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DATE_WINDOW_DAYS = 45  # How far a payment may be from the billing deadline and still match
+SETTLE_BATCH_SIZE = 1000
+MAX_REPORTED_UNMATCHED = 100
+CSV_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y")
+CSV_REFERENCE_COLUMNS = ('reference', 'description', 'details', 'memo', 'name')
+REFERENCE_TOKEN = re.compile(r"[\w.@+-]+")
+OFX_TAG = re.compile(r"<(/?[A-Za-z0-9.]+)>([^<\r\n]*)")
+
+StatementLine = namedtuple('StatementLine', ['line', 'date', 'amount', 'reference'])
+
+
+def parse_amount(value):
+    """Parse a bank amount such as '1,250.00' or '€40'; returns None when it is not a number."""
+    try:
+        return Decimal(re.sub(r"[^\d.\-]", "", value or "")).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+
+
+def parse_csv_date(value):
+    for date_format in CSV_DATE_FORMATS:
+        try:
+            return datetime.strptime((value or "").strip(), date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def iter_csv_statement(stream):
+    """
+    Yield the lines of a CSV bank export one at a time.
+
+    Needs `date` and `amount` columns; the tenant reference is read from the first of
+    reference/description/details/memo/name present. Unreadable rows are yielded with
+    a None date or amount so they can be counted as skipped.
+    """
+    reader = csv.DictReader(stream)
+    for line_number, row in enumerate(reader, start=2):
+        row = {(key or "").strip().lower(): value for key, value in row.items()}
+        reference = next((row[column] for column in CSV_REFERENCE_COLUMNS if row.get(column)), "")
+        yield StatementLine(line_number, parse_csv_date(row.get('date')), parse_amount(row.get('amount')), reference)
+
+
+def iter_ofx_statement(stream):
+    """
+    Yield the <STMTTRN> transactions of an OFX export one at a time.
+
+    Reads the file line by line and only keeps the transaction being parsed, so both
+    the SGML (OFX 1.x, unclosed tags) and XML (OFX 2.x) flavours are supported.
+    """
+    transaction_fields = None
+    start_line = None
+    for line_number, raw in enumerate(stream, start=1):
+        for tag, value in OFX_TAG.findall(raw):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                transaction_fields, start_line = {}, line_number
+            elif tag == '/STMTTRN' and transaction_fields is not None:
+                posted = transaction_fields.get('DTPOSTED', '')[:8]
+                try:
+                    posted = datetime.strptime(posted, "%Y%m%d").date()
+                except ValueError:
+                    posted = None
+                reference = " ".join(filter(None, [transaction_fields.get('NAME'), transaction_fields.get('MEMO')]))
+                yield StatementLine(start_line, posted, parse_amount(transaction_fields.get('TRNAMT')), reference)
+                transaction_fields = None
+            elif transaction_fields is not None and value.strip():
+                transaction_fields[tag] = value.strip()
+
+
+def statement_reader(stream, statement_format):
+    if statement_format == 'ofx':
+        return iter_ofx_statement(stream)
+    if statement_format == 'csv':
+        return iter_csv_statement(stream)
+    raise ValueError("Unsupported statement format. Use csv or ofx.")
+
+
+def guess_statement_format(filename):
+    return 'ofx' if filename.lower().endswith(('.ofx', '.qfx')) else 'csv'
+
+
+class PendingBillingIndex:
+    """
+    In-memory index of the pending cash flows behind an owner's billings, keyed by (amount, tenant).
+
+    Built with one query, then every statement line is matched with dictionary
+    lookups, so the cost of a statement grows with its length and not with the
+    number of billings times the number of lines.
+    """
+
+    def __init__(self, owner, window_days=DATE_WINDOW_DAYS):
+        self.window_days = window_days
+        self.candidates = defaultdict(list)
+        cash_flows = UserCashFlow.objects.filter(status='pending').filter(
+            Q(tenant_billing__rent_payment__property__owner=owner, tenant_billing__status='pending')
+            | Q(property_billing__property_payment__property__owner=owner, property_billing__status='pending')
+        ).values_list('pk', 'user_id', 'amount', 'deadline').order_by('deadline', 'pk')
+        for pk, user_id, amount, deadline in cash_flows:
+            self.candidates[(amount, user_id)].append((deadline, pk))
+
+        # Bank references carry the tenant's username or email
+        self.tenant_references = {}
+        tenant_ids = {user_id for amount, user_id in self.candidates}
+        for pk, username, email in User.objects.filter(pk__in=tenant_ids).values_list('pk', 'username', 'email'):
+            self.tenant_references[username.lower()] = pk
+            if email:
+                self.tenant_references[email.lower()] = pk
+
+    def tenants_in(self, reference):
+        tokens = (token.strip('.').lower() for token in REFERENCE_TOKEN.findall(reference or ""))
+        return list(dict.fromkeys(self.tenant_references[token] for token in tokens if token in self.tenant_references))
+
+    def match(self, statement_line):
+        """Take the pending cash flow paid by this line out of the index and return its id (or None)."""
+        for tenant_id in self.tenants_in(statement_line.reference):
+            candidates = self.candidates.get((statement_line.amount, tenant_id))
+            if not candidates:
+                continue
+            # The billing whose deadline is closest to the payment date wins
+            best = None
+            for position, (deadline, pk) in enumerate(candidates):
+                distance = abs((deadline - statement_line.date).days) if deadline else self.window_days
+                if distance <= self.window_days and (best is None or distance < best[0]):
+                    best = (distance, position)
+            if best is not None:
+                return candidates.pop(best[1])[1]
+        return None
+
+
+def reconcile_statement(owner, stream, statement_format='csv', window_days=DATE_WINDOW_DAYS):
+    """
+    Match a bank statement against the owner's pending billings and settle every match.
+
+    The statement is read in a single pass from `stream` (a text file object), one
+    line at a time; matched cash flows are settled in bulk at the end, in batches
+    of SETTLE_BATCH_SIZE inside one transaction. Returns a summary with the first
+    unmatched lines for manual review.
+    """
+    index = PendingBillingIndex(owner, window_days=window_days)
+
+    lines = skipped = 0
+    matched = []
+    unmatched = []
+    unmatched_count = 0
+    for statement_line in statement_reader(stream, statement_format):
+        lines += 1
+        # Outgoing payments and unreadable rows cannot settle a billing
+        if statement_line.date is None or statement_line.amount is None or statement_line.amount <= 0:
+            skipped += 1
+            continue
+
+        cash_flow_id = index.match(statement_line)
+        if cash_flow_id is not None:
+            matched.append(cash_flow_id)
+            continue
+
+        unmatched_count += 1
+        if len(unmatched) < MAX_REPORTED_UNMATCHED:
+            unmatched.append({
+                'line': statement_line.line,
+                'date': statement_line.date,
+                'amount': statement_line.amount,
+                'reference': statement_line.reference,
+            })
+
+    settled = defaultdict(int)
+    with transaction.atomic():
+        for start in range(0, len(matched), SETTLE_BATCH_SIZE):
+            for key, count in settle_cash_flows(matched[start:start + SETTLE_BATCH_SIZE]).items():
+                settled[key] += count
+
+    summary = {
+        'lines': lines,
+        'matched': len(matched),
+        'unmatched': unmatched_count,
+        'skipped': skipped,
+        'settled': dict(settled),
+        'unmatched_lines': unmatched,
+    }
+    logger.info(f"Reconciled statement for owner {owner.pk}: {lines} line(s), {len(matched)} matched, "
+                f"{unmatched_count} unmatched, {skipped} skipped")
+    return summary
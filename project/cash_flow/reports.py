@@ -0,0 +1,100 @@
+from decimal import Decimal
+
+from django.db.models import CharField, Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from roomie_property.models import Property
+
+from .models import RentPayment, PropertyPayments, TenantBilling, PropertyBilling
+
+ZERO = Decimal('0.00')
+
+
+def owner_cash_flow_summary(owner, date_from=None, date_to=None, property_id=None, category=None, status=None):
+    """
+    Totals of an owner's rent and utility payments grouped by property, category, month and status.
+
+    The grouping runs in the database as one UNION of two GROUP BY queries, so the
+    result size depends on the number of groups rather than the number of payments.
+    """
+    rent_payments = RentPayment.objects.filter(property__owner=owner)
+    utility_payments = PropertyPayments.objects.filter(property__owner=owner)
+
+    filters = {}
+    if date_from:
+        filters['date__gte'] = date_from
+    if date_to:
+        filters['date__lte'] = date_to
+    if property_id:
+        filters['property_id'] = property_id
+    if status:
+        filters['status'] = status
+    rent_payments = rent_payments.filter(**filters)
+    utility_payments = utility_payments.filter(**filters)
+
+    if category == 'rent':
+        utility_payments = utility_payments.none()
+    elif category:
+        rent_payments = rent_payments.none()
+        utility_payments = utility_payments.filter(category=category)
+
+    def grouped(queryset, category_expression):
+        return queryset.annotate(
+            month=TruncMonth('date'),
+            category_name=category_expression,
+        ).values('property_id', 'category_name', 'month', 'status').annotate(
+            total=Sum('amount'),
+            count=Count('id'),
+        ).order_by()
+
+    rows = grouped(rent_payments, Value('rent', output_field=CharField())).union(
+        grouped(utility_payments, F('category')), all=True
+    ).order_by('property_id', 'category_name', 'month', 'status')
+
+    groups = [
+        {
+            'property': row['property_id'],
+            'category': row['category_name'],
+            'month': row['month'].strftime('%Y-%m') if row['month'] else None,
+            'status': row['status'],
+            'total': row['total'] or Decimal('0.00'),
+            'count': row['count'],
+        }
+        for row in rows
+    ]
+
+    totals = {}
+    for group in groups:
+        totals[group['status']] = totals.get(group['status'], Decimal('0.00')) + group['total']
+
+    return {'groups': groups, 'totals': totals}
+
+
+def owner_payment_overview(owner, today=None):
+    """
+    One row per owned property for the payments screen: address, current tenant count and
+    the pending and overdue (pending past their deadline) billing totals.
+
+    The totals are correlated subqueries on the tenants' rent and utility billings and
+    the tenant count is the maintained Property.current_occupancy, so a page of the
+    overview is a single query however many billings and tenants there are.
+    """
+    today = today or timezone.localdate()
+    money = DecimalField(max_digits=12, decimal_places=2)
+
+    def billed(model, property_path, **filters):
+        totals = model.objects.filter(
+            **{property_path: OuterRef('pk')}, status='pending', **filters
+        ).order_by().values(property_path).annotate(total=Sum('amount')).values('total')
+        return Coalesce(Subquery(totals, output_field=money), Value(ZERO), output_field=money)
+
+    return Property.objects.filter(owner=owner).annotate(
+        pending_rent=billed(TenantBilling, 'rent_payment__property'),
+        pending_utilities=billed(PropertyBilling, 'property_payment__property'),
+        overdue_rent=billed(TenantBilling, 'rent_payment__property', deadline__lt=today),
+        overdue_utilities=billed(PropertyBilling, 'property_payment__property', deadline__lt=today),
+    ).values(
+        'id', 'house_number', 'street', 'town', 'county', 'country', 'current_occupancy',
+        'pending_rent', 'pending_utilities', 'overdue_rent', 'overdue_utilities',
+    ).order_by('pk')
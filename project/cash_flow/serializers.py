@@ -1,10 +1,11 @@
 # serializers.py
 
 from rest_framework import serializers
-from .models import UserCashFlow, PropertyCashFlow, PropertyPayments, PropertyBilling, TenantBilling,RentPayment
+from .models import UserCashFlow, PropertyCashFlow, PropertyPayments, PropertyBilling, TenantBilling,RentPayment, TenantBalance
 from roomie_property.models import Property
 from django.contrib.auth.models import User
 from datetime import datetime, date
+from decimal import Decimal
 # User serializer
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -20,7 +21,7 @@ class RentPaymentSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_tenant_billings(self, obj):
-        """Fetches and serializes related TenantBilling objects for this RentPayment"""
+        """Serializes related TenantBilling objects for this RentPayment (prefetched with their tenant by the viewset)"""
         return [
             {
                 "tenant": billing.tenant.username,
@@ -46,7 +47,8 @@ class RentPaymentSerializer(serializers.ModelSerializer):
 
         # Handle tenant_billing fallback for deadline
         if not data.get("deadline"):  # ✅ More reliable than `if "deadline" not in data or data["deadline"] is None`
-            tenant_billing = instance.tenant_billings.first()
+            # Read the first billing from the prefetched list instead of issuing a new query
+            tenant_billing = next(iter(instance.tenant_billings.all()), None)
             if tenant_billing and isinstance(tenant_billing.deadline, (datetime, date)):
                 data["deadline"] = tenant_billing.deadline.isoformat()
             else:
@@ -62,7 +64,45 @@ class UserCashFlowSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = UserCashFlow
-        fields = ['id', 'user', 'amount', 'date', 'description', 'category', 'status', 'deadline', 'to_pay_order', 'property_billing', 'tenant_billing']
+        fields = ['id', 'user', 'amount', 'date', 'description', 'category', 'status', 'deadline', 'to_pay_order', 'property_billing', 'tenant_billing', 'version', 'updated_at']
+
+# Billing serializers used by the sync feed
+class TenantBillingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TenantBilling
+        fields = ['id', 'rent_payment', 'amount', 'status', 'deadline', 'category', 'version', 'updated_at']
+
+class PropertyBillingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PropertyBilling
+        fields = ['id', 'property_payment', 'amount', 'status', 'deadline', 'category', 'version', 'updated_at']
+
+class PayOrderBatchSerializer(serializers.Serializer):
+    """Ids of the authenticated user's cash flows to (un)mark for payment in one go."""
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=500)
+    to_pay_order = serializers.BooleanField(default=True)
+
+class CashFlowSummaryParamsSerializer(serializers.Serializer):
+    """Query parameters of the owner cash-flow summary; every filter is optional."""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    property = serializers.IntegerField(required=False, min_value=1)
+    category = serializers.ChoiceField(choices=[('rent', 'Rent')] + PropertyPayments.PROPERTY_PAYMENT_CHOICES, required=False)
+    status = serializers.ChoiceField(choices=UserCashFlow.STATUS_CHOICES, required=False)
+
+class MonthlyRentRunSerializer(serializers.Serializer):
+    """Period (YYYY-MM) of a monthly rent run; the deadline may also be sent as an ISO datetime."""
+    period = serializers.CharField()
+    deadline = serializers.DateField(
+        required=False, allow_null=True,
+        input_formats=['iso-8601', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ'],
+    )
+
+# TenantBalance serializer
+class TenantBalanceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TenantBalance
+        fields = ['category', 'outstanding', 'paid', 'next_deadline', 'updated_at']
 
 # PropertyCashFlow serializer
 class PropertyCashFlowSerializer(serializers.ModelSerializer):
@@ -73,6 +113,16 @@ class PropertyCashFlowSerializer(serializers.ModelSerializer):
         fields = ['id', 'property', 'amount', 'date', 'description', 'category', 'status', 'deadline']
 
 
+class UtilityBillSerializer(serializers.Serializer):
+    """One row of a utility-bill batch (JSON list or CSV upload)."""
+    property = serializers.IntegerField()
+    category = serializers.ChoiceField(choices=PropertyPayments.PROPERTY_PAYMENT_CHOICES)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+    date = serializers.DateField(required=False, allow_null=True)
+    deadline = serializers.DateField(required=False, allow_null=True)
+    description = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+
 class PropertyPaymentsSerializer(serializers.ModelSerializer):
     property_billings = serializers.SerializerMethodField()
     date = serializers.SerializerMethodField()  # Override the date field
@@ -88,6 +138,7 @@ class PropertyPaymentsSerializer(serializers.ModelSerializer):
         return obj.date
 
     def get_property_billings(self, obj):
+        """Serialize the related PropertyBilling objects (prefetched with their tenant by the viewset)."""
         return [
             {
                 "tenant": billing.tenant.username,
@@ -98,23 +149,25 @@ class PropertyPaymentsSerializer(serializers.ModelSerializer):
             }
             for billing in obj.property_billings.all()
         ]
-    property_billings = serializers.SerializerMethodField()
 
-    class Meta:
-        model = PropertyPayments
-        fields = '__all__'
 
-    def get_property_billings(self, obj):
-        # Serialize the related PropertyBilling objects
-        billings_data = [
-            {
-                "tenant": billing.tenant.username,
-                "amount": billing.amount,
-                "status": billing.status,
-                "deadline": billing.deadline,
-                "category": billing.category
-            }
-            for billing in obj.property_billings.all()
-        ]
-        print(f"Property Billings for payment {obj.id}: ", billings_data)  # Print the serialized billing data
-        return billings_data
\ No newline at end of file
+class OwnerPaymentOverviewSerializer(serializers.Serializer):
+    """A row of reports.owner_payment_overview()."""
+    id = serializers.IntegerField()
+    address = serializers.SerializerMethodField()
+    current_tenants = serializers.IntegerField(source='current_occupancy')
+    pending_rent = serializers.DecimalField(max_digits=12, decimal_places=2)
+    pending_utilities = serializers.DecimalField(max_digits=12, decimal_places=2)
+    pending_total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    overdue_total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+    def to_representation(self, row):
+        row = {
+            **row,
+            'pending_total': row['pending_rent'] + row['pending_utilities'],
+            'overdue_total': row['overdue_rent'] + row['overdue_utilities'],
+        }
+        return super().to_representation(row)
+
+    def get_address(self, row):
+        return f"{row['house_number']} {row['street']}, {row['town']}, {row['county']}, {row['country']}"
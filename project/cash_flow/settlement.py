@@ -0,0 +1,139 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import UserCashFlow, TenantBilling, RentPayment, PropertyBilling, PropertyPayments
+from .ledger import record_settled_cash_flows
+from .sync import next_version, next_versions, version_case
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _settled_billing_filter(cash_flow_ids, link_field, tenant_field):
+    """
+    Match the billings covered by the given cash flows.
+
+    A cash flow covers the billing it is linked to. Older cash flows (e.g. the ones
+    created from the admin) carry no link, so they cover every billing of the same
+    tenant and category instead.
+    """
+    linked = UserCashFlow.objects.filter(pk__in=cash_flow_ids, **{link_field: OuterRef('pk')})
+    unlinked = UserCashFlow.objects.filter(
+        pk__in=cash_flow_ids,
+        tenant_billing__isnull=True,
+        property_billing__isnull=True,
+        user=OuterRef(tenant_field),
+        category=OuterRef('category'),
+    )
+    return Q(Exists(linked)) | Q(Exists(unlinked))
+
+
+def settle_cash_flows(cash_flow_ids):
+    """
+    Mark the given UserCashFlow rows as paid and settle everything they cover.
+
+    Runs a fixed number of set-based UPDATE statements inside one transaction,
+    whatever the number of cash flows, billings, payments or tenants involved:
+
+    1. the cash flows themselves (and their TenantBalance rows),
+    2. the TenantBilling / PropertyBilling rows they cover,
+    3. the RentPayment / PropertyPayments rows that have no unpaid billing left.
+
+    Returns the number of rows updated per model.
+    """
+    cash_flow_ids = list(cash_flow_ids)
+    if not cash_flow_ids:
+        return {'cash_flows': 0, 'tenant_billings': 0, 'property_billings': 0,
+                'rent_payments': 0, 'property_payments': 0}
+
+    tenant_billing_match = _settled_billing_filter(cash_flow_ids, 'tenant_billing', 'tenant')
+    property_billing_match = _settled_billing_filter(cash_flow_ids, 'property_billing', 'tenant')
+
+    # No savepoint: callers such as UserCashFlow.save() already hold the transaction
+    with transaction.atomic(savepoint=False):
+        rows = list(UserCashFlow.objects.filter(pk__in=cash_flow_ids).values_list('user_id', 'status', 'category', 'amount'))
+        settled_rows = [(user_id, category, amount) for user_id, status, category, amount in rows if status != 'paid']
+        # The covered billings belong to the cash flows' users, so one version per user covers every row
+        versions = next_versions(user_id for user_id, status, category, amount in rows)
+        now = timezone.now()
+
+        to_settle = UserCashFlow.objects.filter(pk__in=cash_flow_ids).exclude(status='paid')
+        cash_flows = to_settle.update(status='paid', version=version_case('user_id', versions), updated_at=now)
+        record_settled_cash_flows(settled_rows)
+
+        billing_paid = {'status': 'paid', 'version': version_case('tenant_id', versions), 'updated_at': now, 'paid_at': now}
+        tenant_billings = TenantBilling.objects.filter(tenant_billing_match).exclude(status='paid').update(**billing_paid)
+        property_billings = PropertyBilling.objects.filter(property_billing_match).exclude(status='paid').update(**billing_paid)
+
+        # Close the parent payments once none of their billings are left unpaid
+        rent_payments = RentPayment.objects.filter(
+            Exists(TenantBilling.objects.filter(tenant_billing_match, rent_payment=OuterRef('pk'))),
+            status='pending',
+        ).exclude(
+            Exists(TenantBilling.objects.filter(rent_payment=OuterRef('pk')).exclude(status='paid'))
+        ).update(status='paid')
+
+        property_payments = PropertyPayments.objects.filter(
+            Exists(PropertyBilling.objects.filter(property_billing_match, property_payment=OuterRef('pk'))),
+            status='pending',
+        ).exclude(
+            Exists(PropertyBilling.objects.filter(property_payment=OuterRef('pk')).exclude(status='paid'))
+        ).update(status='paid')
+
+    result = {
+        'cash_flows': cash_flows,
+        'tenant_billings': tenant_billings,
+        'property_billings': property_billings,
+        'rent_payments': rent_payments,
+        'property_payments': property_payments,
+    }
+    logger.info(f"Settled {len(cash_flow_ids)} cash flow(s): {result}")
+    return result
+
+
+def mark_to_pay_order(user, cash_flow_ids, to_pay_order=True):
+    """
+    Set `to_pay_order` on many of a user's cash flows at once and settle the ones now ordered for payment.
+
+    The rows are locked once, the flag is written with one UPDATE and settlement runs
+    once for the whole batch instead of once per UserCashFlow.save(). Returns the
+    outcome per requested id ('paid', 'already_paid', 'cleared', 'unchanged' or
+    'not_found') and the settlement counts.
+    """
+    cash_flow_ids = list(dict.fromkeys(cash_flow_ids))
+
+    with transaction.atomic():
+        rows = {
+            pk: (status, flag)
+            for pk, status, flag in UserCashFlow.objects.select_for_update().filter(
+                user=user, pk__in=cash_flow_ids
+            ).values_list('pk', 'status', 'to_pay_order')
+        }
+
+        to_flag = [pk for pk, (status, flag) in rows.items() if flag != to_pay_order]
+        if to_flag:
+            UserCashFlow.objects.filter(pk__in=to_flag).update(
+                to_pay_order=to_pay_order, version=next_version(user.pk), updated_at=timezone.now()
+            )
+
+        # Same rule as UserCashFlow.save(): ordering a payment marks it as paid
+        to_settle = [pk for pk, (status, flag) in rows.items() if to_pay_order and status != 'paid']
+        settled = settle_cash_flows(to_settle)
+
+    outcomes = {}
+    for pk in cash_flow_ids:
+        if pk not in rows:
+            outcomes[pk] = 'not_found'
+        elif pk in to_settle:
+            outcomes[pk] = 'paid'
+        elif to_pay_order:
+            outcomes[pk] = 'already_paid'
+        elif pk in to_flag:
+            outcomes[pk] = 'cleared'
+        else:
+            outcomes[pk] = 'unchanged'
+
+    logger.info(f"Pay order batch for user {user.pk}: {len(to_settle)} of {len(cash_flow_ids)} cash flow(s) settled")
+    return {'outcomes': outcomes, 'settled': settled}
@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import UserCashFlow, TenantBilling, PropertyBilling
+from .ledger import record_cash_flow_change
+from .sync import record_deletion
+
+
+@receiver(post_delete, sender=UserCashFlow)
+def remove_cash_flow_from_balance(sender, instance, **kwargs):
+    """Take a deleted cash flow (also when deleted through a cascade) out of the tenant balance."""
+    record_cash_flow_change({
+        'user_id': instance.user_id,
+        'category': instance.category,
+        'amount': instance.amount,
+        'status': instance.status,
+        'deadline': instance.deadline,
+    }, None)
+
+
+@receiver(post_delete, sender=UserCashFlow)
+def tombstone_cash_flow(sender, instance, **kwargs):
+    """Let sync clients know the cash flow is gone."""
+    record_deletion(instance, instance.user_id)
+
+
+@receiver(post_delete, sender=TenantBilling)
+@receiver(post_delete, sender=PropertyBilling)
+def tombstone_billing(sender, instance, **kwargs):
+    """Let sync clients know the billing is gone."""
+    record_deletion(instance, instance.tenant_id)
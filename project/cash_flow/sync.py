@@ -0,0 +1,121 @@
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, F, Value, When
+
+from .models import SyncCounter, SyncTombstone, UserCashFlow, TenantBilling, PropertyBilling
+
+DEFAULT_FEED_LIMIT = 500
+MAX_FEED_LIMIT = 2000
+
+
+def next_versions(user_ids):
+    """
+    Hand out the next sync version of every given user, as {user id: version}.
+
+    Versions count per user: each user's counter row stays locked until the
+    surrounding transaction commits, so that user's versions become visible in
+    order (a client that saw cursor N never misses a row <= N), while writers for
+    other users go on unblocked. Rows are locked in user id order so two bulk
+    writers can not deadlock each other.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return {}
+
+    def lock(ids):
+        return dict(
+            SyncCounter.objects.select_for_update().filter(user_id__in=ids).order_by('user_id').values_list('user_id', 'value')
+        )
+
+    with transaction.atomic(savepoint=False):
+        values = lock(user_ids)
+        missing = [user_id for user_id in user_ids if user_id not in values]
+        if missing:
+            # First write for these users; another writer may create the same rows meanwhile
+            SyncCounter.objects.bulk_create([SyncCounter(user_id=user_id) for user_id in missing], ignore_conflicts=True)
+            values.update(lock(missing))
+        SyncCounter.objects.filter(user_id__in=user_ids).update(value=F('value') + 1)
+    # The rows are locked, so the values read above are still the latest ones
+    return {user_id: value + 1 for user_id, value in values.items()}
+
+
+def next_version(user_id):
+    """The next sync version of one user; see next_versions()."""
+    return next_versions([user_id])[user_id]
+
+
+def version_case(user_field, versions):
+    """UPDATE expression giving each row the version of its user, for bulk writers."""
+    return Case(
+        *[When(**{user_field: user_id}, then=Value(version)) for user_id, version in versions.items()],
+        default=F('version'),
+        output_field=BigIntegerField(),
+    )
+
+
+def current_version(user_id):
+    """The user's last committed version, the cursor of a complete feed."""
+    return SyncCounter.objects.filter(user_id=user_id).values_list('value', flat=True).first() or 0
+
+
+def record_deletion(instance, user_id):
+    """Leave a tombstone for a deleted synced record."""
+    SyncTombstone.objects.create(
+        model=instance._meta.model_name,
+        object_id=instance.pk,
+        user_id=user_id,
+        version=next_version(user_id),
+    )
+
+
+def change_feed(user, since=None, limit=DEFAULT_FEED_LIMIT):
+    """
+    The user's cash flows and billings created, changed or deleted after `since`, oldest changes first.
+
+    The user's committed version is read first and bounds every query, so a row
+    committed while the feed is built is left for the next poll instead of being
+    skipped. Without `since` everything is returned (initial sync), without the
+    tombstones and including rows never versioned (version 0, from before the feed).
+
+    A page holds about `limit` rows: it ends after the version of the limit-th
+    change, and a version is never split, so the rows of one bulk write arrive
+    together. `cursor` is where the next request continues; `has_more` tells the
+    client to ask again right away. Raises ValueError for a cursor this user's
+    versions have not reached.
+    """
+    committed = current_version(user.pk)
+    initial = since is None
+    if not initial and since > committed:
+        raise ValueError("Invalid cursor.")
+
+    window = {'version__lte': committed}
+    if not initial:
+        window['version__gt'] = since
+    streams = {
+        'user_cash_flows': UserCashFlow.objects.filter(user=user, **window).select_related('user'),
+        'tenant_billings': TenantBilling.objects.filter(tenant=user, **window),
+        'property_billings': PropertyBilling.objects.filter(tenant=user, **window),
+    }
+    tombstones = SyncTombstone.objects.filter(user_id=user.pk, **window)
+    if initial:
+        tombstones = tombstones.none()
+
+    # The first limit + 1 changed versions across all streams, each read from its (user, version) index
+    versions = sorted(
+        version
+        for queryset in [*streams.values(), tombstones]
+        for version in queryset.order_by('version').values_list('version', flat=True)[:limit + 1]
+    )[:limit + 1]
+    has_more = len(versions) > limit
+    cursor = versions[limit - 1] if has_more else committed
+
+    page = {name: queryset.filter(version__lte=cursor).order_by('version', 'pk') for name, queryset in streams.items()}
+    deleted = {}
+    for model, object_id in tombstones.filter(version__lte=cursor).order_by('version').values_list('model', 'object_id'):
+        deleted.setdefault(model, []).append(object_id)
+
+    return {
+        'cursor': cursor,
+        'has_more': has_more,
+        **page,
+        'deleted': deleted,
+    }
@@ -1,3 +1,653 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from roomie_property.models import Property, PropertyTenantRecords
+from roomie_property.occupancy import adjust_occupancy
+from .models import (
+    UserCashFlow, RentPayment, TenantBilling, PropertyPayments, PropertyBilling, TenantBalance,
+)
+from .settlement import settle_cash_flows
+from .billing import run_monthly_rent, split_amount
+from .ledger import rebuild_balances
+
+
+def make_portfolio(owner, properties=1, tenants_per_property=2, rent_amount=Decimal('1000.00')):
+    """Create properties with current tenants and return them as a list of (property, [tenants])."""
+    portfolio = []
+    for i in range(properties):
+        property_obj = Property.objects.create(
+            street=f"Street {owner.pk}-{i}", house_number=str(i), town='Town', county='County', country='Ireland',
+            room_capacity=tenants_per_property, people_capacity=tenants_per_property,
+            rent_amount=rent_amount, owner=owner,
+        )
+        tenants = [
+            User.objects.create(username=f"tenant-{property_obj.pk}-{j}")
+            for j in range(tenants_per_property)
+        ]
+        PropertyTenantRecords.objects.bulk_create([
+            PropertyTenantRecords(property=property_obj, tenant=tenant) for tenant in tenants
+        ])
+        adjust_occupancy({property_obj.pk: len(tenants)})  # bulk_create skips the counter
+        portfolio.append((property_obj, tenants))
+    return portfolio
+
+
+def bill_portfolio(portfolio, category='electricity', amount=Decimal('100.00')):
+    """Bill rent and one utility to every tenant without going through the model save() cascades."""
+    deadline = timezone.now().date()
+    rent_payments = RentPayment.objects.bulk_create([
+        RentPayment(property=property_obj, amount=property_obj.rent_amount, deadline=deadline)
+        for property_obj, tenants in portfolio
+    ])
+    property_payments = PropertyPayments.objects.bulk_create([
+        PropertyPayments(property=property_obj, category=category, amount=amount, deadline=deadline)
+        for property_obj, tenants in portfolio
+    ])
+
+    tenant_billings = TenantBilling.objects.bulk_create([
+        TenantBilling(rent_payment=rent_payment, tenant=tenant, amount=rent_payment.amount / len(tenants),
+                      status='pending', deadline=deadline)
+        for rent_payment, (property_obj, tenants) in zip(rent_payments, portfolio)
+        for tenant in tenants
+    ])
+    property_billings = PropertyBilling.objects.bulk_create([
+        PropertyBilling(property_payment=payment, tenant=tenant, amount=payment.amount / len(tenants),
+                        deadline=deadline, category=category)
+        for payment, (property_obj, tenants) in zip(property_payments, portfolio)
+        for tenant in tenants
+    ])
+
+    UserCashFlow.objects.bulk_create(
+        [UserCashFlow(user=billing.tenant, amount=billing.amount, description='Rent', category='rent',
+                      deadline=deadline, tenant_billing=billing) for billing in tenant_billings]
+        + [UserCashFlow(user=billing.tenant, amount=billing.amount, description='Utility', category=category,
+                        deadline=deadline, property_billing=billing) for billing in property_billings]
+    )
+
+
+class SettlementTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+
+    def test_paying_every_share_settles_the_payment(self):
+        [(property_obj, tenants)] = make_portfolio(self.owner)
+        bill_portfolio([(property_obj, tenants)])
+
+        first, second = UserCashFlow.objects.filter(category='rent').order_by('pk')
+        first.to_pay_order = True
+        first.save()
+
+        rent_payment = RentPayment.objects.get(property=property_obj)
+        self.assertEqual(rent_payment.status, 'pending')
+        self.assertEqual(TenantBilling.objects.get(pk=first.tenant_billing_id).status, 'paid')
+        self.assertIsNotNone(TenantBilling.objects.get(pk=first.tenant_billing_id).paid_at)
+        self.assertEqual(TenantBilling.objects.get(pk=second.tenant_billing_id).status, 'pending')
+        self.assertIsNone(TenantBilling.objects.get(pk=second.tenant_billing_id).paid_at)
+
+        second.to_pay_order = True
+        second.save()
+
+        rent_payment.refresh_from_db()
+        self.assertEqual(rent_payment.status, 'paid')
+        # Utility billings are untouched by rent settlement
+        self.assertFalse(PropertyBilling.objects.filter(status='paid').exists())
+
+    def test_settles_utility_billings_and_payment(self):
+        [(property_obj, tenants)] = make_portfolio(self.owner)
+        bill_portfolio([(property_obj, tenants)], category='heating')
+
+        result = settle_cash_flows(UserCashFlow.objects.filter(category='heating').values_list('pk', flat=True))
+
+        self.assertEqual(result['cash_flows'], 2)
+        self.assertEqual(result['property_billings'], 2)
+        self.assertEqual(result['property_payments'], 1)
+        self.assertEqual(PropertyPayments.objects.get(property=property_obj).status, 'paid')
+        self.assertFalse(PropertyBilling.objects.filter(paid_at__isnull=True).exists())
+        self.assertEqual(RentPayment.objects.get(property=property_obj).status, 'pending')
+
+    def test_unlinked_cash_flow_settles_billings_of_same_category(self):
+        [(property_obj, tenants)] = make_portfolio(self.owner, tenants_per_property=1)
+        bill_portfolio([(property_obj, tenants)])
+        cash_flow = UserCashFlow.objects.create(
+            user=tenants[0], amount=Decimal('1000.00'), description='Rent', category='rent',
+        )
+
+        settle_cash_flows([cash_flow.pk])
+
+        self.assertEqual(TenantBilling.objects.get(tenant=tenants[0]).status, 'paid')
+        self.assertEqual(RentPayment.objects.get(property=property_obj).status, 'paid')
+        self.assertEqual(PropertyBilling.objects.get(tenant=tenants[0]).status, 'pending')
+
+    def count_settlement_queries(self, portfolio):
+        bill_portfolio(portfolio)
+        cash_flow = UserCashFlow.objects.filter(user=portfolio[0][1][0], category='rent').get()
+        cash_flow.to_pay_order = True
+        with CaptureQueriesContext(connection) as queries:
+            cash_flow.save()
+        return len(queries)
+
+    def test_query_count_is_constant_as_portfolio_grows(self):
+        small = self.count_settlement_queries(make_portfolio(self.owner, properties=1, tenants_per_property=2))
+
+        other_owner = User.objects.create(username='other-owner')
+        large = self.count_settlement_queries(make_portfolio(other_owner, properties=20, tenants_per_property=4))
+
+        self.assertEqual(small, large)
+        # Includes creating the tenant's sync counter on its first versioned write
+        self.assertLessEqual(large, 20)
+
+    def test_batch_pay_order_settles_once_and_reports_each_item(self):
+        [(property_obj, tenants)] = make_portfolio(self.owner, tenants_per_property=1)
+        bill_portfolio([(property_obj, tenants)])
+        rebuild_balances()  # bill_portfolio bypasses the ledger
+        rent, utility = UserCashFlow.objects.filter(user=tenants[0]).order_by('pk')
+        utility.to_pay_order = True
+        utility.save()
+        stranger = UserCashFlow.objects.create(user=self.owner, amount=Decimal('1.00'), description='Other', category='rent')
+
+        client = APIClient()
+        client.force_authenticate(tenants[0])
+        response = client.post('/user-cashflow/mark_to_pay_order_batch/',
+                               {'ids': [rent.pk, utility.pk, stranger.pk]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'id': rent.pk, 'outcome': 'paid'},
+            {'id': utility.pk, 'outcome': 'already_paid'},
+            {'id': stranger.pk, 'outcome': 'not_found'},
+        ])
+        self.assertEqual(response.data['settled']['rent_payments'], 1)
+        self.assertEqual(RentPayment.objects.get(property=property_obj).status, 'paid')
+        rent.refresh_from_db()
+        self.assertTrue(rent.to_pay_order)
+        self.assertEqual(TenantBalance.objects.get(user=tenants[0], category='rent').outstanding, Decimal('0.00'))
+
+        cleared = client.post('/user-cashflow/mark_to_pay_order_batch/',
+                              {'ids': [rent.pk], 'to_pay_order': False}, format='json')
+        self.assertEqual(cleared.data['results'], [{'id': rent.pk, 'outcome': 'cleared'}])
+
+
+class MonthlyRentRunTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+
+    def test_split_amount_adds_up(self):
+        self.assertEqual(split_amount(Decimal('100.00'), 3), [Decimal('33.34'), Decimal('33.33'), Decimal('33.33')])
+        self.assertEqual(sum(split_amount(Decimal('1000.00'), 7)), Decimal('1000.00'))
+
+    def test_run_bills_every_tenant_once(self):
+        make_portfolio(self.owner, properties=3, tenants_per_property=3)
+        Property.objects.create(
+            street='Empty', house_number='1', town='Town', county='County', country='Ireland',
+            room_capacity=1, people_capacity=1, rent_amount=Decimal('500.00'), owner=self.owner,
+        )
+
+        summary = run_monthly_rent(self.owner, '2025-03')
+
+        self.assertEqual(summary['rent_payments'], 3)
+        self.assertEqual(summary['tenant_billings'], 9)
+        self.assertEqual(summary['skipped_vacant'], 1)
+        self.assertEqual(summary['total_amount'], Decimal('3000.00'))
+        for rent_payment in RentPayment.objects.all():
+            self.assertEqual(sum(b.amount for b in rent_payment.tenant_billings.all()), rent_payment.amount)
+        self.assertEqual(UserCashFlow.objects.filter(category='rent', tenant_billing__isnull=False).count(), 9)
+
+        again = run_monthly_rent(self.owner, '2025-03')
+        self.assertEqual(again['rent_payments'], 0)
+        self.assertEqual(again['skipped_existing'], 3)
+        self.assertEqual(TenantBilling.objects.count(), 9)
+
+    def test_run_query_count_does_not_grow_with_portfolio(self):
+        make_portfolio(self.owner, properties=1)
+        with CaptureQueriesContext(connection) as small:
+            run_monthly_rent(self.owner, '2025-03')
+
+        other_owner = User.objects.create(username='other-owner')
+        make_portfolio(other_owner, properties=25, tenants_per_property=3)
+        with CaptureQueriesContext(connection) as large:
+            run_monthly_rent(other_owner, '2025-03')
+
+        self.assertEqual(len(small), len(large))
+
+    def test_run_endpoint_validates_the_deadline(self):
+        make_portfolio(self.owner)
+        client = APIClient()
+        client.force_authenticate(self.owner)
+
+        response = client.post('/rent-payments/monthly-run/', {'period': '2025-03', 'deadline': 20250101}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('deadline', response.data)
+        self.assertEqual(client.post('/rent-payments/monthly-run/', {'period': 'March'}, format='json').status_code, 400)
+
+        response = client.post('/rent-payments/monthly-run/',
+                               {'period': '2025-03', 'deadline': '2025-04-05T00:00:00Z'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(RentPayment.objects.values_list('deadline', flat=True)), {date(2025, 4, 5)})
+
+    def test_rent_payment_save_links_cash_flows(self):
+        [(property_obj, tenants)] = make_portfolio(self.owner)
+
+        RentPayment.objects.create(property=property_obj)
+
+        self.assertEqual(TenantBilling.objects.count(), 2)
+        self.assertEqual(set(UserCashFlow.objects.values_list('tenant_billing', flat=True)),
+                         set(TenantBilling.objects.values_list('pk', flat=True)))
+
+
+class UtilityBillSplitTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_save_splits_once_without_duplicating_the_payment(self):
+        [(property_obj, tenants)] = make_portfolio(self.owner, tenants_per_property=3)
+        PropertyPayments.objects.create(property=property_obj, category='heating', amount=Decimal('100.00'))
+
+        with CaptureQueriesContext(connection) as queries:
+            PropertyPayments.objects.create(property=property_obj, category='heating', amount=Decimal('90.00'))
+
+        self.assertEqual(PropertyPayments.objects.count(), 2)
+        payment = PropertyPayments.objects.get(amount=Decimal('90.00'))
+        self.assertEqual(payment.property_billings.count(), 3)
+        self.assertEqual(
+            UserCashFlow.objects.filter(property_billing__property_payment=payment, amount=Decimal('30.00')).count(), 3
+        )
+        # INSERT payment, SELECT tenants, 2 sync version statements, bulk INSERT billings and cash flows,
+        # 3 balance statements (+ savepoint)
+        self.assertLessEqual(len(queries), 11)
+
+    def test_batch_from_json(self):
+        portfolio = make_portfolio(self.owner, properties=4)
+        bills = [
+            {'property': property_obj.pk, 'category': category, 'amount': '60.00'}
+            for property_obj, tenants in portfolio for category in ('heating', 'electricity')
+        ]
+
+        response = self.client.post('/property-payments/batch/', bills, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['property_payments'], 8)
+        self.assertEqual(response.data['property_billings'], 16)
+        self.assertEqual(PropertyBilling.objects.filter(amount=Decimal('30.00')).count(), 16)
+
+    def test_batch_from_csv(self):
+        [(property_obj, tenants)] = make_portfolio(self.owner)
+        upload = SimpleUploadedFile('bills.csv', (
+            "property,category,amount,deadline\n"
+            f"{property_obj.pk},internet,40.00,2025-04-01\n"
+            f"{property_obj.pk},garbage,10.00,\n"
+        ).encode())
+
+        response = self.client.post('/property-payments/batch/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(PropertyPayments.objects.get(category='internet').deadline.isoformat(), '2025-04-01')
+        self.assertEqual(PropertyBilling.objects.filter(category='garbage').count(), 2)
+
+    def test_batch_rejects_properties_of_other_owners(self):
+        other_owner = User.objects.create(username='other-owner')
+        [(property_obj, tenants)] = make_portfolio(other_owner)
+
+        response = self.client.post('/property-payments/batch/', [
+            {'property': property_obj.pk, 'category': 'heating', 'amount': '60.00'}
+        ], format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PropertyPayments.objects.exists())
+
+
+class TenantBalanceTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+
+    def balances(self):
+        # A rebuild does not keep the empty rows left behind by deleted cash flows
+        return {
+            (balance.user_id, balance.category): (balance.outstanding, balance.paid, balance.next_deadline)
+            for balance in TenantBalance.objects.exclude(outstanding=0, paid=0)
+        }
+
+    def test_billing_settlement_and_deletion_keep_balances_in_step(self):
+        [(property_obj, tenants)] = make_portfolio(self.owner)
+        run_monthly_rent(self.owner, '2025-03', deadline=timezone.now().date())
+        PropertyPayments.objects.create(property=property_obj, category='heating', amount=Decimal('50.00'))
+
+        balance = TenantBalance.objects.get(user=tenants[0], category='rent')
+        self.assertEqual((balance.outstanding, balance.paid), (Decimal('500.00'), Decimal('0.00')))
+
+        cash_flow = UserCashFlow.objects.get(user=tenants[0], category='rent')
+        cash_flow.to_pay_order = True
+        cash_flow.save()
+        settle_cash_flows(UserCashFlow.objects.filter(user=tenants[1]).values_list('pk', flat=True))
+
+        balance.refresh_from_db()
+        self.assertEqual((balance.outstanding, balance.paid, balance.next_deadline), (Decimal('0.00'), Decimal('500.00'), None))
+        self.assertEqual(TenantBalance.objects.get(user=tenants[1], category='heating').paid, Decimal('25.00'))
+
+        UserCashFlow.objects.filter(user=tenants[0], category='heating').delete()
+        self.assertEqual(TenantBalance.objects.get(user=tenants[0], category='heating').outstanding, Decimal('0.00'))
+
+        incremental = self.balances()
+        rebuild_balances()
+        self.assertEqual(self.balances(), incremental)
+
+    def test_balance_endpoint_reads_the_ledger(self):
+        [(property_obj, tenants)] = make_portfolio(self.owner, tenants_per_property=1)
+        run_monthly_rent(self.owner, '2025-03')
+        client = APIClient()
+        client.force_authenticate(tenants[0])
+
+        with self.assertNumQueries(1):
+            response = client.get('/balances/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['category'], 'rent')
+        self.assertEqual(response.data[0]['outstanding'], '1000.00')
+        self.assertEqual(client.get('/balances/total/').data['outstanding'], Decimal('1000.00'))
+
+
+class CashFlowSummaryTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_groups_by_property_category_month_and_status(self):
+        portfolio = make_portfolio(self.owner, properties=2)
+        property_obj = portfolio[0][0]
+        run_monthly_rent(self.owner, '2025-02')
+        run_monthly_rent(self.owner, '2025-03')
+        PropertyPayments.objects.bulk_create([
+            PropertyPayments(property=property_obj, category='heating', amount=Decimal('40.00'), date='2025-03-02'),
+            PropertyPayments(property=property_obj, category='heating', amount=Decimal('60.00'), date='2025-03-20'),
+            PropertyPayments(property=property_obj, category='heating', amount=Decimal('10.00'), date='2025-03-21',
+                             status='paid'),
+        ])
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/cash-flow-summary/', {'date_from': '2025-03-01', 'date_to': '2025-03-31'})
+
+        self.assertEqual(response.status_code, 200)
+        groups = response.data['groups']
+        self.assertEqual(len(groups), 4)
+        self.assertIn({'property': property_obj.pk, 'category': 'heating', 'month': '2025-03', 'status': 'pending',
+                       'total': Decimal('100.00'), 'count': 2}, groups)
+        self.assertEqual(response.data['totals'], {'pending': Decimal('2100.00'), 'paid': Decimal('10.00')})
+
+    def test_filters_by_category_and_rejects_bad_dates(self):
+        make_portfolio(self.owner)
+        run_monthly_rent(self.owner, '2025-03')
+
+        response = self.client.get('/cash-flow-summary/', {'category': 'heating'})
+        self.assertEqual(response.data['groups'], [])
+        self.assertEqual(self.client.get('/cash-flow-summary/', {'date_from': '03/2025'}).status_code, 400)
+        self.assertEqual(self.client.get('/cash-flow-summary/', {'property': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/cash-flow-summary/', {'category': 'water'}).status_code, 400)
+        self.assertEqual(self.client.get('/cash-flow-summary/', {'status': 'late'}).status_code, 400)
+
+
+class OwnerPaymentOverviewTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_totals_per_property_in_one_query_per_page(self):
+        portfolio = make_portfolio(self.owner, properties=3)
+        bill_portfolio(portfolio)
+        first = portfolio[0][0]
+        TenantBilling.objects.filter(rent_payment__property=first).update(deadline=timezone.now().date() - timedelta(days=3))
+        TenantBilling.objects.filter(rent_payment__property=portfolio[1][0], tenant=portfolio[1][1][0]).update(status='paid')
+        make_portfolio(User.objects.create(username='other-owner'))
+
+        # COUNT and the page
+        with self.assertNumQueries(2):
+            response = self.client.get('/owner-payment-overview/', {'page_size': 2})
+
+        self.assertEqual(response.data['count'], 3)
+        rows = response.data['results']
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['address'], first.full_address())
+        self.assertEqual(rows[0]['current_tenants'], 2)
+        self.assertEqual(rows[0]['pending_rent'], '1000.00')
+        self.assertEqual(rows[0]['pending_total'], '1100.00')
+        self.assertEqual(rows[0]['overdue_total'], '1000.00')
+        self.assertEqual(rows[1]['pending_total'], '600.00')
+        self.assertEqual(rows[1]['overdue_total'], '0.00')
+
+
+class PaymentListQueryBudgetTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_rent_payment_page_costs_constant_queries(self):
+        make_portfolio(self.owner, properties=8, tenants_per_property=3)
+        run_monthly_rent(self.owner, '2025-03')
+
+        # COUNT, page of payments, prefetched billings joined with their tenant
+        with self.assertNumQueries(3):
+            response = self.client.get('/rent-payments/')
+
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(len(response.data['results'][0]['tenant_billings']), 3)
+
+    def test_property_payment_list_costs_constant_queries(self):
+        for property_obj, tenants in make_portfolio(self.owner, properties=5, tenants_per_property=2):
+            PropertyPayments.objects.create(property=property_obj, category='internet', amount=Decimal('30.00'))
+
+        # Payments, prefetched billings joined with their tenant
+        with self.assertNumQueries(2):
+            response = self.client.get('/property-payments/')
+
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(len(response.data[0]['property_billings']), 2)
+
+
+class UserCashFlowCursorTests(TestCase):
+
+    def setUp(self):
+        self.tenant = User.objects.create(username='tenant')
+        self.client = APIClient()
+        self.client.force_authenticate(self.tenant)
+        UserCashFlow.objects.bulk_create([
+            UserCashFlow(user=self.tenant, amount=Decimal('10.00'), description='Bill', date=f"2025-0{1 + i % 3}-01",
+                         category='rent' if i % 2 else 'heating', status='paid' if i % 4 == 0 else 'pending')
+            for i in range(25)
+        ])
+
+    def walk(self, url, params):
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend((row['date'], row['id']) for row in response.data['results'])
+            if not response.data['next']:
+                return seen
+            response = self.client.get(response.data['next'])
+
+    def test_pages_walk_every_row_once_in_date_id_order(self):
+        seen = self.walk('/user-cashflow/', {'page_size': 4})
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(self.walk('/user-cashflow/', {'page_size': 7, 'ordering': 'date'}), sorted(seen))
+
+    def test_filter_actions_use_the_cursor(self):
+        pending = self.walk('/user-cashflow/filter-by-status/', {'status': 'pending', 'page_size': 5})
+        self.assertEqual(len(pending), UserCashFlow.objects.filter(status='pending').count())
+
+        heating = self.walk('/user-cashflow/filter-by-category/', {'category': 'heating', 'page_size': 5})
+        self.assertEqual(len(heating), 13)
+
+    def test_page_costs_one_query_and_bad_cursor_is_rejected(self):
+        first = self.client.get('/user-cashflow/', {'page_size': 5})
+        with self.assertNumQueries(1):
+            self.client.get(first.data['next'])
+
+        self.assertEqual(self.client.get('/user-cashflow/', {'cursor': 'nope'}).status_code, 404)
+
+
+class SyncFeedTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        [(self.property_obj, self.tenants)] = make_portfolio(self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.tenants[0])
+
+    def test_initial_sync_then_only_changes(self):
+        RentPayment.objects.create(property=self.property_obj)
+        initial = self.client.get('/sync/')
+        self.assertEqual(len(initial.data['user_cash_flows']), 1)
+        self.assertEqual(len(initial.data['tenant_billings']), 1)
+
+        unchanged = self.client.get('/sync/', {'since': initial.data['cursor']})
+        self.assertEqual(unchanged.data['cursor'], initial.data['cursor'])
+        self.assertEqual(unchanged.data['user_cash_flows'], [])
+
+        cash_flow = UserCashFlow.objects.get(user=self.tenants[0])
+        cash_flow.to_pay_order = True
+        cash_flow.save()
+        PropertyPayments.objects.create(property=self.property_obj, category='internet', amount=Decimal('40.00'))
+
+        delta = self.client.get('/sync/', {'since': initial.data['cursor']})
+        self.assertEqual(len(delta.data['user_cash_flows']), 2)
+        self.assertEqual([row['status'] for row in delta.data['tenant_billings']], ['paid'])
+        self.assertEqual(len(delta.data['property_billings']), 1)
+        self.assertGreater(delta.data['cursor'], initial.data['cursor'])
+
+    def test_initial_sync_includes_rows_from_before_the_feed(self):
+        RentPayment.objects.create(property=self.property_obj)
+        cash_flow = UserCashFlow.objects.get(user=self.tenants[0])
+        UserCashFlow.objects.filter(pk=cash_flow.pk).update(version=0)
+
+        initial = self.client.get('/sync/')
+        self.assertEqual([row['id'] for row in initial.data['user_cash_flows']], [cash_flow.pk])
+        self.assertEqual(self.client.get('/sync/', {'since': initial.data['cursor']}).data['user_cash_flows'], [])
+
+    def test_deleted_rows_are_tombstoned_for_their_owner_only(self):
+        payment = PropertyPayments.objects.create(property=self.property_obj, category='heating', amount=Decimal('10.00'))
+        cursor = self.client.get('/sync/').data['cursor']
+        owner_client = APIClient()
+        owner_client.force_authenticate(self.owner)
+        owner_cursor = owner_client.get('/sync/').data['cursor']  # Cursors count per user
+        billing = payment.property_billings.get(tenant=self.tenants[0])
+        cash_flow = billing.user_cash_flows.get()
+
+        payment.delete()
+
+        delta = self.client.get('/sync/', {'since': cursor})
+        self.assertEqual(delta.data['deleted'], {'propertybilling': [billing.pk], 'usercashflow': [cash_flow.pk]})
+        self.assertEqual(delta.data['property_billings'], [])
+
+        self.assertEqual(owner_client.get('/sync/', {'since': owner_cursor}).data['deleted'], {})
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get('/sync/', {'since': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/sync/', {'since': 10 ** 9}).status_code, 400)  # Ahead of this user
+        self.assertEqual(self.client.get('/sync/', {'limit': 0}).status_code, 400)
+
+    def test_feed_is_paged_by_version(self):
+        for month in range(1, 6):
+            RentPayment.objects.create(property=self.property_obj, date=timezone.datetime(2025, month, 1).date())
+
+        pages, since = [], None
+        while True:
+            params = {'limit': 3, **({'since': since} if since is not None else {})}
+            page = self.client.get('/sync/', params).data
+            pages.append(page)
+            since = page['cursor']
+            if not page['has_more']:
+                break
+
+        # Every rent payment bills the tenant once and adds one cash flow, both with the same version
+        self.assertEqual([len(page['tenant_billings']) for page in pages], [2, 2, 1])
+        self.assertEqual([len(page['user_cash_flows']) for page in pages], [2, 2, 1])
+        versions = [row['version'] for page in pages for row in page['tenant_billings']]
+        self.assertEqual(versions, sorted(set(versions)))
+
+    def test_writers_of_other_users_use_their_own_counter(self):
+        from .sync import current_version
+        other = self.tenants[1]
+        before = current_version(self.tenants[0].pk)
+
+        PropertyPayments.objects.create(property=self.property_obj, category='internet', amount=Decimal('40.00'))
+        UserCashFlow.objects.create(user=other, amount=Decimal('5.00'), category='internet')
+
+        self.assertEqual(current_version(self.tenants[0].pk), before + 1)
+        billing = PropertyBilling.objects.get(tenant=other)
+        self.assertGreater(UserCashFlow.objects.filter(user=other).latest('version').version, billing.version)
+
+
+class StatementReconciliationTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, name, content, **data):
+        return self.client.post('/property-payments/reconcile/', {
+            'file': SimpleUploadedFile(name, content.encode('utf-8')), **data,
+        }, format='multipart')
+
+    def test_csv_statement_settles_matching_billings(self):
+        portfolio = make_portfolio(self.owner, properties=3, tenants_per_property=2)
+        run_monthly_rent(self.owner, '2025-03', deadline=timezone.datetime(2025, 3, 31).date())
+        lines = ["Date,Amount,Description"]
+        for property_obj, tenants in portfolio[:2]:
+            lines += [f"28/03/2025,500.00,RENT {tenant.username}" for tenant in tenants]
+        lines += [
+            f"2025-03-28,499.00,RENT {portfolio[2][1][0].username}",  # Wrong amount
+            f"2025-09-28,500.00,RENT {portfolio[2][1][1].username}",  # Outside the deadline window
+            "2025-03-28,-80.00,Card payment",
+            "not a date,500.00,?",
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upload('statement.csv', "\n".join(lines))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['matched'], 4)
+        self.assertEqual(response.data['unmatched'], 2)
+        self.assertEqual(response.data['skipped'], 2)
+        self.assertEqual(response.data['settled']['rent_payments'], 2)
+        self.assertEqual(RentPayment.objects.filter(status='paid').count(), 2)
+        self.assertFalse(TenantBilling.objects.filter(tenant__in=portfolio[2][1], status='paid').exists())
+        # Index, tenant references and one settlement run, not a lookup per line
+        self.assertLess(len(queries), 30)
+
+    def test_ofx_statement_is_parsed_line_by_line(self):
+        [(property_obj, tenants)] = make_portfolio(self.owner, tenants_per_property=1)
+        payment = PropertyPayments.objects.create(property=property_obj, category='internet', amount=Decimal('40.00'),
+                                                  deadline=timezone.datetime(2025, 4, 10).date())
+        statement = "\n".join([
+            "OFXHEADER:100", "DATA:OFXSGML", "", "<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>",
+            "<STMTTRN>", "<TRNTYPE>CREDIT", "<DTPOSTED>20250402120000", "<TRNAMT>40.00",
+            "<NAME>Transfer", f"<MEMO>internet {tenants[0].username}", "</STMTTRN>",
+            "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>",
+        ])
+
+        response = self.upload('statement.ofx', statement)
 
-# Create your tests here.
+        self.assertEqual(response.data['matched'], 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'paid')
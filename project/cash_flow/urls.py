@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import RentPaymentViewSet, PropertyPaymentsViewSet, UserCashFlowViewSet, PropertyCashFlowViewSet,UsersInPaymentsViewSet
+from .views import RentPaymentViewSet, PropertyPaymentsViewSet, UserCashFlowViewSet, PropertyCashFlowViewSet,UsersInPaymentsViewSet, TenantBalanceViewSet, CashFlowSummaryView, SyncFeedView, OwnerPaymentOverviewView
 
 router = DefaultRouter()
 router.register(r'rent-payments', RentPaymentViewSet, basename='rentpayment')
@@ -8,7 +8,11 @@ router.register(r'property-payments', PropertyPaymentsViewSet, basename='propert
 router.register(r'user-cashflow', UserCashFlowViewSet, basename='usercashflow')
 router.register(r'property-cashflow', PropertyCashFlowViewSet, basename='propertycashflow')
 router.register(r'users-in-payments', UsersInPaymentsViewSet, basename='usersinpayments')
+router.register(r'balances', TenantBalanceViewSet, basename='tenantbalance')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('cash-flow-summary/', CashFlowSummaryView.as_view(), name='cash-flow-summary'),
+    path('sync/', SyncFeedView.as_view(), name='cash-flow-sync'),
+    path('owner-payment-overview/', OwnerPaymentOverviewView.as_view(), name='owner-payment-overview'),
 ]
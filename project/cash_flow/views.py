@@ -1,16 +1,32 @@
 from rest_framework import viewsets
+from rest_framework.views import APIView
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.response import Response
 from django.contrib.auth.models import User
-from .models import RentPayment, PropertyPayments, UserCashFlow, PropertyCashFlow
+from django.db.models import Prefetch
+from .models import RentPayment, PropertyPayments, UserCashFlow, PropertyCashFlow, TenantBalance, TenantBilling, PropertyBilling
+from .billing import run_monthly_rent, create_property_payments
+from .reports import owner_cash_flow_summary, owner_payment_overview
+from .pagination import DateCursorPagination, OverviewPagination
+from .sync import change_feed, DEFAULT_FEED_LIMIT, MAX_FEED_LIMIT
+from .settlement import mark_to_pay_order
+from .reconciliation import reconcile_statement, guess_statement_format, DATE_WINDOW_DAYS
 from datetime import datetime
 from .serializers import (
     RentPaymentSerializer,
     PropertyPaymentsSerializer,
     UserCashFlowSerializer,
     PropertyCashFlowSerializer,
-    UserSerializer
+    UserSerializer,
+    UtilityBillSerializer,
+    TenantBalanceSerializer,
+    TenantBillingSerializer,
+    PropertyBillingSerializer,
+    PayOrderBatchSerializer,
+    OwnerPaymentOverviewSerializer,
+    MonthlyRentRunSerializer,
+    CashFlowSummaryParamsSerializer,
 )
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
@@ -20,11 +36,16 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.shortcuts import get_object_or_404
 from roomie_property.models import Property
+import csv
+import io
 import logging
 logger = logging.getLogger(__name__)
 
 class RentPaymentViewSet(viewsets.ModelViewSet):
-    queryset = RentPayment.objects.all()
+    # Billings and their tenants are prefetched so a page costs the same number of queries whatever its size
+    queryset = RentPayment.objects.prefetch_related(
+        Prefetch('tenant_billings', queryset=TenantBilling.objects.select_related('tenant').order_by('pk'))
+    ).order_by('-date', '-pk')
     serializer_class = RentPaymentSerializer
 
     def create(self, request, *args, **kwargs):
@@ -50,6 +71,21 @@ class RentPaymentViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='monthly-run', permission_classes=[IsAuthenticated])
+    def monthly_run(self, request):
+        """Generate the rent of one period (YYYY-MM) for every occupied property of the authenticated owner."""
+        serializer = MonthlyRentRunSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            summary = run_monthly_rent(
+                request.user, serializer.validated_data['period'], deadline=serializer.validated_data.get('deadline')
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(summary, status=status.HTTP_201_CREATED)
+
 
 class PropertyPaymentsViewSet(viewsets.ModelViewSet):
     """Viewset for handling property payments, ensuring only owners manage their payments."""
@@ -60,20 +96,21 @@ class PropertyPaymentsViewSet(viewsets.ModelViewSet):
         """Restrict the queryset to only payments for properties owned by the authenticated user."""
         user = self.request.user
         if user.is_authenticated:
-            return PropertyPayments.objects.filter(property__owner=user).prefetch_related('property_billings')
+            return PropertyPayments.objects.filter(property__owner=user).prefetch_related(
+                Prefetch('property_billings', queryset=PropertyBilling.objects.select_related('tenant').order_by('pk'))
+            )
         return PropertyPayments.objects.none()
 
     def list(self, request, *args, **kwargs):
         """Return a list of property payments related to the authenticated user."""
         logger.info("Received request for Property Payments list")
         
-        payments = self.get_queryset()
-        if not payments.exists():
+        payments = list(self.get_queryset())
+        if not payments:
             logger.info("No payments found for this user.")
             return Response({"message": "No property payments available."}, status=status.HTTP_200_OK)
 
         serializer = self.get_serializer(payments, many=True)
-        logger.info(f"Serialized payments data: {serializer.data}")
         return Response(serializer.data)
 
     def create(self, request, *args, **kwargs):
@@ -100,24 +137,79 @@ class PropertyPaymentsViewSet(viewsets.ModelViewSet):
         logger.error(f"Payment creation failed: {serializer.errors}")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """
+        Create many utility bills at once from a JSON list (or {"bills": [...]}) or an uploaded CSV file.
+
+        CSV columns: property, category, amount and optionally date, deadline, description.
+        """
+        upload = request.FILES.get('file')
+        if upload:
+            # Empty CSV cells mean "use the default" for the optional columns
+            rows = [
+                {key: value for key, value in row.items() if value not in ('', None)}
+                for row in csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig'))
+            ]
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            rows = request.data.get('bills')
+
+        if not rows:
+            return Response({"error": "No bills provided."}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = UtilityBillSerializer(data=rows, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            summary = create_property_payments(request.user, serializer.validated_data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(summary, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='reconcile')
+    def reconcile(self, request):
+        """
+        Upload a bank statement (CSV or OFX) and settle the pending billings it pays.
+
+        The file is read line by line; pass "format" to override the guess made from
+        the file extension and "window_days" to widen or narrow the deadline window.
+        """
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({"error": "A statement file is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        statement_format = request.data.get('format') or guess_statement_format(upload.name)
+        try:
+            window_days = int(request.data.get('window_days') or DATE_WINDOW_DAYS)
+            stream = io.TextIOWrapper(upload, encoding='utf-8-sig', errors='replace', newline='')
+            summary = reconcile_statement(request.user, stream, statement_format, window_days=window_days)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(summary, status=status.HTTP_200_OK)
+
 
 class UserCashFlowViewSet(viewsets.ModelViewSet):
     """ViewSet for managing User Cash Flows with optional filters for category, status, and order to pay"""
 
     serializer_class = UserCashFlowSerializer
     permission_classes = [IsAuthenticated]
-    
-    # Use filtering and ordering
-    filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
+    pagination_class = DateCursorPagination  # Keyset pages on (date, id); ?ordering=date for oldest first
+
+    # Use filtering (ordering is handled by the cursor pagination)
+    filter_backends = (DjangoFilterBackend,)
     filterset_fields = ['category', 'status']  # Filter by category and status
-    ordering_fields = ['date']  # Allow ordering by date
     
     def get_queryset(self):
         """
         Return only the cash flows for the authenticated user, with optional filtering and ordering.
         """
         user = self.request.user  # Get the authenticated user
-        queryset = UserCashFlow.objects.filter(user=user)
+        queryset = UserCashFlow.objects.filter(user=user).select_related('user')
 
         # Apply filters (category and status)
         category_filter = self.request.query_params.get('category', None)
@@ -143,6 +235,25 @@ class UserCashFlowViewSet(viewsets.ModelViewSet):
         except UserCashFlow.DoesNotExist:
             return Response({'error': 'Cash flow not found.'}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=['post'], url_path='mark_to_pay_order_batch')
+    def mark_to_pay_order_batch(self, request):
+        """
+        Mark many cash flows for payment (or unmark them with "to_pay_order": false) in one transaction.
+
+        Body: {"ids": [1, 2, 3], "to_pay_order": true}. Returns the outcome of every id.
+        """
+        serializer = PayOrderBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        result = mark_to_pay_order(
+            request.user, serializer.validated_data['ids'], serializer.validated_data['to_pay_order']
+        )
+        return Response({
+            "results": [{"id": pk, "outcome": outcome} for pk, outcome in result['outcomes'].items()],
+            "settled": result['settled'],
+        }, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['get'], url_path='filter-by-category')
     def filter_by_category(self, request):
         """
@@ -153,8 +264,9 @@ class UserCashFlowViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Category filter is required."}, status=400)
 
         cash_flows = self.get_queryset().filter(category=category)
-        serializer = self.get_serializer(cash_flows, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(cash_flows)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'], url_path='filter-by-status')
     def filter_by_status(self, request):
@@ -166,14 +278,105 @@ class UserCashFlowViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Status filter is required."}, status=400)
 
         cash_flows = self.get_queryset().filter(status=status)
-        serializer = self.get_serializer(cash_flows, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(cash_flows)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
+class TenantBalanceViewSet(viewsets.ReadOnlyModelViewSet):
+    """What the authenticated tenant owes and has paid per category, read from the maintained TenantBalance rows."""
+    serializer_class = TenantBalanceSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = None  # At most one row per category
+    lookup_field = 'category'
+
+    def get_queryset(self):
+        return TenantBalance.objects.filter(user=self.request.user).order_by('category')
+
+    @action(detail=False, methods=['get'], url_path='total')
+    def total(self, request):
+        """Totals over every category, plus the earliest upcoming deadline."""
+        balances = list(self.get_queryset())
+        deadlines = [balance.next_deadline for balance in balances if balance.next_deadline]
+        return Response({
+            "outstanding": sum(balance.outstanding for balance in balances),
+            "paid": sum(balance.paid for balance in balances),
+            "next_deadline": min(deadlines) if deadlines else None,
+        })
+
 class PropertyCashFlowViewSet(viewsets.ModelViewSet):
     """ViewSet for managing Property Cash Flow"""
     queryset = PropertyCashFlow.objects.all()
     serializer_class = PropertyCashFlowSerializer
 
+class CashFlowSummaryView(APIView):
+    """
+    Owner totals grouped by property, category, month and status, computed in the database.
+
+    Optional query parameters: date_from, date_to (YYYY-MM-DD), property, category, status.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # Blank parameters count as not given
+        params = CashFlowSummaryParamsSerializer(
+            data={name: value for name, value in request.query_params.items() if value != ''}
+        )
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = params.validated_data
+        summary = owner_cash_flow_summary(
+            request.user,
+            date_from=filters.get('date_from'),
+            date_to=filters.get('date_to'),
+            property_id=filters.get('property'),
+            category=filters.get('category'),
+            status=filters.get('status'),
+        )
+        return Response(summary, status=status.HTTP_200_OK)
+
+class OwnerPaymentOverviewView(APIView):
+    """
+    Paginated per-property payment overview of the owner: address, current tenant count,
+    pending and overdue totals. Replaces owner-payments-properties/ on the payments screen.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        paginator = OverviewPagination()
+        page = paginator.paginate_queryset(owner_payment_overview(request.user), request, view=self)
+        return paginator.get_paginated_response(OwnerPaymentOverviewSerializer(page, many=True).data)
+
+class SyncFeedView(APIView):
+    """
+    Delta sync of the authenticated user's cash flows and billings.
+
+    `?since=<cursor>` returns only the rows created, changed or deleted after the
+    cursor of a previous response; without it everything is returned. Pages hold
+    about `?limit=` rows (500 by default); keep the `cursor` of the response for the
+    next request and ask again right away while `has_more` is true.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            since = int(request.query_params['since']) if request.query_params.get('since') else None
+            limit = int(request.query_params.get('limit') or DEFAULT_FEED_LIMIT)
+            if limit < 1 or (since is not None and since < 0):
+                raise ValueError
+            feed = change_feed(request.user, since=since, limit=min(limit, MAX_FEED_LIMIT))
+        except ValueError:
+            return Response({"error": "Invalid cursor or limit."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "cursor": feed['cursor'],
+            "has_more": feed['has_more'],
+            "user_cash_flows": UserCashFlowSerializer(feed['user_cash_flows'], many=True).data,
+            "tenant_billings": TenantBillingSerializer(feed['tenant_billings'], many=True).data,
+            "property_billings": PropertyBillingSerializer(feed['property_billings'], many=True).data,
+            "deleted": feed['deleted'],
+        }, status=status.HTTP_200_OK)
+
 class UsersInPaymentsViewSet(viewsets.ViewSet):
     """ViewSet to retrieve all users involved in Rent or Property Payments"""
 
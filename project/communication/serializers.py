@@ -1,10 +1,8 @@
 from rest_framework import serializers
 from .models import DamageRepairReport, RepairImage,Notification
-from roomie_property.models import Property
-from cloudinary.utils import cloudinary_url
+from roomie_property.images import image_url
 from roomie_user.models import CustomUser
 from rest_framework.exceptions import NotFound
-from django.contrib.auth.models import User
 from accounts_app.serializers import UserSerializer
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -23,7 +21,7 @@ class RepairImageSerializer(serializers.ModelSerializer):
 
     def get_image(self, obj):
         if obj.image:
-            return cloudinary_url(obj.image.public_id)[0]  # ✅ Automatically generate full URL
+            return image_url(obj.image)  # ✅ Full URL, memoized by the shared URL builder
         return None
 
 
@@ -103,6 +103,28 @@ WSGI_APPLICATION = 'project.wsgi.application'
 CLOUDINARY_URL = os.getenv('CLOUDINARY_URL')
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
+# Background image pipeline (roomie_property.images): 'local' stores the processed
+# images under MEDIA_ROOT instead of Cloudinary
+IMAGE_STORAGE = os.getenv('IMAGE_STORAGE', 'cloudinary' if CLOUDINARY_URL else 'local')
+IMAGE_PIPELINE_PROCESSES = int(os.getenv('IMAGE_PIPELINE_PROCESSES', os.cpu_count() or 1))
+IMAGE_PIPELINE_THREADS = int(os.getenv('IMAGE_PIPELINE_THREADS', 4))
+IMAGE_PIPELINE_EAGER = os.getenv('IMAGE_PIPELINE_EAGER') == 'True'  # Run jobs in the request instead of the image worker (tests)
+IMAGE_JOB_POLL_INTERVAL = float(os.getenv('IMAGE_JOB_POLL_INTERVAL', 2))  # Seconds between queue checks of process_image_jobs --watch
+IMAGE_JOB_STALE_AFTER = int(os.getenv('IMAGE_JOB_STALE_AFTER', 15 * 60))  # Seconds before a processing job is requeued
+IMAGE_URL_CACHE_SIZE = int(os.getenv('IMAGE_URL_CACHE_SIZE', 4096))  # Memoized delivery URLs (roomie_property.images)
+
+# Cache of serialized responses (roomie_property.caching): Redis when REDIS_URL is
+# set (shared by every worker), a file cache with CACHE_DIR, otherwise in memory
+if os.getenv('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.getenv('REDIS_URL')}}
+elif os.getenv('CACHE_DIR'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': os.getenv('CACHE_DIR')}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 600))
+APPLICANTS_CACHE_TIMEOUT = int(os.getenv('APPLICANTS_CACHE_TIMEOUT', 60))  # Ratings and payments reach the ranking within this
+RESPONSE_CACHE_LOCK_WAIT = float(os.getenv('RESPONSE_CACHE_LOCK_WAIT', 5))  # Seconds to wait on another worker's rebuild
+
 
 
 # Password validation
@@ -206,7 +228,9 @@ CORS_ALLOW_HEADERS = [
     "content-type",
     "x-csrftoken",
     "authorization",
+    "if-none-match",  # Conditional GETs (roomie_property.versioning)
 ]
+CORS_EXPOSE_HEADERS = ["etag"]
 REST_FRAMEWORK = {
     
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from .models import Property, PropertyTenantRecords, RoomImage, TenancyRequest
+from .images import image_url
 from roomie_user.models import CustomUser  
 from communication.models import Notification
 from django.utils.timezone import now
@@ -35,11 +36,13 @@ class RoomImageInline(admin.TabularInline):
 class PropertyAdmin(admin.ModelAdmin):
     list_display = ('full_address_display','air_code', 'description', 'main_image_display', 'owner', 'folio_number',
                     'property_rating', 'room_capacity', 'people_capacity', 
-                    'property_supervisor', 'rent_amount', 'deposit_amount', 'current_tenants_display')
+                    'property_supervisor', 'rent_amount', 'deposit_amount', 'current_occupancy', 'current_tenants_display')
     
     search_fields = ('street', 'town', 'county', 'country', 
                      'owner__username', 'property_supervisor__username')
 
+    readonly_fields = ('current_occupancy',)  # Maintained from the tenancy records
+
     inlines = [RoomImageInline, PropertyTenantHistoryInline, TenancyRequestInline]
     
     
@@ -53,7 +56,8 @@ class PropertyAdmin(admin.ModelAdmin):
     # 🔹 **Display main image in the admin list view**
     def main_image_display(self, obj):
         if obj.main_image:
-            return format_html('<img src="{}" style="width: 50px; height: 50px; object-fit: cover;" />', obj.main_image.url)
+            thumbnail = image_url(obj.main_image, width=50, height=50, crop='fill')
+            return format_html('<img src="{}" style="width: 50px; height: 50px; object-fit: cover;" />', thumbnail)
         return "No image"
     
     main_image_display.short_description = 'Main Image'
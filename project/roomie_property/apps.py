@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RoomiePropertyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'roomie_property'
+
+    def ready(self):
+        import roomie_property.signals  # Bumps the version stamps behind the ETags
+        from .search import restore_search_triggers_after_migrate
+        post_migrate.connect(restore_search_triggers_after_migrate, sender=self)
@@ -0,0 +1,80 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'response'
+STATS = ('hits', 'misses', 'coalesced')
+POLL_INTERVAL = 0.05
+
+
+def response_cache_key(request, etag):
+    """
+    Cache key of a response: the URL path plus its ETag (version stamp and query string).
+
+    The post_save/post_delete receivers of roomie_property.signals bump the version
+    stamps, which moves every key of the changed property or owner at once; the
+    entries left behind expire after RESPONSE_CACHE_TIMEOUT.
+    """
+    digest = hashlib.md5(f"{request.path}|{etag}".encode()).hexdigest()
+    return f"{KEY_PREFIX}:{digest}"
+
+
+def count(stat):
+    key = f"{KEY_PREFIX}:stats:{stat}"
+    # add() then incr(): incr() fails on a missing key
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def response_cache_stats():
+    """Hit, miss and coalesced-miss counters (per process with the in-memory cache, shared otherwise)."""
+    values = cache.get_many([f"{KEY_PREFIX}:stats:{stat}" for stat in STATS])
+    return {stat: values.get(f"{KEY_PREFIX}:stats:{stat}", 0) for stat in STATS}
+
+
+def cached_response(key, build_response, timeout=None):
+    """
+    Serve the data cached under `key`, or build, cache and return the response.
+
+    Concurrent misses are coalesced: the first worker takes a lock with cache.add()
+    and rebuilds, the others wait up to RESPONSE_CACHE_LOCK_WAIT for its result
+    before building their own. Only 200 responses are cached, for `timeout` seconds
+    (RESPONSE_CACHE_TIMEOUT by default).
+    """
+    data = cache.get(key)
+    if data is not None:
+        count('hits')
+        return Response(data)
+
+    lock_key = f"{key}:lock"
+    locked = cache.add(lock_key, 1, timeout=int(settings.RESPONSE_CACHE_LOCK_WAIT) + 1)
+    if not locked:
+        deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            data = cache.get(key)
+            if data is not None:
+                count('coalesced')
+                return Response(data)
+        logger.warning(f"Gave up waiting for the rebuild of {key}")
+
+    count('misses')
+    try:
+        response = build_response()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, timeout=timeout or settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+    finally:
+        if locked:
+            cache.delete(lock_key)
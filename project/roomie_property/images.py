@@ -0,0 +1,245 @@
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connections, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import ImageJob, Property, RoomImage
+from .transcode import transcode_renditions
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def raw_upload_storage():
+    """Local storage of the raw uploads waiting in an ImageJob."""
+    return FileSystemStorage(location=os.path.join(settings.MEDIA_ROOT, 'image_jobs'))
+
+
+class LocalImageStorage:
+    """Stores processed images under MEDIA_ROOT; stands in for Cloudinary in development and tests."""
+
+    def __init__(self):
+        self.storage = FileSystemStorage(location=settings.MEDIA_ROOT, base_url=settings.MEDIA_URL)
+
+    def save(self, data, folder, name):
+        return self.storage.save(f"{folder}/{name}", ContentFile(data))
+
+    def url(self, public_id, **transformation):
+        # Local files are stored once, transformations are not applied
+        return self.storage.url(public_id)
+
+    def delete(self, public_ids):
+        for public_id in public_ids:
+            self.storage.delete(public_id)
+
+
+class CloudinaryImageStorage:
+    """Uploads processed images to Cloudinary; the public id is what CloudinaryField stores."""
+
+    def save(self, data, folder, name):
+        import cloudinary.uploader
+        result = cloudinary.uploader.upload(data, folder=folder, public_id=os.path.splitext(name)[0], format='webp')
+        return result['public_id']
+
+    def url(self, public_id, **transformation):
+        from cloudinary.utils import cloudinary_url
+        return cloudinary_url(public_id, secure=True, **transformation)[0]
+
+    def delete(self, public_ids):
+        import cloudinary.api
+        cloudinary.api.delete_resources(list(public_ids))
+
+
+def get_image_storage():
+    """The storage selected by the IMAGE_STORAGE setting ('cloudinary' or 'local')."""
+    if settings.IMAGE_STORAGE == 'local':
+        return LocalImageStorage()
+    return CloudinaryImageStorage()
+
+
+class ImageURLBuilder:
+    """
+    Delivery URLs of stored images, memoized in a bounded LRU cache.
+
+    Building a Cloudinary URL formats (and may sign) the transformation on every
+    call; a property page with dozens of images asks for the same URLs over and
+    over, so each (public id, transformation) pair is built once.
+    """
+
+    def __init__(self, storage, maxsize):
+        self.storage = storage
+        self.cached_url = lru_cache(maxsize=maxsize)(self._build)
+
+    def _build(self, public_id, transformation):
+        return self.storage.url(public_id, **dict(transformation))
+
+    def url(self, public_id, **transformation):
+        """URL of a public id or CloudinaryField value; url(id, width=160, crop='fill') for a variant, None without an image."""
+        if not public_id:
+            return None
+        if not isinstance(public_id, str):
+            # A CloudinaryField resource; keep the format its public id was split from
+            image_format = public_id.format
+            public_id = f"{public_id.public_id}.{image_format}" if image_format else str(public_id.public_id)
+        return self.cached_url(public_id, tuple(sorted(transformation.items())))
+
+
+_url_builders = {}
+_url_builders_lock = threading.Lock()
+
+
+def get_url_builder():
+    """The URL builder of the configured storage (IMAGE_STORAGE), shared by every serializer."""
+    key = (settings.IMAGE_STORAGE, settings.MEDIA_URL)
+    with _url_builders_lock:
+        if key not in _url_builders:
+            _url_builders[key] = ImageURLBuilder(get_image_storage(), settings.IMAGE_URL_CACHE_SIZE)
+        return _url_builders[key]
+
+
+def image_url(public_id, **transformation):
+    return get_url_builder().url(public_id, **transformation)
+
+
+def delete_stored_images(public_ids):
+    """
+    Remove images from the configured storage, e.g. a room image and its renditions.
+
+    Runs in the request: it is a single storage call with nothing to transcode, and the
+    caller reports whether it succeeded.
+    """
+    public_ids = [public_id for public_id in dict.fromkeys(public_ids) if public_id]
+    if public_ids:
+        get_image_storage().delete(public_ids)
+
+
+class ImagePipeline:
+    """
+    Worker pools of the image pipeline.
+
+    Transcoding is CPU bound and runs in a process pool; reading the raw upload,
+    storing the result and updating the database are I/O and run in threads, each
+    thread waiting on its own transcode.
+
+    Only the image worker (the process_image_jobs command) creates one, so web
+    workers never start pools of their own.
+    """
+
+    def __init__(self, processes=None, threads=None):
+        # spawn: forking a process that already runs threads can deadlock
+        self.cpu_pool = ProcessPoolExecutor(
+            max_workers=processes or settings.IMAGE_PIPELINE_PROCESSES,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+        self.io_pool = ThreadPoolExecutor(
+            max_workers=threads or settings.IMAGE_PIPELINE_THREADS, thread_name_prefix='image-pipeline'
+        )
+
+    def submit(self, job_id):
+        return self.io_pool.submit(self.run, job_id)
+
+    def run(self, job_id):
+        try:
+            run_job(job_id, transcode=lambda data: self.cpu_pool.submit(transcode_renditions, data).result())
+        finally:
+            connections.close_all()  # Worker threads must not leak database connections
+
+    def shutdown(self, wait=True):
+        self.io_pool.shutdown(wait=wait)
+        self.cpu_pool.shutdown(wait=wait)
+
+
+def queue_image(property_instance, upload, kind, description='', user=None):
+    """
+    Store a raw upload and queue it for processing; returns the ImageJob.
+
+    The web side only records the job; the image worker (`process_image_jobs --watch`)
+    picks it up. With IMAGE_PIPELINE_EAGER (tests) it runs in the request once the
+    surrounding transaction commits.
+    """
+    extension = os.path.splitext(upload.name)[1].lower()
+    raw_path = raw_upload_storage().save(f"{uuid.uuid4().hex}{extension}", upload)
+    job = ImageJob.objects.create(
+        property=property_instance,
+        created_by=user if user is not None and user.is_authenticated else None,
+        kind=kind,
+        raw_path=raw_path,
+        description=description,
+    )
+    if settings.IMAGE_PIPELINE_EAGER:
+        transaction.on_commit(lambda: run_job(job.pk))
+    logger.info(f"Queued image job {job.pk} ({kind}) for property {property_instance.pk}")
+    return job
+
+
+def run_job(job_id, transcode=transcode_renditions):
+    """Transcode a queued job's upload into its renditions, store them and attach them to the property."""
+    # Claim the job; a second worker picking up the same id gets nothing to do.
+    # update() skips auto_now, the claim time is what requeue_stale_jobs() looks at.
+    if not ImageJob.objects.filter(pk=job_id, status='queued').update(status='processing', updated_at=timezone.now()):
+        return
+    job = ImageJob.objects.get(pk=job_id)
+    raw_storage = raw_upload_storage()
+
+    try:
+        with raw_storage.open(job.raw_path, 'rb') as raw:
+            encoded = transcode(raw.read())
+
+        folder = 'properties' if job.kind == 'main_image' else 'rooms'
+        storage = get_image_storage()
+        name = uuid.uuid4().hex
+        renditions = {
+            rendition: storage.save(data, folder, f"{name}_{rendition}.webp")
+            for rendition, data in encoded.items()
+        }
+        public_id = renditions['full']
+
+        with transaction.atomic():
+            if job.kind == 'main_image':
+                property_instance = Property.objects.get(pk=job.property_id)
+                property_instance.main_image = public_id
+                property_instance.main_image_renditions = renditions
+                property_instance.save(update_fields=['main_image', 'main_image_renditions'])
+            else:
+                job.room_image = RoomImage.objects.create(
+                    property_id=job.property_id, image=public_id, renditions=renditions, description=job.description,
+                )
+            job.public_id = public_id
+            job.status = 'done'
+            job.save()
+        raw_storage.delete(job.raw_path)
+        logger.info(f"Image job {job.pk} done: {public_id}")
+    except Exception as e:
+        logger.exception(f"Image job {job.pk} failed")
+        ImageJob.objects.filter(pk=job.pk).update(status='failed', error=str(e))
+
+
+def requeue_stale_jobs(stale_after=None):
+    """
+    Queue again the jobs claimed more than `stale_after` seconds ago (IMAGE_JOB_STALE_AFTER)
+    and still 'processing': their worker died with them. Returns how many were requeued.
+    """
+    if stale_after is None:
+        stale_after = settings.IMAGE_JOB_STALE_AFTER
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    requeued = ImageJob.objects.filter(status='processing', updated_at__lt=cutoff).update(
+        status='queued', updated_at=timezone.now(),
+    )
+    if requeued:
+        logger.warning(f"Requeued {requeued} stale image job(s)")
+    return requeued
+
+
+def job_status_url(job):
+    return reverse('image-job', args=[job.pk])
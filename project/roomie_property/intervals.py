@@ -0,0 +1,64 @@
+from datetime import date
+
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+RECORDS_TABLE = 'roomie_property_propertytenantrecords'
+
+
+def postgres_stay(table=None):
+    """
+    A tenancy record as a daterange; end_date is the move-out day and is not part of the stay.
+
+    The GiST index of migration 0017 is built on this expression, queries must use the
+    same one for it to apply.
+    """
+    prefix = f'"{table}".' if table else ''
+    return f"daterange({prefix}start_date, {prefix}end_date, '[)')"
+
+
+def as_of_condition(vendor, day):
+    """Records whose stay includes `day`."""
+    if vendor == 'postgresql':
+        return Q(RawSQL(f"{postgres_stay(RECORDS_TABLE)} @> %s::date", [day], output_field=BooleanField()))
+    return Q(start_date__lte=day) & (Q(end_date__isnull=True) | Q(end_date__gt=day))
+
+
+def overlap_condition(vendor, start, end):
+    """Records whose stay shares at least one day with start..end, both included."""
+    if vendor == 'postgresql':
+        return Q(RawSQL(
+            f"{postgres_stay(RECORDS_TABLE)} && daterange(%s::date, %s::date, '[]')", [start, end],
+            output_field=BooleanField(),
+        ))
+    return Q(start_date__lte=end) & (Q(end_date__isnull=True) | Q(end_date__gt=start))
+
+
+def _date(params, name):
+    value = (params.get(name) or '').strip()
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: use YYYY-MM-DD.")
+
+
+def filter_stays(records, params):
+    """
+    Narrow a PropertyTenantRecords queryset from query parameters.
+
+    `on=D` keeps the records of who lived there on D; `from=A&to=B` keeps the stays
+    overlapping A..B (an open side is unbounded). Raises ValueError on malformed or
+    conflicting parameters.
+    """
+    on, start, end = _date(params, 'on'), _date(params, 'from'), _date(params, 'to')
+    if on and (start or end):
+        raise ValueError("Use either on, or from and to.")
+    if on:
+        return records.as_of(on)
+    if start or end:
+        if start and end and start > end:
+            raise ValueError("from must not be after to.")
+        return records.overlapping(start or date.min, end or date.max)
+    return records
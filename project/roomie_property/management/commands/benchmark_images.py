@@ -0,0 +1,61 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from roomie_property.transcode import transcode_renditions
+
+
+def sample_jpeg(width, height, seed):
+    """A photo-like JPEG (gradients plus sensor-style noise) so the encoder has real work to do."""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 24 + seed % 8)
+    img = Image.merge('RGB', (gradient, noise, gradient.rotate(90).resize((width, height))))
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = "Measure the image pipeline transcoding throughput (images per second and per core)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=48, help="Number of images to transcode")
+        parser.add_argument('--size', default='3000x2000', help="Source image size, WIDTHxHEIGHT")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processes in the pool")
+        parser.add_argument('--no-draft', action='store_true', help="Decode at full size (disable JPEG draft mode)")
+
+    def handle(self, *args, **options):
+        try:
+            width, height = (int(value) for value in options['size'].lower().split('x'))
+        except ValueError:
+            raise CommandError("Invalid --size. Use WIDTHxHEIGHT.")
+        workers = max(1, options['workers'])
+        draft = not options['no_draft']
+
+        # A handful of distinct sources is enough, generating them is not what is measured
+        sources = [sample_jpeg(width, height, seed) for seed in range(min(options['images'], 8))]
+        payloads = [sources[i % len(sources)] for i in range(options['images'])]
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            # Warm the pool up so process start-up is not counted
+            list(pool.map(transcode_renditions, sources[:workers]))
+
+            started = time.perf_counter()
+            futures = [pool.submit(transcode_renditions, payload, draft=draft) for payload in payloads]
+            renditions = [future.result() for future in futures]
+            elapsed = time.perf_counter() - started
+
+        per_second = len(renditions) / elapsed
+        cores = min(workers, os.cpu_count() or 1)
+        self.stdout.write(f"images: {len(renditions)} ({width}x{height} JPEG, draft {'on' if draft else 'off'})")
+        self.stdout.write(f"renditions per image: {len(renditions[0]) if renditions else 0}")
+        self.stdout.write(f"workers: {workers} on {cores} core(s)")
+        self.stdout.write(f"elapsed: {elapsed:.2f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"{per_second:.1f} images/s, {per_second / cores:.1f} images/s per core"
+        ))
@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from roomie_property.images import ImagePipeline, requeue_stale_jobs
+from roomie_property.models import ImageJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Process the queued image jobs with the image pipeline pools, after queueing again the ones "
+        "stuck in processing. With --watch it keeps polling and serves as the image worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, help="Transcoding processes (defaults to IMAGE_PIPELINE_PROCESSES)")
+        parser.add_argument('--threads', type=int, help="Storage threads (defaults to IMAGE_PIPELINE_THREADS)")
+        parser.add_argument(
+            '--stale-after', type=int,
+            help="Seconds after which a processing job is considered abandoned (defaults to IMAGE_JOB_STALE_AFTER)",
+        )
+        parser.add_argument('--watch', action='store_true', help="Keep polling the queue instead of exiting once it is empty")
+        parser.add_argument('--interval', type=float, help="Seconds between polls with --watch (defaults to IMAGE_JOB_POLL_INTERVAL)")
+
+    def handle(self, *args, **options):
+        pipeline = ImagePipeline(processes=options['processes'], threads=options['threads'])
+        try:
+            while True:
+                processed = self.process_queue(pipeline, options['stale_after'])
+                if not options['watch']:
+                    if not processed:
+                        self.stdout.write("No queued image jobs.")
+                    break
+                if not processed:
+                    time.sleep(options['interval'] or settings.IMAGE_JOB_POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pipeline.shutdown()
+
+    def process_queue(self, pipeline, stale_after):
+        """Run every job queued right now; returns how many there were."""
+        requeued = requeue_stale_jobs(stale_after)
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale image job(s)."))
+
+        job_ids = list(ImageJob.objects.filter(status='queued').order_by('pk').values_list('pk', flat=True))
+        if not job_ids:
+            return 0
+
+        for future in [pipeline.submit(job_id) for job_id in job_ids]:
+            future.result()
+
+        statuses = dict(ImageJob.objects.filter(pk__in=job_ids).values_list('pk', 'status'))
+        failed = [job_id for job_id, job_status in statuses.items() if job_status == 'failed']
+        for job_id in failed:
+            self.stdout.write(self.style.ERROR(f"Image job {job_id} failed."))
+        self.stdout.write(self.style.SUCCESS(f"Processed {len(job_ids) - len(failed)} of {len(job_ids)} image job(s)."))
+        return len(job_ids)
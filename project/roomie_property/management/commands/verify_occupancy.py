@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from roomie_property.occupancy import occupancy_drift, repair_occupancy
+
+
+class Command(BaseCommand):
+    help = "Check Property.current_occupancy against the open tenancy records, and repair it with --fix."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Reset the drifted counts from the tenancy records")
+        parser.add_argument('--property', type=int, action='append', dest='properties',
+                            help="Only check this property id (can be repeated)")
+
+    def handle(self, *args, **options):
+        drift = repair_occupancy(options['properties']) if options['fix'] else occupancy_drift(options['properties'])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Occupancy counts are consistent."))
+            return
+
+        for property_id, stored, actual in drift:
+            self.stdout.write(f"Property {property_id}: stored {stored}, actual {actual}")
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(drift)} property occupancy count(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} property occupancy count(s) drifted; run with --fix to repair."))
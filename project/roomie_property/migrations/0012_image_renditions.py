@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roomie_property', '0011_imagejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='main_image_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='roomimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:22
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    from roomie_property.search import create_search_index
+    create_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from roomie_property.search import drop_search_index
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roomie_property', '0012_image_renditions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(django.db.models.functions.text.Lower('town'), models.F('rent_amount'), name='property_town_rent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(django.db.models.functions.text.Lower('county'), models.F('rent_amount'), name='property_county_rent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['rent_amount'], name='property_rent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['people_capacity', 'room_capacity'], name='property_capacity_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
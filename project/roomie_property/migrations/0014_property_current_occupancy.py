@@ -0,0 +1,43 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:24
+
+import django.db.models.expressions
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_occupancy(apps, schema_editor):
+    Property = apps.get_model('roomie_property', 'Property')
+    properties = Property.objects.annotate(
+        open_records=Count('tenant_history', filter=Q(tenant_history__end_date__isnull=True)),
+    ).filter(open_records__gt=0)
+    for property_id, open_records in properties.values_list('pk', 'open_records'):
+        Property.objects.filter(pk=property_id).update(current_occupancy=open_records)
+
+
+def restore_search_triggers(apps, schema_editor):
+    """Adding a column rebuilds the property table on SQLite, which drops the FTS5 triggers of 0013."""
+    from roomie_property.search import restore_search_triggers
+    restore_search_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roomie_property', '0013_property_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='current_occupancy',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_occupancy, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('people_capacity'), '-', models.F('current_occupancy')), name='property_vacancies_idx'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
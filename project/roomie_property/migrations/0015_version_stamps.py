@@ -0,0 +1,25 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roomie_property', '0014_property_current_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionStamp',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('property', 'Property'), ('owner', 'Owner'), ('tenant', 'Tenant')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'object_id'), name='versionstamp_scope_object_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roomie_property', '0015_version_stamps'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tenancyrequest',
+            index=models.Index(fields=['owner', 'status', '-request_date'], name='tenancyreq_owner_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenancyrequest',
+            index=models.Index(fields=['tenant', 'status', '-request_date'], name='tenancyreq_tenant_status_idx'),
+        ),
+    ]
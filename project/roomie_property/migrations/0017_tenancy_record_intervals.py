@@ -0,0 +1,46 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_stay_index(apps, schema_editor):
+    """
+    GiST index over the stay of every tenancy record on Postgres, on the expression of
+    roomie_property.intervals.postgres_stay(). Other databases answer the same queries
+    from the btree indexes below.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS tenantrec_stay_gist_idx ON roomie_property_propertytenantrecords "
+            "USING GIST (daterange(start_date, end_date, '[)'))"
+        )
+
+
+def drop_stay_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP INDEX IF EXISTS tenantrec_stay_gist_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roomie_property', '0016_tenancy_request_listing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='propertytenantrecords',
+            index=models.Index(fields=['property', 'start_date', 'end_date'], name='tenantrec_property_span_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propertytenantrecords',
+            index=models.Index(fields=['tenant', 'start_date'], name='tenantrec_tenant_start_idx'),
+        ),
+        migrations.RunPython(create_stay_index, drop_stay_index),
+    ]
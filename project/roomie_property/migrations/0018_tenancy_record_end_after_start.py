@@ -0,0 +1,26 @@
+# Generated by Django 5.1.5 on 2026-10-18 02:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def close_backwards_stays(apps, schema_editor):
+    """Records ending before they start would fail the constraint; keep them as zero-length stays."""
+    PropertyTenantRecords = apps.get_model('roomie_property', 'PropertyTenantRecords')
+    PropertyTenantRecords.objects.filter(end_date__lt=models.F('start_date')).update(end_date=models.F('start_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roomie_property', '0017_tenancy_record_intervals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(close_backwards_stays, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='propertytenantrecords',
+            constraint=models.CheckConstraint(condition=models.Q(('end_date__isnull', True), ('end_date__gte', models.F('start_date')), _connector='OR'), name='tenantrec_end_after_start'),
+        ),
+    ]
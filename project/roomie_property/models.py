@@ -1,24 +1,104 @@
 from django.db import models
 from django.apps import apps
-from django.db import models
+from django.db import connections, models, transaction
 from django.contrib.auth.models import User
 from django.utils.timezone import now
 from cloudinary.models import CloudinaryField
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 
 
+class PropertyTenantRecordsQuerySet(models.QuerySet):
+    """
+    Point-in-time queries; a stay runs from start_date up to, not including, end_date
+    (the move-out day, which is the next tenancy's start_date).
+
+    Postgres matches stays as dateranges against their GiST index, other databases
+    compare the dates using the btree indexes.
+    """
+
+    def as_of(self, day):
+        """Records of the tenants living at their property on `day`."""
+        from .intervals import as_of_condition
+        return self.filter(as_of_condition(connections[self.db].vendor, day))
+
+    def overlapping(self, start, end):
+        """Records of the tenants who lived at their property on any day from `start` to `end`, both included."""
+        from .intervals import overlap_condition
+        return self.filter(overlap_condition(connections[self.db].vendor, start, end))
+
+
 class PropertyTenantRecords(models.Model):
     property = models.ForeignKey('Property', related_name='tenant_history', on_delete=models.CASCADE)
     tenant = models.ForeignKey(User, related_name='tenant_history', on_delete=models.CASCADE)
     start_date = models.DateField(default=now)
     end_date = models.DateField(null=True, blank=True)
 
+    objects = PropertyTenantRecordsQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # as_of() / overlapping() per property or portfolio, and a tenant's history
+            models.Index(fields=['property', 'start_date', 'end_date'], name='tenantrec_property_span_idx'),
+            models.Index(fields=['tenant', 'start_date'], name='tenantrec_tenant_start_idx'),
+        ]
+        constraints = [
+            # A stay can not end before it starts: daterange() rejects such rows on Postgres
+            models.CheckConstraint(
+                condition=models.Q(end_date__isnull=True) | models.Q(end_date__gte=models.F('start_date')),
+                name='tenantrec_end_after_start',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.tenant.username} ({self.start_date} - {self.end_date or 'Present'})"
 
+    def save(self, *args, **kwargs):
+        """Keep Property.current_occupancy in step when a record is opened, closed or moved."""
+        from .occupancy import adjust_occupancy
+
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = PropertyTenantRecords.objects.filter(pk=self.pk).values('property_id', 'end_date').first()
+
+            super().save(*args, **kwargs)
+
+            deltas = {}
+            if previous and previous['end_date'] is None:
+                deltas[previous['property_id']] = -1
+            if self.end_date is None:
+                deltas[self.property_id] = deltas.get(self.property_id, 0) + 1
+            adjust_occupancy(deltas)
+
+
+class PropertyQuerySet(models.QuerySet):
+    def with_tenants(self):
+        """
+        Load what PropertySerializer reads in a fixed number of queries, room images aside.
+
+        The current tenancy records (with their tenant) land in `current_tenant_records`,
+        which current_tenant() and all_current_tenant() read instead of querying per property.
+        """
+        return self.select_related('owner', 'property_supervisor').prefetch_related(
+            models.Prefetch(
+                'tenant_history',
+                queryset=PropertyTenantRecords.objects.filter(end_date__isnull=True).select_related('tenant').order_by('pk'),
+                to_attr='current_tenant_records',
+            ),
+        )
+
+    def with_room_images(self):
+        """Prefetch the room images, for the shapes that serialize them (the compact list shape does not)."""
+        return self.prefetch_related('room_images')
+
+    def with_vacancy(self):
+        """Properties with room for one more tenant, read from the maintained occupancy count (no join)."""
+        return self.alias(vacancies=models.F('people_capacity') - models.F('current_occupancy')).filter(vacancies__gt=0)
+
 
 class Property(models.Model):
     # Address-related fields
@@ -35,16 +115,33 @@ class Property(models.Model):
     people_capacity = models.PositiveIntegerField()
     rent_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True)
     deposit_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, default=0.00)
+    # Number of open PropertyTenantRecords, maintained by roomie_property.occupancy
+    # (verify_occupancy checks and repairs it)
+    current_occupancy = models.IntegerField(default=0, editable=False)
 
     owner = models.ForeignKey(User, related_name='owned_properties', on_delete=models.CASCADE)
     property_supervisor = models.ForeignKey(User, related_name='supervised_properties', on_delete=models.SET_NULL, null=True, blank=True)
 
     # Main property image
     main_image = CloudinaryField('main_image', null=True, blank=True)
+    main_image_renditions = models.JSONField(default=dict, blank=True)  # Rendition name -> public id
 
     # Additional room images
     additional_images = models.ManyToManyField('RoomImage', related_name='properties', blank=True)
 
+    objects = PropertyQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Property search (roomie_property.search): town/county matched case-insensitively, then a rent range
+            models.Index(Lower('town'), 'rent_amount', name='property_town_rent_idx'),
+            models.Index(Lower('county'), 'rent_amount', name='property_county_rent_idx'),
+            models.Index(fields=['rent_amount'], name='property_rent_idx'),
+            models.Index(fields=['people_capacity', 'room_capacity'], name='property_capacity_idx'),
+            # Same expression as PropertyQuerySet.with_vacancy()
+            models.Index(models.F('people_capacity') - models.F('current_occupancy'), name='property_vacancies_idx'),
+        ]
+
     def __str__(self):
         return f"Property {self.house_number} {self.street}, {self.town}, {self.county}, {self.country}"
 
@@ -53,18 +150,22 @@ class Property(models.Model):
         return f"{self.house_number} {self.street}, {self.town}, {self.county}, {self.country}"
     
     def all_current_tenant(self):
-        """Fetch all current tenants."""
+        """Fetch all current tenants (from the prefetch of PropertyQuerySet.with_tenants() when present)."""
+        if hasattr(self, 'current_tenant_records'):
+            return self.current_tenant_records
         return self.tenant_history.filter(end_date__isnull=True)
     
     def current_tenant(self):
         """Fetch the current tenant."""
+        if hasattr(self, 'current_tenant_records'):
+            return next(iter(self.current_tenant_records), None)
         return self.tenant_history.filter(end_date__isnull=True).first()
 
     def add_tenant(self, tenant, start_date=None):
         """Add a new tenant and end the current tenant's lease."""
         current_tenant = self.current_tenant()
         if current_tenant:
-            current_tenant.end_date = start_date or now().date()
+            current_tenant.end_date = max(start_date or now().date(), current_tenant.start_date)
             current_tenant.save()
 
         PropertyTenantRecords.objects.create(
@@ -72,18 +173,82 @@ class Property(models.Model):
             tenant=tenant,
             start_date=start_date or now().date()
         )
+        self.__dict__.pop('current_tenant_records', None)  # Drop a stale prefetch
 
 class RoomImage(models.Model):
     # Foreign key to Property
     property = models.ForeignKey(Property, related_name='room_images', on_delete=models.CASCADE)
 
     image = CloudinaryField('image')
+    renditions = models.JSONField(default=dict, blank=True)  # Rendition name -> public id
     description = models.CharField(max_length=255)
     
     def __str__(self):
         return self.description or "No description"
 
 
+class ImageJob(models.Model):
+    """An uploaded image waiting to be transcoded and stored by the image pipeline (roomie_property.images)."""
+    KIND_CHOICES = [
+        ('main_image', 'Main image'),
+        ('room_image', 'Room image'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    property = models.ForeignKey(Property, related_name='image_jobs', on_delete=models.CASCADE)
+    created_by = models.ForeignKey(User, related_name='image_jobs', on_delete=models.SET_NULL, null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    raw_path = models.CharField(max_length=255)  # Raw upload in the local job storage
+    description = models.CharField(max_length=255, blank=True, default='')
+    room_image = models.ForeignKey(RoomImage, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    public_id = models.CharField(max_length=255, blank=True, default='')  # Where the processed image was stored
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Image job {self.pk} ({self.kind}) for property {self.property_id} - {self.status}"
+
+
+class VersionStamp(models.Model):
+    """
+    Version counter of a cached resource, bumped on every write that changes it.
+
+    Backs the ETags of the conditional GETs (roomie_property.versioning): `property`
+    stamps one property, `owner` everything an owner's dashboard and request inbox
+    show, `tenant` the tenancy requests a tenant sent.
+    """
+    SCOPE_CHOICES = [
+        ('property', 'Property'),
+        ('owner', 'Owner'),
+        ('tenant', 'Tenant'),
+    ]
+
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    object_id = models.BigIntegerField()
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'object_id'], name='versionstamp_scope_object_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.object_id} v{self.version}"
+
+
+class TenancyRequestQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Load everything TenancyRequestSerializer reads (tenant profile, property, owner) in the same query."""
+        return self.select_related('tenant__custom_user_profile', 'property', 'owner')
+
+
 class TenancyRequest(models.Model):
     tenant = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tenancy_requests")
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name="tenancy_requests")
@@ -94,6 +259,15 @@ class TenancyRequest(models.Model):
         choices=[("pending", "Pending"), ("approved", "Approved"), ("rejected", "Rejected")],
         default="pending"
     )
+
+    objects = TenancyRequestQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Owner inbox and tenant list: filtered by status, newest first
+            models.Index(fields=['owner', 'status', '-request_date'], name='tenancyreq_owner_status_idx'),
+            models.Index(fields=['tenant', 'status', '-request_date'], name='tenancyreq_tenant_status_idx'),
+        ]
     
     def tenant_first_name(self):
         """Return the first name of the tenant."""
@@ -123,53 +297,13 @@ class TenancyRequest(models.Model):
             return None
         
     def approve(self):
-        """Approve the tenancy request and update tenant's address history."""
-        from roomie_user.models import CustomUser, AddressHistory
-        from roomie_property.models import PropertyTenantRecords
+        """Approve the tenancy request and move the tenant in (see roomie_property.tenancy); raises ValueError unless pending."""
+        from roomie_property.tenancy import approve_tenancy_request
 
-        # Set status to approved
+        approve_tenancy_request(self.pk)
         self.status = "approved"
-        self.save()
 
         print(f"TenancyRequest {self.id} approved.")
-
-        # Get tenant's CustomUser profile
-        try:
-            custom_user = self.tenant.custom_user_profile
-        except CustomUser.DoesNotExist:
-            print(f"CustomUser profile not found for {self.tenant}")
-            return  # Exit if the CustomUser profile does not exist
-
-        # Check if the user already has a current address
-        if custom_user.address:
-            # Set end date for previous address in AddressHistory
-            AddressHistory.objects.filter(
-                user=custom_user, address=custom_user.address, end_date__isnull=True
-            ).update(end_date=timezone.now())
-
-            # Set end date for previous record in PropertyTenantRecords
-            PropertyTenantRecords.objects.filter(
-                tenant=self.tenant, property=custom_user.address, end_date__isnull=True
-            ).update(end_date=timezone.now())
-
-        # Update the user's current address
-        custom_user.address = self.property
-        custom_user.has_address = True
-        custom_user.save()
-
-        # Create new AddressHistory entry
-        AddressHistory.objects.create(
-            user=custom_user,
-            address=self.property,
-            start_date=timezone.now(),
-        )
-
-        # Create new PropertyTenantRecords entry
-        PropertyTenantRecords.objects.create(
-            property=self.property,
-            tenant=self.tenant,
-            start_date=timezone.now(),
-        )
         
     def reject(self):
         """Reject the tenancy request."""
@@ -191,4 +325,12 @@ def send_notification_on_request_creation(sender, instance, created, **kwargs):
             sender=instance.tenant,       # Tenant is the sender
             receiver=instance.property.owner,  # Property owner is the receiver
             message=message
-        )
\ No newline at end of file
+        )
+
+
+@receiver(post_delete, sender=PropertyTenantRecords)
+def release_occupancy_on_record_delete(sender, instance, **kwargs):
+    """A deleted open tenancy record no longer occupies its property."""
+    from .occupancy import adjust_occupancy
+    if instance.end_date is None:
+        adjust_occupancy({instance.property_id: -1})
@@ -0,0 +1,81 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, DateField, F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Property, PropertyTenantRecords
+from .versioning import bump_properties
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def adjust_occupancy(deltas):
+    """
+    Apply {property id: change in open tenancy records} to Property.current_occupancy.
+
+    Each change is an `F() + delta` UPDATE, so concurrent writers add up instead of
+    overwriting each other's counts.
+    """
+    with transaction.atomic(savepoint=False):
+        for property_id, delta in deltas.items():
+            if delta:
+                Property.objects.filter(pk=property_id).update(current_occupancy=F('current_occupancy') + delta)
+
+
+def close_tenancies(records, end_date=None):
+    """
+    End the open tenancy records of the `records` queryset and update the occupancy counts.
+
+    Use instead of `records.update(end_date=...)`, which would leave the counts behind.
+    Returns the number of records closed.
+    """
+    end_date = end_date or timezone.now().date()
+    with transaction.atomic():
+        open_records = records.filter(end_date__isnull=True).select_for_update()
+        closing = list(open_records.values_list('pk', 'property_id'))
+        if not closing:
+            return 0
+
+        # A stay that has not started yet ends on its first day (tenantrec_end_after_start)
+        PropertyTenantRecords.objects.filter(pk__in=[pk for pk, property_id in closing]).update(
+            end_date=Greatest('start_date', Value(end_date, output_field=DateField())),
+        )
+        deltas = defaultdict(int)
+        for pk, property_id in closing:
+            deltas[property_id] -= 1
+        adjust_occupancy(deltas)
+        bump_properties(deltas)  # The UPDATE above sends no signals
+    return len(closing)
+
+
+def occupancy_drift(property_ids=None):
+    """Properties whose stored current_occupancy differs from their open tenancy records, as (id, stored, actual)."""
+    properties = Property.objects.all()
+    if property_ids is not None:
+        properties = properties.filter(pk__in=property_ids)
+    counted = properties.annotate(
+        actual=Count('tenant_history', filter=Q(tenant_history__end_date__isnull=True)),
+    ).exclude(current_occupancy=F('actual')).order_by('pk')
+    return list(counted.values_list('pk', 'current_occupancy', 'actual'))
+
+
+def repair_occupancy(property_ids=None):
+    """Reset drifted current_occupancy counts from the tenancy records; returns the drift that was fixed."""
+    with transaction.atomic():
+        drift = occupancy_drift(property_ids)
+        if drift:
+            # Lock the rows and count again so a tenancy opened meanwhile is not lost
+            locked = [pk for pk, stored, actual in drift]
+            list(Property.objects.select_for_update().filter(pk__in=locked).values_list('pk'))
+            drift = occupancy_drift(locked)
+            Property.objects.bulk_update(
+                [Property(pk=pk, current_occupancy=actual) for pk, stored, actual in drift], ['current_occupancy']
+            )
+            bump_properties(pk for pk, stored, actual in drift)
+    if drift:
+        logger.warning(f"Repaired the occupancy of {len(drift)} propert{'y' if len(drift) == 1 else 'ies'}")
+    return drift
@@ -0,0 +1,82 @@
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When, Window
+from django.db.models.functions import Cast, Coalesce, NullIf, PercentRank
+
+from cash_flow.models import PropertyBilling, TenantBilling
+
+from .models import TenancyRequest
+
+# Weight of each component in the applicant score; the components are all between 0 and 1
+SCORE_WEIGHTS = {
+    'rating': 0.4,
+    'punctuality': 0.3,
+    'waiting': 0.2,
+    'capacity': 0.1,
+}
+NEUTRAL_RATING = 2.5  # Applicants without a profile
+NEUTRAL_PUNCTUALITY = 0.5  # Applicants without settled payments
+MAX_RATING = 5.0
+
+
+def _settled_billings(model, aggregate):
+    """`aggregate` over the applicant's settled billings of `model` that have a deadline, 0 without any."""
+    settled = model.objects.filter(
+        tenant=OuterRef('tenant_id'), status='paid', deadline__isnull=False,
+    ).order_by().values('tenant').annotate(total=aggregate).values('total')
+    return Coalesce(Subquery(settled, output_field=FloatField()), Value(0.0))
+
+
+def punctuality_subquery():
+    """
+    Share of the applicant's settled billings paid by their deadline, NULL without any.
+
+    Rent (TenantBilling) and shares of property bills (PropertyBilling) count alike.
+    """
+    on_time = Sum(Case(
+        When(Q(paid_at__date__lte=F('deadline')), then=Value(1.0)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    ))
+    paid_on_time = _settled_billings(TenantBilling, on_time) + _settled_billings(PropertyBilling, on_time)
+    settled = _settled_billings(TenantBilling, Count('pk')) + _settled_billings(PropertyBilling, Count('pk'))
+    return paid_on_time / NullIf(settled, Value(0.0))
+
+
+def rank_applicants(property_id):
+    """
+    The property's pending tenancy requests, best applicant first, scored in one query.
+
+    score = weighted sum of
+      rating:      the tenant's user_rating_in_app out of 5
+      punctuality: share of the tenant's settled rent and property bill shares paid
+                   (paid_at) by their deadline
+      waiting:     PERCENT_RANK() of the request age among the property's applicants,
+                   1 for the one waiting longest
+      capacity:    share of the property's places still free
+
+    Every component is computed by the database, so a page of applicants is one
+    query however many apply.
+    """
+    rating = Cast(Coalesce('tenant__custom_user_profile__user_rating_in_app', Value(NEUTRAL_RATING)),
+                  FloatField()) / MAX_RATING
+    punctuality = Coalesce(punctuality_subquery(), Value(NEUTRAL_PUNCTUALITY))
+    waiting = Window(PercentRank(), partition_by=F('property_id'), order_by=F('request_date').desc())
+    free_places = Cast(F('property__people_capacity') - F('property__current_occupancy'), FloatField())
+    capacity = Case(
+        When(Q(property__people_capacity__gt=0), then=free_places / Cast(F('property__people_capacity'), FloatField())),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+    return TenancyRequest.objects.for_listing().filter(property_id=property_id, status='pending').annotate(
+        rating_score=rating,
+        punctuality_score=punctuality,
+        waiting_score=waiting,
+        capacity_score=capacity,
+    ).annotate(
+        score=(
+            SCORE_WEIGHTS['rating'] * F('rating_score')
+            + SCORE_WEIGHTS['punctuality'] * F('punctuality_score')
+            + SCORE_WEIGHTS['waiting'] * F('waiting_score')
+            + SCORE_WEIGHTS['capacity'] * F('capacity_score')
+        ),
+    ).order_by('-score', 'request_date', 'pk')
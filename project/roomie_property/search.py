@@ -0,0 +1,213 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from .models import Property
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROPERTY_TABLE = 'roomie_property_property'
+FTS_TABLE = 'roomie_property_property_fts'
+POSTGRES_INDEX = 'property_search_gin_idx'
+FTS_COLUMNS = "street, town, description"
+
+
+def postgres_document(table=None):
+    """The tsvector expression of the GIN index; queries must use the same one for the index to apply."""
+    prefix = f'"{table}".' if table else ''
+    return (
+        f"to_tsvector('english', coalesce({prefix}street, '') || ' ' || coalesce({prefix}town, '') "
+        f"|| ' ' || coalesce({prefix}description, ''))"
+    )
+
+
+SORTS = {
+    'relevance': ['-relevance', 'pk'],
+    'rent': ['rent_amount', 'pk'],
+    '-rent': ['-rent_amount', 'pk'],
+    'rating': ['property_rating', 'pk'],
+    '-rating': ['-property_rating', 'pk'],
+    'newest': ['-pk'],
+}
+
+
+def sqlite_triggers():
+    """The triggers keeping the FTS5 table in step with the property table."""
+    new_values = "new.id, new.street, new.town, new.description"
+    old_values = "'delete', old.id, old.street, old.town, old.description"
+    return {
+        f"{FTS_TABLE}_ai": f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {PROPERTY_TABLE} BEGIN "
+                           f"INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS}) VALUES ({new_values}); END",
+        f"{FTS_TABLE}_ad": f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {PROPERTY_TABLE} BEGIN "
+                           f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {FTS_COLUMNS}) VALUES ({old_values}); END",
+        f"{FTS_TABLE}_au": f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {PROPERTY_TABLE} BEGIN "
+                           f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {FTS_COLUMNS}) VALUES ({old_values}); "
+                           f"INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS}) VALUES ({new_values}); END",
+    }
+
+
+def create_search_index(db_connection):
+    """
+    Full-text index over street, town and description (migration 0013).
+
+    Postgres gets a GIN index on the tsvector expression; SQLite (local runs) gets an
+    external-content FTS5 table kept in sync by triggers. Other databases fall back
+    to LIKE matching in search_properties().
+    """
+    vendor = db_connection.vendor
+    if vendor == 'postgresql':
+        statements = [f"CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON {PROPERTY_TABLE} USING GIN ({postgres_document()})"]
+    elif vendor == 'sqlite':
+        statements = [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({FTS_COLUMNS}, content='{PROPERTY_TABLE}', content_rowid='id')",
+            *sqlite_triggers().values(),
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+        ]
+    else:
+        statements = []
+
+    with db_connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def drop_search_index(db_connection):
+    vendor = db_connection.vendor
+    statements = []
+    if vendor == 'postgresql':
+        statements = [f"DROP INDEX IF EXISTS {POSTGRES_INDEX}"]
+    elif vendor == 'sqlite':
+        statements = [f"DROP TRIGGER IF EXISTS {name}" for name in sqlite_triggers()]
+        statements.append(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+    with db_connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def restore_search_triggers(db_connection):
+    """
+    Put back missing FTS5 triggers and reindex; returns whether any were missing.
+
+    SQLite drops a table's triggers when a migration rebuilds it, which most
+    AddField/AlterField operations on Property do. Migration 0014 calls this, and so
+    does every migrate run (post_migrate), so later migrations can not silently
+    leave the index behind.
+    """
+    if db_connection.vendor != 'sqlite':
+        return False
+    with db_connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                       [f"{FTS_TABLE}%"])
+        existing = {row[0] for row in cursor.fetchall()}
+        triggers = sqlite_triggers()
+        if FTS_TABLE not in existing or existing.issuperset(triggers):
+            return False
+        for statement in triggers.values():
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def restore_search_triggers_after_migrate(using, **kwargs):
+    if restore_search_triggers(connections[using]):
+        logger.warning("Restored the property search triggers dropped by a table rebuild")
+
+
+def search_backend():
+    """'postgres', 'fts5' or 'like', depending on the database and whether the SQLite FTS table exists."""
+    if connection.vendor == 'postgresql':
+        return 'postgres'
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            if cursor.fetchone():
+                return 'fts5'
+    return 'like'
+
+
+def fts5_query(text):
+    """Quote every word so user input can not inject FTS5 syntax; words are ANDed and prefix matched."""
+    words = [word.replace('"', '') for word in text.split()]
+    return " ".join(f'"{word}"*' for word in words if word)
+
+
+def _decimal(value):
+    try:
+        return Decimal(value) if value not in (None, '') else None
+    except InvalidOperation:
+        raise ValueError(f"Invalid number: {value}")
+
+
+def _integer(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        raise ValueError(f"Invalid number: {value}")
+
+
+def search_properties(params, queryset=None):
+    """
+    Filter and sort properties from query parameters.
+
+    Filters: town, county (case insensitive), min_rent, max_rent, min_rooms,
+    min_people, min_rating, has_vacancy (true/false), and `q` for full-text search over street, town and
+    description. `sort` is one of SORTS; it defaults to relevance when `q` is given
+    and to newest otherwise. Raises ValueError on malformed parameters.
+    """
+    queryset = Property.objects.all() if queryset is None else queryset
+
+    # Lower() on both sides so the (lower(town), rent_amount) style indexes are used
+    if params.get('town'):
+        queryset = queryset.alias(town_lower=Lower('town')).filter(town_lower=params['town'].strip().lower())
+    if params.get('county'):
+        queryset = queryset.alias(county_lower=Lower('county')).filter(county_lower=params['county'].strip().lower())
+
+    ranges = {
+        'rent_amount__gte': _decimal(params.get('min_rent')),
+        'rent_amount__lte': _decimal(params.get('max_rent')),
+        'room_capacity__gte': _integer(params.get('min_rooms')),
+        'people_capacity__gte': _integer(params.get('min_people')),
+        'property_rating__gte': _decimal(params.get('min_rating')),
+    }
+    queryset = queryset.filter(**{lookup: value for lookup, value in ranges.items() if value is not None})
+
+    has_vacancy = (params.get('has_vacancy') or '').strip().lower()
+    if has_vacancy in ('true', '1', 'yes'):
+        queryset = queryset.with_vacancy()
+    elif has_vacancy not in ('', 'false', '0', 'no'):
+        raise ValueError(f"Invalid has_vacancy: {params['has_vacancy']}")
+
+    text = (params.get('q') or '').strip()
+    if text:
+        backend = search_backend()
+        if backend == 'postgres':
+            document = postgres_document(PROPERTY_TABLE)
+            tsquery = "plainto_tsquery('english', %s)"
+            queryset = queryset.annotate(
+                relevance=RawSQL(f"ts_rank({document}, {tsquery})", [text], output_field=FloatField()),
+            ).filter(RawSQL(f"{document} @@ {tsquery}", [text], output_field=BooleanField()))
+        elif backend == 'fts5' and fts5_query(text):
+            match = f"{FTS_TABLE} MATCH %s"
+            # bm25() is lower for better matches
+            queryset = queryset.annotate(
+                relevance=RawSQL(
+                    f"(SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} WHERE {match} AND rowid = {PROPERTY_TABLE}.id)",
+                    [fts5_query(text)], output_field=FloatField(),
+                ),
+            ).filter(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {match}", [fts5_query(text)]))
+        else:
+            match = Q()
+            for word in text.split():
+                match &= Q(street__icontains=word) | Q(town__icontains=word) | Q(description__icontains=word)
+            queryset = queryset.filter(match).annotate(relevance=Value(0.0, output_field=FloatField()))
+
+    sort = params.get('sort') or ('relevance' if text else 'newest')
+    if sort not in SORTS or (sort == 'relevance' and not text):
+        raise ValueError(f"Invalid sort. Use one of: {', '.join(SORTS)} (relevance needs q).")
+    return queryset.order_by(*SORTS[sort])
@@ -1,21 +1,66 @@
 from rest_framework import serializers
-from .models import Property, PropertyTenantRecords, RoomImage, TenancyRequest
+from rest_framework.permissions import SAFE_METHODS
+from .models import Property, PropertyTenantRecords, RoomImage, TenancyRequest, ImageJob
 from django.contrib.auth.models import User
 
 
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets for model serializers.
+
+    `?fields=id,street` keeps only the listed fields and `?expand=room_images` adds
+    fields to the ones kept. Views can pass `fields=` as the default shape, which the
+    query parameter overrides; without either every field is serialized.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        # Only reads are trimmed, a write must still see every writable field
+        request = self.context.get('request')
+        params = request.query_params if request is not None and request.method in SAFE_METHODS else {}
+        requested = [name.strip() for name in params.get('fields', '').split(',') if name.strip()]
+        expand = [name.strip() for name in params.get('expand', '').split(',') if name.strip()]
+
+        keep = requested or fields
+        if keep is None:
+            return
+        keep = set(keep) | set(expand)
+        for name in set(self.fields) - keep:
+            self.fields.pop(name)
+
+
+def rendition_urls(renditions):
+    """Turn a {rendition: public id} mapping into {rendition: URL}."""
+    from .images import image_url
+    return {name: image_url(public_id) for name, public_id in (renditions or {}).items()}
+
+
+class ImageURLField(serializers.ImageField):
+    """Accepts an uploaded image and returns the stored image's delivery URL (memoized, see images.image_url)."""
+
+    def to_representation(self, value):
+        from .images import image_url
+        return image_url(value) if value else None
+
 
 class RoomImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    renditions = serializers.SerializerMethodField()
 
     def get_image_url(self, obj):
-        """Construct the full Cloudinary image URL using the stored public ID."""
-        if obj.image:  # Ensure image is not None
-            return f"https://res.cloudinary.com/dg0ssec7u/image/upload/{obj.image}"
-        return None  # Return None if no image exists
+        """Construct the full image URL (Cloudinary or the local stand-in) from the stored public ID."""
+        from .images import image_url
+        return image_url(obj.image)  # None if no image exists
 
     class Meta:
         model = RoomImage
-        fields = ['id', 'property', 'image', 'image_url', 'description']  # Include property_id
+        fields = ['id', 'property', 'image', 'image_url', 'renditions', 'description']  # Include property_id
+
+    def get_renditions(self, obj):
+        """URLs of the thumbnail/card/full WebP renditions made by the image pipeline."""
+        return rendition_urls(obj.renditions)
 
     def create(self, validated_data):
         """Ensure property_id is correctly assigned when creating a RoomImage."""
@@ -44,26 +89,34 @@ class PropertyTenantRecordsSerializer(serializers.ModelSerializer):
         model = PropertyTenantRecords
         fields = ['property','tenant_username', 'tenant', 'start_date', 'end_date']
 
-class PropertySerializer(serializers.ModelSerializer):
+class PropertySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     current_tenant = PropertyTenantRecordsSerializer(many=False, read_only=True)
     all_current_tenant = PropertyTenantRecordsSerializer(many=True, read_only=True)
-    tenant_history = PropertyTenantRecordsSerializer(many=True, read_only=True) 
 
     property_supervisor_name = serializers.CharField(source='property_supervisor.username', read_only=True)
     owner_username = serializers.CharField(source='owner.username', read_only=True)
     folio_number = serializers.CharField(required=False, allow_blank=True, max_length=50)  # This makes folio_number writable and allows blanks
-    main_image = serializers.ImageField(required=False, allow_null=True)    
+    main_image = ImageURLField(required=False, allow_null=True)
+    main_image_renditions = serializers.SerializerMethodField()
     room_images = RoomImageSerializer(required=False, many=True)
     air_code = serializers.CharField(max_length=10, allow_blank=True, required=False)
     description = serializers.CharField(allow_blank=True, required=False)
     class Meta:
         model = Property
         fields = ['id', 'street', 'house_number', 'town', 'county', 'country', 'property_rating', 
-                  'room_capacity', 'people_capacity', 'owner', 'owner_username', 'deposit_amount', 
+                  'room_capacity', 'people_capacity', 'current_occupancy', 'owner', 'owner_username', 'deposit_amount', 
                   'rent_amount', 'property_supervisor', 'property_supervisor_name',
-                  'main_image', 'room_images',
-                  'current_tenant', 'tenant_history', 'all_current_tenant', 'folio_number',
+                  'main_image', 'main_image_renditions', 'room_images',
+                  'current_tenant', 'all_current_tenant', 'folio_number',
                   'air_code', 'description']
+        # Compact shape of the property lists; the tenant history has its own
+        # paginated endpoint (properties/<id>/tenant-history/)
+        list_fields = ['id', 'street', 'house_number', 'town', 'county', 'country', 'property_rating',
+                       'room_capacity', 'people_capacity', 'current_occupancy', 'owner', 'owner_username', 'deposit_amount',
+                       'rent_amount', 'main_image', 'main_image_renditions', 'current_tenant']
+
+    def get_main_image_renditions(self, obj):
+        return rendition_urls(obj.main_image_renditions)
     
     
     def update(self, instance, validated_data):
@@ -92,11 +145,29 @@ class PropertySerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+class ImageJobSerializer(serializers.ModelSerializer):
+    status_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImageJob
+        fields = ['id', 'property', 'kind', 'status', 'status_url', 'room_image', 'public_id', 'error',
+                  'created_at', 'updated_at']
+
+    def get_status_url(self, obj):
+        from .images import job_status_url
+        return job_status_url(obj)
+
 class OwnerPropertiesSerializer(serializers.ModelSerializer):
     class Meta:
         model = Property
         fields = ['id', 'street', 'house_number', 'town', 'county', 'country', 'property_rating', 'rent_amount', 'deposit_amount', 'main_image']
 
+class TenancyDecisionSerializer(serializers.Serializer):
+    """Ids of the owner's tenancy requests to approve or reject in one go."""
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=500)
+    decision = serializers.ChoiceField(choices=['approve', 'reject'])
+    reject_others = serializers.BooleanField(default=False)  # With approve: reject the other applicants of those properties
+
 class TenancyRequestSerializer(serializers.ModelSerializer):
     tenant_username = serializers.ReadOnlyField(source="tenant.username")
     owner_username = serializers.ReadOnlyField(source="owner.username")
@@ -134,3 +205,17 @@ class TenancyRequestSerializer(serializers.ModelSerializer):
 
     def get_tenant_phone(self, obj):
         return obj.tenant_phone()
+
+
+class ApplicantSerializer(TenancyRequestSerializer):
+    """A pending tenancy request with its ranking score (see roomie_property.ranking)."""
+    score = serializers.FloatField(read_only=True)
+    rating_score = serializers.FloatField(read_only=True)
+    punctuality_score = serializers.FloatField(read_only=True)
+    waiting_score = serializers.FloatField(read_only=True)
+    capacity_score = serializers.FloatField(read_only=True)
+
+    class Meta(TenancyRequestSerializer.Meta):
+        fields = TenancyRequestSerializer.Meta.fields + [
+            'score', 'rating_score', 'punctuality_score', 'waiting_score', 'capacity_score',
+        ]
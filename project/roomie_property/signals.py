@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from roomie_user.models import CustomUser
+
+from .models import Property, RoomImage, PropertyTenantRecords, TenancyRequest
+from .versioning import bump, bump_properties
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def bump_property_version(sender, instance, **kwargs):
+    bump_properties([instance.pk], owner_ids=[instance.owner_id])
+    # The tenants' request lists show the property's address
+    bump('tenant', TenancyRequest.objects.filter(property_id=instance.pk).values_list('tenant_id', flat=True))
+
+
+@receiver(post_save, sender=RoomImage)
+@receiver(post_delete, sender=RoomImage)
+@receiver(post_save, sender=PropertyTenantRecords)
+@receiver(post_delete, sender=PropertyTenantRecords)
+def bump_version_of_related_property(sender, instance, **kwargs):
+    bump_properties([instance.property_id])
+
+
+@receiver(post_save, sender=TenancyRequest)
+@receiver(post_delete, sender=TenancyRequest)
+def bump_tenancy_request_versions(sender, instance, **kwargs):
+    """A request shows on the property, in the owner's inbox and in the tenant's list."""
+    bump_properties([instance.property_id], owner_ids=[instance.owner_id])
+    bump('tenant', [instance.tenant_id])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=CustomUser)
+def bump_versions_showing_user(sender, instance, update_fields=None, **kwargs):
+    """
+    Tenancy requests show the applicant's profile and the owner's username, properties
+    the usernames of their current tenants.
+    """
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return  # Logging in changes nothing these responses show
+    user_id = instance.pk  # CustomUser shares the pk of its User
+    owner_ids, tenant_ids, property_ids = set(), set(), set()
+    requests = TenancyRequest.objects.filter(Q(tenant_id=user_id) | Q(owner_id=user_id))
+    for tenant_id, owner_id, property_id in requests.values_list('tenant_id', 'owner_id', 'property_id'):
+        if tenant_id == user_id:
+            # The owner's inbox and the property's applicants
+            owner_ids.add(owner_id)
+            property_ids.add(property_id)
+        if owner_id == user_id:
+            tenant_ids.add(tenant_id)
+    records = PropertyTenantRecords.objects.filter(tenant_id=user_id, end_date__isnull=True)
+    for property_id, owner_id in records.values_list('property_id', 'property__owner_id'):
+        owner_ids.add(owner_id)
+        property_ids.add(property_id)
+
+    bump_properties(property_ids, owner_ids=owner_ids)
+    bump('tenant', tenant_ids)
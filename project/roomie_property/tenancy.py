@@ -0,0 +1,140 @@
+from django.db import transaction
+from django.utils import timezone
+
+from roomie_user.models import CustomUser, AddressHistory
+
+from .models import Property, PropertyTenantRecords, TenancyRequest
+from .occupancy import close_tenancies
+from .versioning import bump, bump_properties
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PropertyFull(ValueError):
+    """The property of an approved request has no room left."""
+
+
+def approve_tenancy_request(request_id):
+    """
+    Approve a pending tenancy request and move the tenant in, in one transaction.
+
+    The property row is locked first, then the request and the tenant's profile, so
+    concurrent approvals for the same property run one after the other and each
+    sees the occupancy left by the previous one. The tenant's open tenancy and
+    address are closed, and the new ones written, exactly once; CustomUser.save()
+    is not used because it would close and create the records a second time.
+
+    Raises ValueError when the request is not pending, PropertyFull when the property is full.
+    """
+    with transaction.atomic():
+        property_id = TenancyRequest.objects.values_list('property_id', flat=True).get(pk=request_id)
+        property_instance = Property.objects.select_for_update().get(pk=property_id)
+        tenancy_request = TenancyRequest.objects.select_for_update().get(pk=request_id)
+        if tenancy_request.status != 'pending':
+            raise ValueError(f"Only pending requests can be approved (this one is {tenancy_request.status}).")
+
+        tenant_id = tenancy_request.tenant_id
+        already_living_here = PropertyTenantRecords.objects.filter(
+            property=property_instance, tenant_id=tenant_id, end_date__isnull=True
+        ).exists()
+        if not already_living_here and property_instance.current_occupancy >= property_instance.people_capacity:
+            raise PropertyFull("The property is full.")
+
+        tenancy_request.status = 'approved'
+        tenancy_request.save(update_fields=['status'])
+
+        now = timezone.now()
+        profile = CustomUser.objects.select_for_update().filter(user_id=tenant_id).first()
+        if profile is not None and profile.address_id != property_instance.pk:
+            AddressHistory.objects.filter(user=profile, end_date__isnull=True).update(end_date=now)
+            AddressHistory.objects.create(user=profile, address=property_instance, start_date=now)
+            CustomUser.objects.filter(pk=profile.pk).update(address=property_instance, has_address=True)
+
+        if not already_living_here:
+            # A tenant lives at one property at a time
+            close_tenancies(PropertyTenantRecords.objects.filter(tenant_id=tenant_id), end_date=now.date())
+            PropertyTenantRecords.objects.create(property=property_instance, tenant_id=tenant_id, start_date=now.date())
+
+    logger.info(f"TenancyRequest {request_id} approved: tenant {tenant_id} moved into property {property_id}")
+    return tenancy_request
+
+
+def decide_tenancy_requests(owner, request_ids, decision, reject_others=False):
+    """
+    Approve or reject many of an owner's pending tenancy requests in one transaction.
+
+    Approvals go through approve_tenancy_request() ordered by property, each in a
+    savepoint so a full property only refuses its own requests. Rejections are a
+    single UPDATE; with `reject_others` the other pending requests of the properties
+    that got a new tenant are rejected in the same UPDATE. The tenants are notified
+    with one bulk_create instead of a post_save per request.
+
+    Returns the outcome per requested id ('approved', 'rejected', 'property_full',
+    'not_pending' or 'not_found') and the number of other requests rejected.
+    """
+    from communication.models import Notification
+
+    request_ids = list(dict.fromkeys(request_ids))
+    outcomes = {}
+
+    with transaction.atomic():
+        rows = {
+            pk: (status, property_id)
+            for pk, status, property_id in TenancyRequest.objects.filter(
+                owner=owner, pk__in=request_ids
+            ).values_list('pk', 'status', 'property_id')
+        }
+        pending = [pk for pk, (status, property_id) in rows.items() if status == 'pending']
+
+        approved = []
+        to_reject = TenancyRequest.objects.none()
+        if decision == 'approve':
+            # Requests of one property wait on the same lock; take them in a fixed order
+            for pk in sorted(pending, key=lambda pk: (rows[pk][1], pk)):
+                try:
+                    approve_tenancy_request(pk)
+                except PropertyFull:
+                    outcomes[pk] = 'property_full'
+                    continue
+                except ValueError:
+                    continue  # Decided by someone else meanwhile
+                approved.append(pk)
+                outcomes[pk] = 'approved'
+            if reject_others and approved:
+                to_reject = TenancyRequest.objects.filter(
+                    owner=owner, property_id__in={rows[pk][1] for pk in approved}
+                ).exclude(pk__in=request_ids)
+        else:
+            to_reject = TenancyRequest.objects.filter(pk__in=pending)
+
+        rejected = list(to_reject.select_for_update().filter(status='pending').values_list('pk', 'property_id', 'tenant_id'))
+        TenancyRequest.objects.filter(pk__in=[pk for pk, property_id, tenant_id in rejected]).update(status='rejected')
+        # The UPDATE sends no post_save, so move the ETag versions here
+        bump_properties({property_id for pk, property_id, tenant_id in rejected}, owner_ids=[owner.pk])
+        bump('tenant', {tenant_id for pk, property_id, tenant_id in rejected})
+        outcomes.update({pk: 'rejected' for pk, property_id, tenant_id in rejected if pk in rows})
+
+        decided = TenancyRequest.objects.filter(
+            pk__in=approved + [pk for pk, property_id, tenant_id in rejected]
+        ).select_related('property')
+        Notification.objects.bulk_create([
+            Notification(
+                sender=owner,
+                receiver_id=tenancy_request.tenant_id,
+                message=f"Your tenancy request for {tenancy_request.property.full_address()} was "
+                        f"{'approved' if tenancy_request.status == 'approved' else 'declined'}.",
+            )
+            for tenancy_request in decided
+        ])
+
+    for pk in request_ids:
+        if pk not in rows:
+            outcomes[pk] = 'not_found'
+        elif pk not in outcomes:
+            outcomes[pk] = 'not_pending'
+
+    others = len(rejected) - sum(1 for pk, property_id, tenant_id in rejected if pk in rows)
+    logger.info(f"Bulk {decision} by owner {owner.pk}: {len(approved)} approved, {len(rejected)} rejected")
+    return {'outcomes': {pk: outcomes[pk] for pk in request_ids}, 'others_rejected': others}
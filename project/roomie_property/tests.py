@@ -1,3 +1,827 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .images import requeue_stale_jobs
+from .models import Property, PropertyTenantRecords, RoomImage, ImageJob
+from .occupancy import occupancy_drift
+
+
+def make_property(owner, index=0):
+    return Property.objects.create(
+        street=f"Street {index}", house_number=str(index), town='Town', county='County', country='Ireland',
+        room_capacity=3, people_capacity=3, rent_amount='900.00', owner=owner,
+    )
+
+
+class PropertyFieldsetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()  # Responses cached by an earlier test
+        self.owner = User.objects.create(username='owner')
+        self.property = make_property(self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def add_history(self, count):
+        start = date(2020, 1, 1)
+        offset = PropertyTenantRecords.objects.count()
+        PropertyTenantRecords.objects.bulk_create([
+            PropertyTenantRecords(
+                property=self.property,
+                tenant=User.objects.create(username=f"past-tenant-{offset + i}"),
+                start_date=start + timedelta(days=30 * i), end_date=start + timedelta(days=30 * i + 29),
+            )
+            for i in range(count)
+        ])
+
+    def test_list_uses_compact_shape_and_stays_flat_as_history_grows(self):
+        first = self.client.get('/properties/')
+        row = first.data['results'][0]
+        self.assertNotIn('tenant_history', row)
+        self.assertNotIn('room_images', row)
+        self.assertIn('current_tenant', row)
+
+        self.add_history(30)
+        second = self.client.get('/properties/')
+        self.assertEqual(len(json.dumps(first.data)), len(json.dumps(second.data)))
+
+    def test_fields_and_expand(self):
+        row = self.client.get('/properties/', {'fields': 'id,street'}).data['results'][0]
+        self.assertEqual(set(row), {'id', 'street'})
+
+        row = self.client.get('/properties/', {'expand': 'room_images'}).data['results'][0]
+        self.assertIn('room_images', row)
+        self.assertIn('rent_amount', row)
+
+        detail = self.client.get(f'/properties/{self.property.pk}/', {'fields': 'id,town'}).data
+        self.assertEqual(detail, {'id': self.property.pk, 'town': 'Town'})
+
+    def test_tenant_history_is_paginated(self):
+        self.add_history(25)
+
+        response = self.client.get(f'/properties/{self.property.pk}/tenant-history/')
+
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['results'][0]['start_date'], str(date(2020, 1, 1) + timedelta(days=30 * 24)))
+
+
+class PropertyQueryBudgetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()  # Responses cached by an earlier test
+        self.owner = User.objects.create(username='owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def add_properties(self, count):
+        for i in range(count):
+            property_obj = make_property(self.owner, Property.objects.count())
+            PropertyTenantRecords.objects.bulk_create([
+                PropertyTenantRecords(property=property_obj, tenant=User.objects.create(username=f"tenant-{property_obj.pk}-{j}"))
+                for j in range(2)
+            ])
+
+    def test_property_pages_cost_a_fixed_number_of_queries(self):
+        self.add_properties(1)
+        # COUNT, properties with owner and supervisor, current tenancy records with tenant, room images
+        with self.assertNumQueries(4):
+            self.client.get('/properties/', {'expand': 'all_current_tenant,room_images'})
+
+        self.add_properties(5)
+        with self.assertNumQueries(4):
+            response = self.client.get('/properties/', {'expand': 'all_current_tenant,room_images'})
+        self.assertEqual(len(response.data['results'][-1]['all_current_tenant']), 2)
+        self.assertEqual(response.data['results'][-1]['current_tenant']['tenant_username'],
+                         response.data['results'][-1]['all_current_tenant'][0]['tenant_username'])
+
+        # The compact list shape has no room images to prefetch
+        with self.assertNumQueries(3):
+            self.client.get('/properties/')
+        with self.assertNumQueries(3):
+            self.client.get('/properties/search/', {'town': 'town'})
+
+        with self.assertNumQueries(5):  # Plus the version stamp of the ETag
+            self.client.get('/owner-dashboard/')
+        with self.assertNumQueries(3):
+            self.client.get('/owner-payments-properties/')
+
+
+def make_jpeg(size=(1600, 1200), name='room.jpg'):
+    buffer = BytesIO()
+    Image.new('RGB', size, (120, 80, 40)).save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImagePipelineTests(TestCase):
+
+    def setUp(self):
+        cache.clear()  # Responses cached by an earlier test
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_STORAGE='local', IMAGE_PIPELINE_EAGER=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.owner = User.objects.create(username='owner')
+        self.property = make_property(self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_room_upload_returns_job_and_worker_stores_webp(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post('/upload-room-image/', {
+                'property_id': self.property.pk, 'image': make_jpeg(), 'description': 'Kitchen',
+            }, format='multipart')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertFalse(RoomImage.objects.exists())
+
+        for callback in callbacks:
+            callback()
+
+        status_response = self.client.get(response.data['status_url'])
+        self.assertEqual(status_response.data['status'], 'done')
+        room_image = RoomImage.objects.get(pk=status_response.data['room_image'])
+        self.assertEqual(room_image.description, 'Kitchen')
+        with Image.open(os.path.join(self.media_root, status_response.data['public_id'])) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertLessEqual(max(stored.size), 800)
+        self.assertEqual(set(room_image.renditions), {'full', 'card', 'thumbnail'})
+        with Image.open(os.path.join(self.media_root, room_image.renditions['thumbnail'])) as thumbnail:
+            self.assertEqual(thumbnail.size, (160, 120))
+
+        property_data = self.client.get(f'/properties/{self.property.pk}/', {'expand': 'room_images'}).data
+        self.assertTrue(property_data['room_images'][0]['renditions']['card'].endswith('_card.webp'))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'image_jobs')), [])
+
+    def test_failed_job_reports_error_and_status_is_private(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/upload-room-image/', {
+                'property_id': self.property.pk,
+                'image': SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg'),
+            }, format='multipart')
+
+        job = ImageJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, 'failed')
+        self.assertTrue(job.error)
+
+        self.client.force_authenticate(User.objects.create(username='someone-else'))
+        self.assertEqual(self.client.get(response.data['status_url']).status_code, 404)
+
+    def test_web_requests_only_queue_jobs(self):
+        with override_settings(IMAGE_PIPELINE_EAGER=False), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/upload-room-image/', {
+                'property_id': self.property.pk, 'image': make_jpeg(),
+            }, format='multipart')
+
+        # Left for the image worker (process_image_jobs)
+        self.assertEqual(ImageJob.objects.get(pk=response.data['id']).status, 'queued')
+
+    def test_deleting_a_room_image_removes_its_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/upload-room-image/', {
+                'property_id': self.property.pk, 'image': make_jpeg(),
+            }, format='multipart')
+        room_image = RoomImage.objects.get(pk=ImageJob.objects.get(pk=response.data['id']).room_image_id)
+        stored = [os.path.join(self.media_root, public_id) for public_id in room_image.renditions.values()]
+        self.assertTrue(all(os.path.exists(path) for path in stored))
+
+        self.client.patch(f'/properties/{self.property.pk}/', {'delete_image_public_id': room_image.renditions['full']})
+        self.assertFalse(RoomImage.objects.filter(pk=room_image.pk).exists())
+        self.assertFalse(any(os.path.exists(path) for path in stored))
+
+    def test_stale_processing_jobs_are_requeued(self):
+        stale = ImageJob.objects.create(property=self.property, kind='room_image', raw_path='stale.jpg', status='processing')
+        running = ImageJob.objects.create(property=self.property, kind='room_image', raw_path='running.jpg', status='processing')
+        ImageJob.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(requeue_stale_jobs(stale_after=15 * 60), 1)
+        stale.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual(stale.status, 'queued')
+        self.assertEqual(running.status, 'processing')
+
+
+class PropertySearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='owner')
+        rows = [
+            ('Main Street', 'Galway', 'Galway', '800.00', 2, 3, 'Bright flat near the sea'),
+            ('Quay Road', 'Galway', 'Galway', '1200.00', 4, 5, 'Large family house with garden'),
+            ('Sea View', 'Cork', 'Cork', '950.00', 3, 3, 'Cosy cottage'),
+            ('Harbour Lane', 'Dublin', 'Dublin', '2000.00', 2, 2, 'Penthouse by the sea'),
+        ]
+        for index, (street, town, county, rent, rooms, people, description) in enumerate(rows):
+            Property.objects.create(
+                street=street, house_number=str(index), town=town, county=county, country='Ireland',
+                rent_amount=rent, room_capacity=rooms, people_capacity=people, description=description,
+                owner=cls.owner,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def streets(self, **params):
+        response = self.client.get('/properties/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['street'] for row in response.data['results']]
+
+    def test_filters_and_sorting(self):
+        self.assertEqual(self.streets(town='galway', sort='rent'), ['Main Street', 'Quay Road'])
+        self.assertEqual(self.streets(min_rent='900', max_rent='1500', sort='-rent'), ['Quay Road', 'Sea View'])
+        self.assertEqual(self.streets(min_rooms='3', min_people='4'), ['Quay Road'])
+
+    def test_full_text_search(self):
+        from .search import search_backend
+        if connection.vendor == 'sqlite':
+            self.assertEqual(search_backend(), 'fts5')  # Built by migration 0013
+        self.assertEqual(set(self.streets(q='sea')), {'Main Street', 'Sea View', 'Harbour Lane'})
+        self.assertEqual(self.streets(q='sea', county='Dublin'), ['Harbour Lane'])
+        self.assertEqual(self.streets(q='garden hous'), ['Quay Road'])
+
+        # Updates reach the index through the triggers
+        Property.objects.filter(street='Sea View').update(description='Cosy cottage with garden')
+        self.assertEqual(set(self.streets(q='garden')), {'Quay Road', 'Sea View'})
+
+    def test_index_follows_edits_after_all_migrations(self):
+        property_instance = Property.objects.get(street='Sea View')
+        property_instance.description = 'Thatched roof and orchard'
+        property_instance.save()
+        self.assertEqual(self.streets(q='orchard'), ['Sea View'])
+        self.assertEqual(self.streets(q='cosy'), [])
+
+        property_instance.delete()
+        self.assertEqual(self.streets(q='orchard'), [])
+
+    def test_dropped_triggers_are_restored(self):
+        from .search import FTS_TABLE, restore_search_triggers
+        if connection.vendor != 'sqlite':
+            self.skipTest("The FTS5 triggers are SQLite only")
+        self.assertFalse(restore_search_triggers(connection))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {FTS_TABLE}_au")  # As a table rebuild would
+
+        self.assertTrue(restore_search_triggers(connection))
+        Property.objects.filter(street='Quay Road').update(description='Converted lighthouse')
+        self.assertEqual(self.streets(q='lighthouse'), ['Quay Road'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/properties/search/', {'min_rent': 'cheap'}).status_code, 400)
+        self.assertEqual(self.client.get('/properties/search/', {'sort': 'relevance'}).status_code, 400)
+
+
+class OccupancyCounterTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.first = make_property(self.owner, 1)
+        self.second = make_property(self.owner, 2)
+
+    def occupancy(self, property_obj):
+        property_obj.refresh_from_db(fields=['current_occupancy'])
+        return property_obj.current_occupancy
+
+    def test_tenancy_paths_keep_the_count(self):
+        from roomie_user.models import CustomUser
+        from .models import TenancyRequest
+
+        self.first.add_tenant(User.objects.create(username='a'))
+        self.first.add_tenant(User.objects.create(username='b'))  # Ends a's lease
+        self.assertEqual(self.occupancy(self.first), 1)
+
+        tenant = User.objects.create(username='mover')
+        profile = CustomUser(user=tenant, address=self.first)
+        profile.save()
+        self.assertEqual(self.occupancy(self.first), 2)
+        profile.address = self.second
+        profile.save()
+        self.assertEqual((self.occupancy(self.first), self.occupancy(self.second)), (1, 1))
+
+        request = TenancyRequest.objects.create(tenant=tenant, property=self.first, owner=self.owner)
+        request.approve()
+        self.assertEqual(self.occupancy(self.second), 0)
+        self.assertEqual(self.occupancy(self.first), PropertyTenantRecords.objects.filter(
+            property=self.first, end_date__isnull=True).count())
+
+        PropertyTenantRecords.objects.filter(property=self.first, end_date__isnull=True).delete()
+        self.assertEqual(self.occupancy(self.first), 0)
+        self.assertEqual(occupancy_drift(), [])
+
+    def test_has_vacancy_filter(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        for name in ('x', 'y', 'z'):
+            PropertyTenantRecords.objects.create(property=self.first, tenant=User.objects.create(username=name))
+
+        self.assertEqual(list(Property.objects.with_vacancy()), [self.second])
+        response = client.get('/properties/search/', {'has_vacancy': 'true'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.second.pk])
+        self.assertEqual(response.data['results'][0]['current_occupancy'], 0)
+        self.assertEqual(client.get('/properties/search/', {'has_vacancy': 'maybe'}).status_code, 400)
+
+    def test_verify_command_detects_and_repairs_drift(self):
+        # bulk_create skips save(), so the count drifts
+        PropertyTenantRecords.objects.bulk_create([
+            PropertyTenantRecords(property=self.second, tenant=User.objects.create(username=f"bulk-{i}")) for i in range(2)
+        ])
+        out = StringIO()
+        call_command('verify_occupancy', stdout=out)
+        self.assertIn(f"Property {self.second.pk}: stored 0, actual 2", out.getvalue())
+        self.assertEqual(self.occupancy(self.second), 0)
+
+        call_command('verify_occupancy', '--fix', stdout=StringIO())
+        self.assertEqual(self.occupancy(self.second), 2)
+        self.assertEqual(occupancy_drift(), [])
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()  # Responses cached by an earlier test
+        self.owner = User.objects.create(username='owner')
+        self.tenant = User.objects.create(username='tenant')
+        self.property = make_property(self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def assertRevalidates(self, url, write, **params):
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+
+        # Only the version stamp is read, nothing is serialized
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], etag)
+
+        write()
+        fresh = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh['ETag'], etag)
+
+    def test_property_detail(self):
+        url = f'/properties/{self.property.pk}/'
+        self.assertRevalidates(url, lambda: RoomImage.objects.create(property=self.property, image='rooms/a', description='A'))
+        self.assertRevalidates(url, lambda: self.property.add_tenant(self.tenant))
+        self.assertRevalidates(url, lambda: Property.objects.filter(pk=self.property.pk).first().save())
+
+        # A different field selection is a different representation
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, {'fields': 'id'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_owner_dashboard_and_tenancy_requests(self):
+        from .models import TenancyRequest
+        self.assertRevalidates('/owner-dashboard/', lambda: make_property(self.owner, 2))
+        self.assertRevalidates('/tenancy-requests/', lambda: TenancyRequest.objects.create(
+            tenant=self.tenant, property=self.property, owner=self.owner))
+
+        self.client.force_authenticate(self.tenant)
+        self.assertRevalidates('/tenant-tenancy-requests/', lambda: TenancyRequest.objects.filter(
+            tenant=self.tenant).first().reject(), status='pending')
+
+    def test_profile_and_address_changes_reach_the_request_lists(self):
+        from roomie_user.models import CustomUser
+        from .models import TenancyRequest
+        TenancyRequest.objects.create(tenant=self.tenant, property=self.property, owner=self.owner)
+        self.assertRevalidates('/tenancy-requests/', lambda: CustomUser(user=self.tenant, first_name='Ann').save())
+        self.tenant.username = 'ann'
+        self.assertRevalidates('/tenancy-requests/', self.tenant.save)
+
+        self.client.force_authenticate(self.tenant)
+        self.assertRevalidates('/tenant-tenancy-requests/', lambda: Property.objects.get(pk=self.property.pk).save())
+
+    def test_other_owners_writes_do_not_invalidate(self):
+        etag = self.client.get('/owner-dashboard/')['ETag']
+        make_property(User.objects.create(username='other-owner'), 3)
+        self.assertEqual(self.client.get('/owner-dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='owner')
+        self.property = make_property(self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_detail_is_served_from_cache_until_a_write(self):
+        url = f'/properties/{self.property.pk}/'
+        first = self.client.get(url)
+        with self.assertNumQueries(1):  # The version stamp only
+            second = self.client.get(url)
+        self.assertEqual(first.data, second.data)
+
+        PropertyTenantRecords.objects.create(property=self.property, tenant=User.objects.create(username='tenant'))
+        third = self.client.get(url)
+        self.assertEqual(third.data['current_tenant']['tenant_username'], 'tenant')
+        self.assertEqual(third.data['current_occupancy'], 1)
+
+        from .caching import response_cache_stats
+        self.assertEqual(response_cache_stats(), {'hits': 1, 'misses': 2, 'coalesced': 0})
+
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.assertEqual(self.client.get('/response-cache-stats/').data['hits'], 1)
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.get('/response-cache-stats/').status_code, 403)
+
+    def test_concurrent_miss_waits_for_the_rebuild(self):
+        import threading
+        from rest_framework.response import Response
+        from .caching import cached_response
+
+        cache.add('response:test:lock', 1)  # Another worker is rebuilding
+        threading.Timer(0.1, cache.set, args=('response:test', {'built': 'elsewhere'})).start()
+
+        response = cached_response('response:test', lambda: self.fail("The rebuild was not coalesced"))
+        self.assertEqual(response.data, {'built': 'elsewhere'})
+
+        cache.delete('response:test:lock')
+        built = cached_response('response:fresh', lambda: Response({'built': 'here'}))
+        self.assertEqual(built.data, {'built': 'here'})
+        self.assertEqual(cache.get('response:fresh'), {'built': 'here'})
+
+
+class ImageURLBuilderTests(TestCase):
+
+    def test_urls_are_built_once_per_image_and_variant(self):
+        from .images import ImageURLBuilder
+
+        class CountingStorage:
+            calls = 0
+
+            def url(self, public_id, **transformation):
+                self.calls += 1
+                suffix = ','.join(f"{key}_{value}" for key, value in sorted(transformation.items()))
+                return f"https://images.test/{suffix}/{public_id}"
+
+        storage = CountingStorage()
+        builder = ImageURLBuilder(storage, maxsize=2)
+        for _ in range(50):
+            self.assertEqual(builder.url('rooms/a'), 'https://images.test//rooms/a')
+        self.assertEqual(builder.url('rooms/a', width=160, crop='fill'), 'https://images.test/crop_fill,width_160/rooms/a')
+        self.assertEqual(builder.url('rooms/a', crop='fill', width=160), 'https://images.test/crop_fill,width_160/rooms/a')
+        self.assertIsNone(builder.url(None))
+        self.assertEqual(storage.calls, 2)
+
+        builder.url('rooms/b')  # Evicts the least recently used entry
+        builder.url('rooms/a')
+        self.assertEqual(storage.calls, 4)
+        self.assertEqual(builder.cached_url.cache_info().currsize, 2)
+
+    @override_settings(IMAGE_STORAGE='local', MEDIA_URL='/media/')
+    def test_serializers_share_the_local_stand_in(self):
+        from communication.models import RepairImage
+        from communication.serializers import RepairImageSerializer
+
+        owner = User.objects.create(username='owner')
+        property_obj = make_property(owner)
+        property_obj.main_image = 'properties/main.webp'
+        property_obj.save()
+        RoomImage.objects.create(property=property_obj, image='rooms/kitchen.webp', description='Kitchen',
+                                 renditions={'thumbnail': 'rooms/kitchen_thumbnail.webp'})
+
+        client = APIClient()
+        client.force_authenticate(owner)
+        cache.clear()
+        data = client.get(f'/properties/{property_obj.pk}/', {'expand': 'room_images'}).data
+        self.assertEqual(data['main_image'], '/media/properties/main.webp')
+        self.assertEqual(data['room_images'][0]['image_url'], '/media/rooms/kitchen.webp')
+        self.assertEqual(data['room_images'][0]['renditions'], {'thumbnail': '/media/rooms/kitchen_thumbnail.webp'})
+        self.assertEqual(RepairImageSerializer(RepairImage.objects.create(image='repairs/leak')).data['image'],
+                         '/media/repairs/leak')
+
+
+class TenancyApprovalTests(TestCase):
+
+    def setUp(self):
+        from roomie_user.models import CustomUser
+        self.owner = User.objects.create(username='owner')
+        self.old_home = make_property(User.objects.create(username='old-owner'), 1)
+        self.property = make_property(self.owner, 2)
+        self.tenant = User.objects.create(username='tenant')
+        self.profile = CustomUser(user=self.tenant, address=self.old_home)
+        self.profile.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def request_from(self, tenant):
+        from .models import TenancyRequest
+        return TenancyRequest.objects.create(tenant=tenant, property=self.property, owner=self.owner)
+
+    def test_approval_moves_the_tenant_once(self):
+        from roomie_user.models import AddressHistory
+        tenancy_request = self.request_from(self.tenant)
+
+        # Locks, status, profile, address history, closing the old tenancy and opening the new one,
+        # with their version stamps and savepoints
+        with self.assertNumQueries(30):
+            response = self.client.post(f'/tenancy-requests/{tenancy_request.pk}/approve/')
+        self.assertEqual(response.status_code, 200)
+
+        open_records = PropertyTenantRecords.objects.filter(tenant=self.tenant, end_date__isnull=True)
+        self.assertEqual([record.property_id for record in open_records], [self.property.pk])
+        self.assertEqual(list(AddressHistory.objects.filter(user=self.profile, end_date__isnull=True)
+                              .values_list('address_id', flat=True)), [self.property.pk])
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.address_id, self.property.pk)
+        self.assertEqual(occupancy_drift(), [])
+
+        # Approving twice is refused
+        self.assertEqual(self.client.post(f'/tenancy-requests/{tenancy_request.pk}/approve/').status_code, 400)
+
+    def test_full_property_refuses_approval(self):
+        self.property.people_capacity = 1
+        self.property.save()
+        self.request_from(User.objects.create(username='first')).approve()
+
+        late = self.request_from(self.tenant)
+        response = self.client.post(f'/tenancy-requests/{late.pk}/approve/')
+        self.assertEqual(response.status_code, 400)
+        late.refresh_from_db()
+        self.assertEqual(late.status, 'pending')
+        self.assertTrue(PropertyTenantRecords.objects.filter(tenant=self.tenant, property=self.old_home,
+                                                             end_date__isnull=True).exists())
+
+
+class TenancyRequestListingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='owner')
+        self.property = make_property(self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def add_requests(self, count, status='pending'):
+        from roomie_user.models import CustomUser
+        from .models import TenancyRequest
+        for _ in range(count):
+            tenant = User.objects.create(username=f"applicant-{User.objects.count()}", email='a@example.com')
+            CustomUser(user=tenant, phone_number='0851234567', user_rating_in_app=4).save()
+            TenancyRequest.objects.create(tenant=tenant, property=self.property, owner=self.owner, status=status)
+
+    def test_inbox_costs_the_same_queries_however_many_applicants(self):
+        self.add_requests(2)
+        # Version stamp, COUNT and the page with tenant profiles, properties and owners
+        with self.assertNumQueries(3):
+            self.client.get('/tenancy-requests/')
+
+        self.add_requests(30)
+        with self.assertNumQueries(3):
+            response = self.client.get('/tenancy-requests/')
+        self.assertEqual(response.data['count'], 32)
+        self.assertEqual(len(response.data['results']), 20)
+        row = response.data['results'][0]
+        self.assertEqual(row['tenant_phone'], '0851234567')
+        self.assertEqual(row['property_address'], self.property.full_address())
+        self.assertEqual(row['owner_username'], 'owner')
+
+    def test_status_filter(self):
+        self.add_requests(2)
+        self.add_requests(1, status='rejected')
+
+        self.assertEqual(self.client.get('/tenancy-requests/', {'status': 'rejected'}).data['count'], 1)
+        self.assertEqual(self.client.get('/tenancy-requests/', {'status': 'lost'}).status_code, 400)
+
+
+class TenancyBulkDecisionTests(TestCase):
+
+    def setUp(self):
+        from .models import TenancyRequest
+        self.owner = User.objects.create(username='owner')
+        self.property = make_property(self.owner)  # Room for 3
+        self.requests = [
+            TenancyRequest.objects.create(tenant=User.objects.create(username=f"applicant-{i}"),
+                                          property=self.property, owner=self.owner)
+            for i in range(5)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def decide(self, ids, decision, **extra):
+        return self.client.post('/tenancy-requests/bulk-decision/', {'ids': ids, 'decision': decision, **extra},
+                                format='json')
+
+    def statuses(self):
+        for tenancy_request in self.requests:
+            tenancy_request.refresh_from_db()
+        return [tenancy_request.status for tenancy_request in self.requests]
+
+    def test_reject_is_one_update_with_bulk_notifications(self):
+        from communication.models import Notification
+        ids = [tenancy_request.pk for tenancy_request in self.requests[:3]]
+        before = Notification.objects.count()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.decide(ids + [999], 'reject')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['outcome'] for row in response.data['results']],
+                         ['rejected', 'rejected', 'rejected', 'not_found'])
+        self.assertEqual(self.statuses(), ['rejected'] * 3 + ['pending'] * 2)
+        updates = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE "roomie_property_tenancyrequest"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Notification.objects.count() - before, 3)
+        self.assertIn('was declined', Notification.objects.filter(receiver=self.requests[0].tenant).get().message)
+
+        self.assertEqual(self.decide(ids[:1], 'reject').data['results'][0]['outcome'], 'not_pending')
+
+    def test_approve_winners_and_reject_the_others(self):
+        winners = [tenancy_request.pk for tenancy_request in self.requests[:4]]
+
+        response = self.decide(winners, 'approve', reject_others=True)
+
+        self.assertEqual([row['outcome'] for row in response.data['results']],
+                         ['approved', 'approved', 'approved', 'property_full'])
+        self.assertEqual(response.data['others_rejected'], 1)
+        self.assertEqual(self.statuses(), ['approved'] * 3 + ['pending', 'rejected'])
+        self.property.refresh_from_db()
+        self.assertEqual(self.property.current_occupancy, 3)
+
+        self.client.force_authenticate(User.objects.create(username='not-the-owner'))
+        self.assertEqual(self.decide(winners, 'reject').data['results'][0]['outcome'], 'not_found')
+        self.assertEqual(self.decide([], 'reject').status_code, 400)
+
+
+class ApplicantRankingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='owner')
+        self.property = make_property(self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def apply(self, username, rating=None, days_ago=0):
+        from roomie_user.models import CustomUser
+        from .models import TenancyRequest
+        tenant = User.objects.create(username=username)
+        if rating is not None:
+            CustomUser(user=tenant, user_rating_in_app=rating).save()
+        tenancy_request = TenancyRequest.objects.create(tenant=tenant, property=self.property, owner=self.owner)
+        TenancyRequest.objects.filter(pk=tenancy_request.pk).update(
+            request_date=tenancy_request.request_date - timedelta(days=days_ago)
+        )
+        return tenant
+
+    def settle(self, tenant, on_time, late):
+        from cash_flow.models import RentPayment, TenantBilling
+        rent_payment = RentPayment.objects.create(property=make_property(self.owner, 99), amount='100.00')
+        deadline = date.today() - timedelta(days=10)
+        for days_after_deadline in [-1] * on_time + [5] * late:
+            TenantBilling.objects.create(rent_payment=rent_payment, tenant=tenant, amount='100.00', status='paid',
+                                         deadline=deadline, paid_at=timezone.now() - timedelta(days=10 - days_after_deadline))
+
+    def test_applicants_are_ranked_in_one_query(self):
+        from .ranking import rank_applicants
+        punctual = self.apply('punctual', rating=4)
+        late = self.apply('late', rating=4)
+        self.apply('veteran', rating=4, days_ago=30)
+        self.apply('no-profile')
+        self.settle(punctual, on_time=3, late=0)
+        self.settle(late, on_time=1, late=3)
+
+        with self.assertNumQueries(1):
+            ranked = list(rank_applicants(self.property.pk))
+
+        self.assertEqual([r.tenant.username for r in ranked], ['punctual', 'veteran', 'late', 'no-profile'])
+        by_name = {r.tenant.username: r for r in ranked}
+        self.assertAlmostEqual(by_name['punctual'].punctuality_score, 1.0)
+        self.assertAlmostEqual(by_name['late'].punctuality_score, 0.25)
+        self.assertAlmostEqual(by_name['veteran'].punctuality_score, 0.5)  # No payment history
+        self.assertAlmostEqual(by_name['veteran'].waiting_score, 1.0)
+        self.assertAlmostEqual(by_name['no-profile'].rating_score, 0.5)
+        self.assertAlmostEqual(by_name['punctual'].capacity_score, 1.0)
+
+    def test_punctuality_follows_paid_at_not_later_edits(self):
+        from cash_flow.models import TenantBilling
+        from .ranking import rank_applicants
+        tenant = self.apply('tenant', rating=4)
+        self.settle(tenant, on_time=1, late=0)
+        billing = TenantBilling.objects.get(tenant=tenant)
+        billing.amount = '90.00'
+        billing.save()  # Touches updated_at, long after the deadline
+
+        self.assertAlmostEqual(rank_applicants(self.property.pk).get().punctuality_score, 1.0)
+
+    def test_property_bill_shares_count_towards_punctuality(self):
+        from cash_flow.models import PropertyBilling
+        from .ranking import rank_applicants
+        tenant = self.apply('tenant', rating=4)
+        self.settle(tenant, on_time=1, late=0)
+        deadline = date.today() - timedelta(days=10)
+        PropertyBilling.objects.create(tenant=tenant, amount='30.00', status='paid', deadline=deadline,
+                                       paid_at=timezone.now())  # Ten days late
+        PropertyBilling.objects.create(tenant=tenant, amount='30.00', status='paid')  # No deadline to be late for
+
+        self.assertAlmostEqual(rank_applicants(self.property.pk).get().punctuality_score, 0.5)
+
+    def test_endpoint_is_owner_only_paginated_and_cached(self):
+        from .models import TenancyRequest
+        for i in range(25):
+            self.apply(f"applicant-{i}", rating=i % 5)
+        TenancyRequest.objects.filter(tenant__username='applicant-0').update(status='rejected')
+
+        response = self.client.get(f'/properties/{self.property.pk}/applicants/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 24)
+        self.assertEqual(len(response.data['results']), 20)
+        scores = [row['score'] for row in response.data['results']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        with self.assertNumQueries(2):  # Owner check and version stamp; the page comes from the cache
+            cached = self.client.get(f'/properties/{self.property.pk}/applicants/')
+        self.assertEqual(cached.data, response.data)
+        # Settled payments do not move the stamp, so there is no ETag to revalidate against
+        self.assertNotIn('ETag', response)
+
+        self.client.force_authenticate(User.objects.create(username='not-the-owner'))
+        self.assertEqual(self.client.get(f'/properties/{self.property.pk}/applicants/').status_code, 403)
+        self.assertEqual(self.client.get('/properties/999/applicants/').status_code, 404)
+
+
+class TenancyIntervalTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.properties = [make_property(self.owner, i) for i in range(2)]
+        self.elsewhere = make_property(User.objects.create(username='other-owner'), 9)
+        self.tenants = [User.objects.create(username=f"tenant-{i}") for i in range(4)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def stay(self, property_instance, tenant, start, end=None):
+        return PropertyTenantRecords.objects.create(property=property_instance, tenant=tenant, start_date=start, end_date=end)
+
+    def test_as_of_and_overlapping(self):
+        first, second = self.properties
+        self.stay(first, self.tenants[0], date(2026, 1, 1), date(2026, 3, 1))  # Moves out on 1 March
+        self.stay(first, self.tenants[1], date(2026, 3, 1))  # Moves in on 1 March
+        self.stay(second, self.tenants[2], date(2026, 4, 1))
+        self.stay(self.elsewhere, self.tenants[3], date(2026, 3, 10), date(2026, 3, 20))
+
+        def tenants(records):
+            return sorted(records.values_list('tenant__username', flat=True))
+
+        records = PropertyTenantRecords.objects.all()
+        self.assertEqual(tenants(records.as_of(date(2026, 2, 28))), ['tenant-0'])
+        self.assertEqual(tenants(records.as_of(date(2026, 3, 1))), ['tenant-1'])
+        self.assertEqual(tenants(records.overlapping(date(2026, 3, 1), date(2026, 3, 31))), ['tenant-1', 'tenant-3'])
+        self.assertEqual(tenants(records.overlapping(date(2026, 2, 1), date(2026, 4, 1))),
+                         ['tenant-0', 'tenant-1', 'tenant-2', 'tenant-3'])
+        self.assertEqual(tenants(records.overlapping(date(2025, 1, 1), date(2025, 12, 31))), [])
+
+    def test_stays_can_not_end_before_they_start(self):
+        from .occupancy import close_tenancies
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.stay(self.properties[0], self.tenants[0], date(2026, 3, 1), date(2026, 2, 1))
+
+        future = self.stay(self.properties[0], self.tenants[1], date.today() + timedelta(days=30))
+        close_tenancies(PropertyTenantRecords.objects.filter(pk=future.pk))
+        future.refresh_from_db()
+        self.assertEqual(future.end_date, future.start_date)
+
+    def test_portfolio_residents_in_one_round_trip(self):
+        first, second = self.properties
+        self.stay(first, self.tenants[0], date(2026, 1, 1), date(2026, 3, 5))
+        self.stay(second, self.tenants[1], date(2026, 3, 20))
+        self.stay(second, self.tenants[2], date(2026, 4, 1))
+        self.stay(self.elsewhere, self.tenants[3], date(2026, 3, 10))
+
+        with self.assertNumQueries(2):  # COUNT and the page
+            response = self.client.get('/owner-residents/', {'from': '2026-03-01', 'to': '2026-03-31'})
+        self.assertEqual([row['tenant_username'] for row in response.data['results']], ['tenant-0', 'tenant-1'])
+
+        response = self.client.get('/owner-residents/', {'on': '2026-04-02'})
+        self.assertEqual([row['tenant_username'] for row in response.data['results']], ['tenant-1', 'tenant-2'])
+
+        history = self.client.get(f'/properties/{first.pk}/tenant-history/', {'on': '2026-03-05'})
+        self.assertEqual(history.data['count'], 0)
+
+        self.assertEqual(self.client.get('/owner-residents/', {'on': 'March'}).status_code, 400)
+        self.assertEqual(self.client.get('/owner-residents/', {'on': '2026-03-01', 'to': '2026-03-31'}).status_code, 400)
+        self.assertEqual(self.client.get('/owner-residents/', {'from': '2026-04-01', 'to': '2026-03-01'}).status_code, 400)
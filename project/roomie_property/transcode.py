@@ -0,0 +1,53 @@
+"""
+Pillow work of the image pipeline.
+
+Kept free of Django imports so the functions can run in a spawned process pool
+(see roomie_property.images).
+"""
+from io import BytesIO
+
+from PIL import Image
+
+WEBP_QUALITY = 80
+
+# Rendition name -> bounding box, largest first; 'full' is the former single 800x800 image
+RENDITIONS = {
+    'full': (800, 800),
+    'card': (400, 400),
+    'thumbnail': (160, 160),
+}
+
+
+def _fit(img, box):
+    """Downscale `img` to fit `box`: a cheap integer reduce() when it is at least twice too big, then a resample."""
+    factor = min(img.width // box[0], img.height // box[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    img.thumbnail(box)
+    return img
+
+
+def transcode_renditions(data, renditions=RENDITIONS, quality=WEBP_QUALITY, draft=True):
+    """
+    Decode an uploaded image once and return {rendition name: WebP bytes}.
+
+    For JPEGs draft() lets the decoder scale down by 1/2, 1/4 or 1/8 while decoding,
+    to no less than the largest rendition, which skips most of the decoding work on
+    camera-sized photos. Each smaller rendition is then derived from the previous one.
+    """
+    img = Image.open(BytesIO(data))
+    boxes = sorted(renditions.items(), key=lambda item: item[1][0] * item[1][1], reverse=True)
+
+    if draft and img.format == 'JPEG':
+        img.draft('RGB', boxes[0][1])
+    img.load()  # Decode now, otherwise thumbnail() would apply its own draft
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+
+    encoded = {}
+    for name, box in boxes:
+        img = _fit(img, box)
+        img_io = BytesIO()
+        img.save(img_io, format='WEBP', quality=quality)
+        encoded[name] = img_io.getvalue()
+    return encoded
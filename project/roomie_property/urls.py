@@ -2,7 +2,7 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PropertyViewSet,RoomImageUploadView,OwnerPaymentView, OwnerDashboardView,PropertyUpdateTextFieldsView,AllCustomUsersView, TenancyRequestViewSet,TenantTenancyRequestViewSet
+from .views import PropertyViewSet,RoomImageUploadView,OwnerPaymentView, OwnerDashboardView,PropertyUpdateTextFieldsView,AllCustomUsersView, TenancyRequestViewSet,TenantTenancyRequestViewSet, ImageJobView, ResponseCacheStatsView, OwnerResidentsView
 
 router = DefaultRouter()
 router.register(r'properties', PropertyViewSet)
@@ -13,8 +13,11 @@ router.register(r'tenant-tenancy-requests', TenantTenancyRequestViewSet, basenam
 urlpatterns = [
     path('', include(router.urls)),
     path('owner-dashboard/', OwnerDashboardView.as_view(), name='owner-dashboard'),
+    path('owner-residents/', OwnerResidentsView.as_view(), name='owner-residents'),
     path('properties/<int:pk>/update-text-fields/', PropertyUpdateTextFieldsView.as_view(), name='update_text_fields'),
     path('upload-room-image/', RoomImageUploadView.as_view(), name='upload-room-image'),
+    path('image-jobs/<int:pk>/', ImageJobView.as_view(), name='image-job'),
+    path('response-cache-stats/', ResponseCacheStatsView.as_view(), name='response-cache-stats'),
     path("custom-users/", AllCustomUsersView.as_view(), name="custom-users"),
     path('owner-payments-properties/', OwnerPaymentView.as_view(), name='owner-payments-properties'),
 
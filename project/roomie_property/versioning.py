@@ -0,0 +1,70 @@
+import hashlib
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Property, VersionStamp
+
+
+def bump(scope, object_ids):
+    """Move the version stamps of `object_ids` in `scope` forward, creating the missing ones."""
+    object_ids = {object_id for object_id in object_ids if object_id is not None}
+    if not object_ids:
+        return
+    stamps = VersionStamp.objects.filter(scope=scope, object_id__in=object_ids)
+    with transaction.atomic(savepoint=False):
+        # Stamps exist after the first write, so this is usually a single UPDATE
+        if stamps.update(version=F('version') + 1) < len(object_ids):
+            existing = set(stamps.values_list('object_id', flat=True))
+            VersionStamp.objects.bulk_create(
+                [VersionStamp(scope=scope, object_id=object_id, version=1) for object_id in object_ids - existing],
+                ignore_conflicts=True,
+            )
+
+
+def bump_properties(property_ids, owner_ids=None):
+    """Bump the stamps of properties and of their owners (looked up when `owner_ids` is not given)."""
+    property_ids = set(property_ids)
+    if owner_ids is None:
+        owner_ids = Property.objects.filter(pk__in=property_ids).values_list('owner_id', flat=True)
+    bump('property', property_ids)
+    bump('owner', owner_ids)
+
+
+def current_version(scope, object_id):
+    return VersionStamp.objects.filter(scope=scope, object_id=object_id).values_list('version', flat=True).first() or 0
+
+
+def make_etag(request, scope, object_id, version):
+    """Weak ETag of a response: the stamp plus the query string, which selects fields and pages."""
+    variant = hashlib.md5(request.META.get('QUERY_STRING', '').encode()).hexdigest()[:12]
+    return f'W/"{scope}-{object_id}-{version}-{variant}"'
+
+
+def conditional_get(request, scope, object_id, build_response, cache_response=False):
+    """
+    Answer `If-None-Match` with 304 when the stamp has not moved, otherwise build the response.
+
+    The stamp is read before `build_response()` runs, so a write that lands while the
+    response is built leaves an older ETag behind and the next request sees the change.
+    With `cache_response` the serialized data is kept in the response cache
+    (roomie_property.caching) under a key that includes the ETag.
+    """
+    from .caching import cached_response, response_cache_key
+
+    etag = make_etag(request, scope, object_id, current_version(scope, object_id))
+    client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+    # Weak comparison (RFC 9110): ignore the W/ prefix on both sides
+    if '*' in client_etags or etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in client_etags}:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    if cache_response:
+        response = cached_response(response_cache_key(request, etag), build_response)
+    else:
+        response = build_response()
+    if response.status_code == status.HTTP_200_OK:
+        response['ETag'] = etag
+    return response
@@ -2,21 +2,29 @@
 
 from rest_framework import viewsets, status
 from rest_framework.views import APIView
-from .models import Property, RoomImage, TenancyRequest
+from .models import Property, TenancyRequest, PropertyTenantRecords, ImageJob
 from roomie_user.serializers import CustomUserSerializer
 from communication.serializers import NotificationSerializer
-from .serializers import PropertySerializer, OwnerPropertiesSerializer, RoomImageSerializer, TenancyRequestSerializer
-from rest_framework.permissions import IsAuthenticated
+from .serializers import PropertySerializer, OwnerPropertiesSerializer, TenancyRequestSerializer, PropertyTenantRecordsSerializer, ImageJobSerializer, TenancyDecisionSerializer, ApplicantSerializer
+from .images import delete_stored_images, queue_image
+from .search import search_properties
+from .ranking import rank_applicants
+from .intervals import filter_stays
+from .versioning import conditional_get, current_version, make_etag
+from .caching import cached_response, response_cache_key, response_cache_stats
+from .tenancy import decide_tenancy_requests
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.exceptions import ValidationError
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
-import cloudinary.uploader
+from rest_framework.generics import RetrieveAPIView
+from django.conf import settings
+from django.db.models import Q
 from roomie_user.models import CustomUser
-from PIL import Image
-from io import BytesIO
-from django.core.files.base import ContentFile
+import logging
+logger = logging.getLogger(__name__)
 
 
 class PropertyPagination(PageNumberPagination):
@@ -24,12 +32,107 @@ class PropertyPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+class TenantHistoryPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+class TenancyRequestPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+def tenancy_request_page(view, request, tenancy_requests):
+    """One page of tenancy requests, newest first, optionally filtered by `?status=`."""
+    status_param = request.query_params.get('status')
+    if status_param:
+        if status_param not in dict(TenancyRequest._meta.get_field('status').choices):
+            return Response({"error": "Invalid status. Use pending, approved or rejected."}, status=status.HTTP_400_BAD_REQUEST)
+        tenancy_requests = tenancy_requests.filter(status=status_param)
+
+    paginator = TenancyRequestPagination()
+    page = paginator.paginate_queryset(tenancy_requests.for_listing().order_by('-request_date', '-pk'), request, view=view)
+    serializer = view.get_serializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
 class PropertyViewSet(viewsets.ModelViewSet):
-    queryset = Property.objects.all()
+    """Properties; supports `?fields=` and `?expand=`, and lists use the compact PropertySerializer list shape."""
+    queryset = Property.objects.with_tenants().order_by('pk')
     serializer_class = PropertySerializer
     parser_classes = [MultiPartParser, FormParser]
     pagination_class = PropertyPagination
 
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ('list', 'search'):
+            kwargs.setdefault('fields', PropertySerializer.Meta.list_fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Only when the requested shape (?fields=, ?expand=) includes them
+        if 'room_images' in self.get_serializer().fields:
+            queryset = queryset.with_room_images()
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        """Property detail, cached; answers If-None-Match with 304 while the property's version stamp is unchanged."""
+        return conditional_get(request, 'property', kwargs['pk'], lambda: super(PropertyViewSet, self).retrieve(request, *args, **kwargs),
+                               cache_response=True)
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Search properties: town, county, min_rent, max_rent, min_rooms, min_people, min_rating,
+        has_vacancy, q (full text over street, town and description) and sort (relevance, rent, -rent,
+        rating, -rating, newest). Paginated, in the compact list shape.
+        """
+        try:
+            properties = search_properties(request.query_params, queryset=self.get_queryset())
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(properties)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], url_path='tenant-history')
+    def tenant_history(self, request, pk=None):
+        """Paginated tenancy records of the property, newest first; `?on=` or `?from=&to=` (YYYY-MM-DD) narrow them to a date or period."""
+        property_instance = self.get_object()
+        records = PropertyTenantRecords.objects.filter(property=property_instance).select_related('tenant').order_by('-start_date', '-pk')
+        try:
+            records = filter_stays(records, request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = TenantHistoryPagination()
+        page = paginator.paginate_queryset(records, request, view=self)
+        serializer = PropertyTenantRecordsSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], url_path='applicants')
+    def applicants(self, request, pk=None):
+        """
+        The property's pending tenancy requests ranked best first, paginated; owner only.
+
+        Cached briefly (APPLICANTS_CACHE_TIMEOUT) under the property's version stamp:
+        requests and profile edits show at once, settled payments once the page expires.
+        No ETag, as payments do not move the stamp.
+        """
+        owner_id = Property.objects.filter(pk=pk).values_list('owner_id', flat=True).first()
+        if owner_id is None:
+            return Response({"error": "Property not found."}, status=status.HTTP_404_NOT_FOUND)
+        if not request.user.is_authenticated or request.user.pk != owner_id:
+            return Response({"error": "Only the owner can see the applicants."}, status=status.HTTP_403_FORBIDDEN)
+
+        def build_response():
+            paginator = TenancyRequestPagination()
+            page = paginator.paginate_queryset(rank_applicants(pk), request, view=self)
+            return paginator.get_paginated_response(ApplicantSerializer(page, many=True).data)
+
+        etag = make_etag(request, 'property', pk, current_version('property', pk))
+        return cached_response(response_cache_key(request, etag), build_response, timeout=settings.APPLICANTS_CACHE_TIMEOUT)
+
     def create(self, request, *args, **kwargs):
         try:
             print(f"Request data received: {request.data}")
@@ -49,34 +152,39 @@ class PropertyViewSet(viewsets.ModelViewSet):
             if 'delete_image_public_id' in request.data:
                 delete_image_public_id = request.data['delete_image_public_id']
                 print(f"Attempting to delete image with Cloudinary public ID: {delete_image_public_id}")
-                cloudinary.uploader.destroy(delete_image_public_id)  
                 room_image = property_instance.room_images.filter(image__contains=delete_image_public_id).first()
+                # The pipeline stored a rendition per size, remove them all
+                renditions = (room_image.renditions or {}).values() if room_image else []
+                delete_stored_images([delete_image_public_id, *renditions])
                 if room_image:
                     room_image.delete()
                     print(f"Deleted image with public ID: {delete_image_public_id} from the database.")
             
+            # New images are transcoded and uploaded in the background (see roomie_property.images)
+            image_jobs = []
             if 'main_image' in request.FILES:
-                property_instance.main_image = request.FILES['main_image']
-                property_instance.save()
-                print(f"Main image updated: {property_instance.main_image.url}")
+                image_jobs.append(queue_image(property_instance, request.FILES['main_image'], 'main_image', user=request.user))
 
             if 'room_image' in request.FILES:
                 room_images = request.FILES.getlist('room_image')
                 print(f"Inside partial_update method. Room images count: {len(room_images)}")
 
                 for img in room_images:
-                    print(f"Adding room image: {img.name}")
-                    RoomImage.objects.create(
-                        property=property_instance,
-                        image=img,
-                        description='Updated room image'
-                    )
+                    image_jobs.append(queue_image(
+                        property_instance, img, 'room_image', description='Updated room image', user=request.user
+                    ))
 
-                print(f"{len(room_images)} room images added.")
+                logger.info(f"{len(room_images)} room images queued for property {property_instance.pk}")
 
             property_instance.save()
             print("Property instance saved successfully.")
-            return Response(PropertySerializer(property_instance).data, status=status.HTTP_200_OK)
+            # Reload so the prefetched room images include the changes above
+            property_instance = self.get_object()
+            data = PropertySerializer(property_instance).data
+            if image_jobs:
+                data['image_jobs'] = ImageJobSerializer(image_jobs, many=True).data
+                return Response(data, status=status.HTTP_202_ACCEPTED)
+            return Response(data, status=status.HTTP_200_OK)
 
         except Exception as e:
             print(f"Error: {e}")
@@ -90,8 +198,12 @@ class OwnerDashboardView(APIView):
     def get(self, request):
         # ✅ Get the logged-in owner
         owner = request.user
+        # 304 while nothing on the owner's properties has changed
+        return conditional_get(request, 'owner', owner.pk, lambda: self.dashboard(request, owner), cache_response=True)
+
+    def dashboard(self, request, owner):
         # ✅ Fetch owned properties
-        owner_properties = Property.objects.filter(owner=owner)
+        owner_properties = Property.objects.filter(owner=owner).with_tenants().with_room_images().order_by('pk')
 
         # Apply pagination
         paginator = self.pagination_class()
@@ -103,23 +215,28 @@ class OwnerDashboardView(APIView):
         # Return the paginated response
         return paginator.get_paginated_response(serializer.data) 
 
-class PropertyCreateView(APIView):
-    parser_classes = [MultiPartParser, FormParser]  # To handle file uploads (image files)
+class OwnerResidentsView(APIView):
+    """
+    Tenancy records across all of the owner's properties, in one query per page.
 
-    def convert_to_webp(self, image):
-        """Convert and resize image to WebP format"""
-        img = Image.open(image)
+    `?on=2026-03-01` lists who lived there that day, `?from=2026-03-01&to=2026-03-31`
+    who lived there at any time in the period; without either, every record.
+    """
+    permission_classes = [IsAuthenticated]
 
-        # Resize if needed (e.g., max 800x800)
-        max_size = (800, 800)
-        img.thumbnail(max_size)
+    def get(self, request):
+        records = PropertyTenantRecords.objects.filter(property__owner=request.user).select_related('tenant')
+        try:
+            records = filter_stays(records, request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Convert to WebP
-        img_io = BytesIO()
-        img.save(img_io, format='WEBP', quality=80)
+        paginator = TenantHistoryPagination()
+        page = paginator.paginate_queryset(records.order_by('property_id', 'start_date', 'pk'), request, view=self)
+        return paginator.get_paginated_response(PropertyTenantRecordsSerializer(page, many=True).data)
 
-        # Return converted image
-        return ContentFile(img_io.getvalue(), name=f"{image.name.split('.')[0]}.webp")
+class PropertyCreateView(APIView):
+    parser_classes = [MultiPartParser, FormParser]  # To handle file uploads (image files)
 
     def post(self, request, *args, **kwargs):
         # Copy request data
@@ -129,10 +246,6 @@ class PropertyCreateView(APIView):
         main_image = request.FILES.get('main_image')
         room_images = request.FILES.getlist('room_images')
 
-        # Convert main image to WebP
-        if main_image:
-            main_image = self.convert_to_webp(main_image)
-
         # Create Property instance
         property = Property.objects.create(
             street=property_data['street'],
@@ -148,21 +261,20 @@ class PropertyCreateView(APIView):
             folio_number=property_data['folio_number'],
             air_code=property_data.get('air_code'),
             description=property_data.get('description'),
-            main_image=main_image,
             owner=request.user
         )
 
-        # Convert and save room images
+        # The images are converted to WebP and uploaded in the background
+        image_jobs = []
+        if main_image:
+            image_jobs.append(queue_image(property, main_image, 'main_image', user=request.user))
         for img in room_images:
-            converted_img = self.convert_to_webp(img)
-            RoomImage.objects.create(
-                property=property,
-                image=converted_img,
-                description='Room image description'
-            )
+            image_jobs.append(queue_image(property, img, 'room_image', description='Room image description', user=request.user))
 
         # Return response
-        return Response(PropertySerializer(property).data, status=status.HTTP_201_CREATED)
+        data = PropertySerializer(property).data
+        data['image_jobs'] = ImageJobSerializer(image_jobs, many=True).data
+        return Response(data, status=status.HTTP_201_CREATED)
     
 class PropertyUpdateTextFieldsView(APIView):
     """Handles PATCH requests for updating only text fields in a Property."""
@@ -238,29 +350,29 @@ class RoomImageUploadView(APIView):
             print("❌ Property not found with ID:", property_id)
             return Response({"error": "Property not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Upload image to Cloudinary
-        try:
-            print("📡 Uploading image to Cloudinary...")
-            upload_result = cloudinary.uploader.upload(image)
-            print("✅ Cloudinary upload success:", upload_result)
-            image_url = upload_result.get('secure_url')
-            image_public_id = upload_result.get('public_id')
-        except Exception as e:
-            print("❌ Cloudinary upload failed:", str(e))
-            return Response({"error": "Failed to upload image."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        # Save Room Image
-        print("💾 Saving image to database...")
-        room_image = RoomImage.objects.create(
-            property=property_instance,
-            image=image_public_id,  # Store Cloudinary public ID
-            description=description
-        )
+        # Transcode and upload in the background; the client polls the job status
+        image_job = queue_image(property_instance, image, 'room_image', description=description, user=request.user)
+        logger.info(f"Queued image job {image_job.pk} for property {property_instance.pk}")
+
+        return Response(ImageJobSerializer(image_job).data, status=status.HTTP_202_ACCEPTED)
+
 
-        print("✅ Room image saved successfully:", room_image)
+class ImageJobView(RetrieveAPIView):
+    """Status of a background image job, for the user who uploaded it or the property owner."""
+    serializer_class = ImageJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        return ImageJob.objects.filter(Q(created_by=user) | Q(property__owner=user))
+
+class ResponseCacheStatsView(APIView):
+    """Hit/miss counters of the response cache (roomie_property.caching)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(response_cache_stats())
 
-        serializer = RoomImageSerializer(room_image)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
 class AllCustomUsersView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -270,18 +382,21 @@ class AllCustomUsersView(APIView):
         return Response(serializer.data)
     
 class TenancyRequestViewSet(viewsets.ModelViewSet):
-    queryset = TenancyRequest.objects.all()
+    queryset = TenancyRequest.objects.for_listing()
     serializer_class = TenancyRequestSerializer
     permission_classes = [IsAuthenticated]  # Ensure the user is authenticated
 
     def list(self, request, *args, **kwargs):
         """
-        List all TenancyRequest instances for the authenticated user.
+        List the TenancyRequest instances received by the authenticated user, paginated, newest first; `?status=` filters.
         """
         user = request.user
-        tenancy_requests = TenancyRequest.objects.filter(owner=user)
-        serializer = self.get_serializer(tenancy_requests, many=True)
-        return Response(serializer.data)
+
+        def build_response():
+            return tenancy_request_page(self, request, TenancyRequest.objects.filter(owner=user))
+
+        # 304 while none of the owner's requests or properties changed
+        return conditional_get(request, 'owner', user.pk, build_response, cache_response=True)
 
     def create(self, request, *args, **kwargs):
         """
@@ -350,6 +465,29 @@ class TenancyRequestViewSet(viewsets.ModelViewSet):
             print(f"An error occurred during approval: {e}")
             return Response({"error": "An error occurred while processing the approval."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
+    @action(detail=False, methods=['post'], url_path='bulk-decision')
+    def bulk_decision(self, request):
+        """
+        Approve or reject many received tenancy requests in one transaction.
+
+        Body: {"ids": [1, 2, 3], "decision": "approve" | "reject", "reject_others": false}.
+        Returns the outcome of every id.
+        """
+        serializer = TenancyDecisionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        result = decide_tenancy_requests(
+            request.user,
+            serializer.validated_data['ids'],
+            serializer.validated_data['decision'],
+            reject_others=serializer.validated_data['reject_others'],
+        )
+        return Response({
+            "results": [{"id": pk, "outcome": outcome} for pk, outcome in result['outcomes'].items()],
+            "others_rejected": result['others_rejected'],
+        }, status=status.HTTP_200_OK)
+
     # Custom action to reject a tenancy request
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
@@ -364,25 +502,21 @@ class TenantTenancyRequestViewSet(viewsets.ModelViewSet):
     """
     List all TenancyRequest instances where the authenticated user is the tenant.
     """
-    queryset = TenancyRequest.objects.all()
+    queryset = TenancyRequest.objects.for_listing()
     serializer_class = TenancyRequestSerializer
     permission_classes = [IsAuthenticated]
 
     def list(self, request, *args, **kwargs):
         """
-        List all TenancyRequest instances for the authenticated user where they are the tenant.
+        List the TenancyRequest instances where the authenticated user is the tenant, paginated, newest first.
         """
-       
-        tenancy_requests = TenancyRequest.objects.filter(tenant=request.user)
-        
-        # Optionally filter by status if provided
-        status_param = request.query_params.get('status', None)
-        if status_param:
-            tenancy_requests = tenancy_requests.filter(status=status_param)
 
-        # Serialize and return data
-        serializer = self.get_serializer(tenancy_requests, many=True)
-        return Response(serializer.data)
+        def build_response():
+            # Optionally filter by status if provided
+            return tenancy_request_page(self, request, TenancyRequest.objects.filter(tenant=request.user))
+
+        # 304 while none of the tenant's requests changed
+        return conditional_get(request, 'tenant', request.user.pk, build_response)
 
     def destroy(self, request, *args, **kwargs):
         """
@@ -405,13 +539,14 @@ class TenantTenancyRequestViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'Request not found.'}, status=status.HTTP_404_NOT_FOUND)
         
 class OwnerPaymentView(APIView):
+    """Every owned property in full; the payments screen should use owner-payment-overview/ (cash_flow) instead."""
     permission_classes = [IsAuthenticated]  # Ensure the user is authenticated
 
     def get(self, request):
         # Get the logged-in user
         user = request.user
         # Filter properties by the owner (logged-in user)
-        properties = Property.objects.filter(owner=user)
+        properties = Property.objects.filter(owner=user).with_tenants().with_room_images()
         
         # Serialize the filtered properties
         serializer = PropertySerializer(properties, many=True)
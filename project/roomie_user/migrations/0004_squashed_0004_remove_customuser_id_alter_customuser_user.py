@@ -0,0 +1,44 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Replaces 0004_remove_customuser_id_alter_customuser_user on databases that have not applied it.
+
+    AddressHistory.user points at customuser.id; on SQLite the table rebuilds of the
+    primary key change fail with "foreign key mismatch" while it does, so fresh
+    databases (the test database among them) drop the constraint around the change
+    and put it back on the new key. Databases that applied the original keep it and
+    record this one as applied.
+    """
+
+    replaces = [('roomie_user', '0004_remove_customuser_id_alter_customuser_user')]
+
+    dependencies = [
+        ('roomie_user', '0003_customuser_is_owner'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='addresshistory',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='address_history', to='roomie_user.customuser'),
+        ),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='id',
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='custom_user_profile', serialize=False, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='addresshistory',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='address_history', to='roomie_user.customuser'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from roomie_property.models import Property, PropertyTenantRecords
+from roomie_property.occupancy import close_tenancies
 from django.utils import timezone
 from django.contrib.auth.models import User
 from cloudinary.models import CloudinaryField
@@ -64,11 +65,10 @@ class CustomUser(models.Model):
                 ).update(end_date=timezone.now())  # Close old address history
 
                 # ✅ Close previous tenancy records and set end_date
-                PropertyTenantRecords.objects.filter(
+                close_tenancies(PropertyTenantRecords.objects.filter(
                     tenant=self.user,
                     property=old_address,
-                    end_date__isnull=True
-                ).update(end_date=timezone.now())  # Close old tenancy records
+                ))  # Close old tenancy records (and free their place in the occupancy count)
 
             # ✅ Prevent duplicate active records
             existing_record = PropertyTenantRecords.objects.filter(
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import CustomUser, AddressHistory
 from roomie_property.models import Property
+from roomie_property.serializers import ImageURLField
 
 class AddressHistorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -18,7 +19,7 @@ class CustomUserSerializer(serializers.ModelSerializer):
     last_name = serializers.CharField(max_length=30, allow_blank=True, required=False)
     email = serializers.EmailField(required=False, allow_blank=True)
     has_address = serializers.BooleanField(default=False)
-    profile_image = serializers.ImageField(required=False, allow_null=True)  # Allowing null images
+    profile_image = ImageURLField(required=False, allow_null=True)  # Allowing null images
     property_id = serializers.SerializerMethodField()
     class Meta:
         model = CustomUser
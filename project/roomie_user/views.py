@@ -6,6 +6,7 @@ from .models import CustomUser,AddressHistory
 from .serializers import CustomUserSerializer
 from rest_framework.permissions import IsAuthenticated
 from django.db import IntegrityError
+from roomie_property.images import image_url
 
 class CustomUserProfileView(APIView):
     permission_classes = [IsAuthenticated]
@@ -32,7 +33,7 @@ class CustomUserProfileView(APIView):
             response_data = {
                 "status": "custom_user",  # Indicating it's a custom user
                 "id": custom_user.pk,
-                "profile_image": custom_user.profile_image.url if custom_user.profile_image else None,
+                "profile_image": image_url(custom_user.profile_image),
                 "user_rating_in_app": custom_user.user_rating_in_app,
                 "phone_number": custom_user.phone_number,
                 "first_name": custom_user.first_name,